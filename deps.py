@@ -1,22 +1,30 @@
 from enum import StrEnum
+from pathlib import Path
 import signal
 from threading import Event
 from typing import Any
 from independency import Container, ContainerBuilder
 from independency.container import Dependency
 
-from preprocessing.model import Model
 from preprocessing.epoch_collector import EpochCollector
+from preprocessing.features import FeatureExtractor
 from preprocessing.preprocessor import Preprocessor
 from preprocessing.settings import EpochCollectorSettings, ModelSettings, PreprocessorSettings
+from speller.data_aquisition.acquisition import BackgroundAcquisition, IAcquisition
 from speller.data_aquisition.data_collector import IDataCollector, StubDataCollector, UnicornDataCollector
 from speller.data_aquisition.epoch_getter import EpochGetter, IEpochGetter
+from speller.data_aquisition.epochs_builder import EpochsBuilder, IEpochsBuilder
+from speller.data_aquisition.health import AcquisitionHealth
 from speller.data_aquisition.recorder import IRecorder, Recorder
+from speller.data_aquisition.replay_data_collector import ReplayDataCollector
+from speller.data_aquisition.synthetic_data_collector import SyntheticDataCollector, SyntheticRecordsWriter
 from speller.monitoring.monitoring_collector import IMonitoringCollector, MonitoringCollector
 from speller.monitoring.visualizer import MonitoringVisualizer
 from speller.prediction.chat_gpt_client import ChatGPTClient
 from speller.prediction.chat_gpt_predictor import ChatGptPredictor, IChatGptPredictor
 from speller.classification.classifier import Classifier, IClassifier, StubClassifier
+from speller.classification.epoch_gate import EpochGate, IEpochGate
+from speller.classification.processing_worker import ProcessingWorker, WorkerClassifier, WorkerEpochsBuilder
 from speller.prediction.dictionary import Dictionary, IDictionary
 from speller.prediction.suggestions_getter import ISuggestionsGetter, SuggestionsGetter
 from speller.prediction.t9_predictor import IT9Predictor, T9Predictor
@@ -26,7 +34,7 @@ from speller.session.flashing_strategy import IFlashingStrategy, SquareSingleCha
 from speller.session.sequence_handler import ISequenceHandler, SequenceHandler
 from speller.session.speller_runner import SpellerRunner
 from speller.session.state_manager import IStateManager, StateManager
-from speller.settings import ChatGPTSettings, DictionarySettings, ExperimentSettings, FilesSettings, LoggingSettings, MonitoringSettings, StateManagerSettings, StrategySettings, StubDataCollectorSettings, UnicornDataCollectorSettings, ViewSettings
+from speller.settings import AcquisitionSettings, ChatGPTSettings, DictionarySettings, DynamicStoppingSettings, EpochGateSettings, ExperimentSettings, FilesSettings, LoggingSettings, MonitoringSettings, RecorderSettings, ReplayDataCollectorSettings, StateManagerSettings, StrategySettings, StubDataCollectorSettings, SyntheticDataCollectorSettings, UnicornDataCollectorSettings, ViewSettings, WorkerSettings
 from speller.view.speller_view import SpellerView
 
 
@@ -51,8 +59,40 @@ def _get_files_settings_kwargs(clf_name: str | None, clf_comment: str | None) ->
         kwargs['clf_comment'] = clf_comment
     return kwargs
 
+def _get_replay_settings_kwargs(file: Path, speed: float | None) -> dict[str, Any]:
+    kwargs: dict[str, Any] = {'file': file}
+    if speed is not None:
+        kwargs['speed'] = speed
+    return kwargs
+
+def _register_data_collector(
+    builder: ContainerBuilder, stub: bool, file: Path | None, speed: float | None, synthetic: bool = False
+) -> None:
+    builder.singleton(AcquisitionHealth, AcquisitionHealth)
+
+    if synthetic:
+        builder.singleton(SyntheticDataCollectorSettings, lambda: SyntheticDataCollectorSettings())
+        builder.singleton(IDataCollector, SyntheticDataCollector)
+    elif file:
+        builder.singleton(ReplayDataCollectorSettings, lambda: ReplayDataCollectorSettings(**_get_replay_settings_kwargs(file, speed)))
+        builder.singleton(IDataCollector, ReplayDataCollector)
+    elif stub:
+        builder.singleton(StubDataCollectorSettings, lambda: StubDataCollectorSettings())
+        builder.singleton(IDataCollector, StubDataCollector)
+    else:
+        builder.singleton(UnicornDataCollectorSettings, lambda: UnicornDataCollectorSettings())
+        builder.singleton(IDataCollector, UnicornDataCollector)
+
 
-def get_speller_container(stub: bool, clf_name: str | None, clf_comment: str | None) -> Container:
+def get_speller_container(
+    stub: bool,
+    clf_name: str | None,
+    clf_comment: str | None,
+    file: Path | None = None,
+    speed: float | None = None,
+    synthetic: bool = False,
+    worker: bool = False,
+) -> Container:
     builder = ContainerBuilder()
 
     builder.singleton(SpellerContainerKey.SHUTDOWN_EVENT.value, register_shutdown_event)
@@ -75,18 +115,24 @@ def get_speller_container(stub: bool, clf_name: str | None, clf_comment: str | N
     builder.singleton(EpochCollectorSettings, lambda: EpochCollectorSettings())
     builder.singleton(ModelSettings, lambda: ModelSettings())
 
+    builder.singleton(RecorderSettings, lambda: RecorderSettings())
     builder.singleton(IRecorder, Recorder)
 
-    if stub:
-        builder.singleton(StubDataCollectorSettings, lambda: StubDataCollectorSettings())
-        builder.singleton(IDataCollector, StubDataCollector)
-    else:
-        builder.singleton(UnicornDataCollectorSettings, lambda: UnicornDataCollectorSettings())
-        builder.singleton(IDataCollector, UnicornDataCollector)
+    _register_data_collector(builder, stub, file, speed, synthetic)
 
+    builder.singleton(AcquisitionSettings, lambda: AcquisitionSettings())
+    builder.singleton(IAcquisition, BackgroundAcquisition)
 
-    builder.singleton(Model, Model)
-    builder.singleton(IClassifier, Classifier)
+    if worker:
+        builder.singleton(WorkerSettings, lambda: WorkerSettings())
+        builder.singleton(ProcessingWorker, ProcessingWorker)
+        builder.singleton(IEpochsBuilder, WorkerEpochsBuilder)
+        builder.singleton(IClassifier, WorkerClassifier)
+    else:
+        builder.singleton(Preprocessor, Preprocessor)
+        builder.singleton(FeatureExtractor, FeatureExtractor)
+        builder.singleton(IEpochsBuilder, EpochsBuilder)
+        builder.singleton(IClassifier, Classifier)
 
     builder.singleton(IDictionary, Dictionary)
     builder.singleton(IT9Predictor, T9Predictor)
@@ -94,10 +140,11 @@ def get_speller_container(stub: bool, clf_name: str | None, clf_comment: str | N
     builder.singleton(ChatGPTClient, ChatGPTClient)
     builder.singleton(IChatGptPredictor, ChatGptPredictor)
 
-    builder.singleton(Preprocessor, Preprocessor)
-    builder.singleton(EpochCollector, EpochCollector)
     builder.singleton(IEpochGetter, EpochGetter)
+    builder.singleton(EpochGateSettings, lambda: EpochGateSettings())
+    builder.singleton(IEpochGate, EpochGate)
     builder.singleton(IFlashingStrategy, SquareSingleCharacterFlashingStrategy)
+    builder.singleton(DynamicStoppingSettings, lambda: DynamicStoppingSettings())
     builder.singleton(ISuggestionsGetter, SuggestionsGetter)
 
     builder.singleton(IStateManager, StateManager, shutdown_event=Dependency(SpellerContainerKey.SHUTDOWN_EVENT))
@@ -111,20 +158,12 @@ def get_speller_container(stub: bool, clf_name: str | None, clf_comment: str | N
     return builder.build()
 
 
-def get_monitoring_container(stub: bool = True, file: bool = False) -> Container:
+def get_monitoring_container(stub: bool = True, file: Path | None = None, speed: float | None = None) -> Container:
     builder = ContainerBuilder()
 
     builder.singleton(MonitoringSettings, lambda: MonitoringSettings())
 
-    if stub:
-        if file:
-            raise NotImplemented('No stub file data collector!')
-        else:
-            builder.singleton(StubDataCollectorSettings, lambda: StubDataCollectorSettings())
-            builder.singleton(IDataCollector, StubDataCollector)
-    else:
-        builder.singleton(UnicornDataCollectorSettings, lambda: UnicornDataCollectorSettings())
-        builder.singleton(IDataCollector, UnicornDataCollector)
+    _register_data_collector(builder, stub, file, speed)
 
     builder.singleton(IMonitoringCollector, MonitoringCollector)
     builder.singleton(MonitoringVisualizer, MonitoringVisualizer)
@@ -133,6 +172,8 @@ def get_monitoring_container(stub: bool = True, file: bool = False) -> Container
 
 
 def get_model_container() -> Container:
+    from preprocessing.model import Model  # sklearn, the speller itself runs without it
+
     builder = ContainerBuilder()
 
     builder.singleton(FilesSettings, lambda: FilesSettings())
@@ -142,6 +183,19 @@ def get_model_container() -> Container:
 
     builder.singleton(Preprocessor, Preprocessor)
     builder.singleton(EpochCollector, EpochCollector)
+    builder.singleton(FeatureExtractor, FeatureExtractor)
     builder.singleton(Model, Model)
 
     return builder.build()
+
+
+def get_synthetic_container() -> Container:
+    builder = ContainerBuilder()
+
+    builder.singleton(FilesSettings, lambda: FilesSettings())
+    builder.singleton(StrategySettings, lambda: StrategySettings())
+    builder.singleton(SyntheticDataCollectorSettings, lambda: SyntheticDataCollectorSettings())
+
+    builder.singleton(SyntheticRecordsWriter, SyntheticRecordsWriter)
+
+    return builder.build()
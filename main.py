@@ -1,18 +1,28 @@
 import glob
+from pathlib import Path
 import click
+import numpy as np
 
 import logging
 from threading import Thread
 
-from deps import get_monitoring_container, get_model_container, get_speller_container
+from deps import get_monitoring_container, get_model_container, get_speller_container, get_synthetic_container
 
-from preprocessing.model import Model
+from preprocessing.cache import ArrayCache
+from preprocessing.catalog import SessionCatalog
 from preprocessing.epoch_collector import EpochCollector
-from preprocessing.files import get_model_filename, get_preprocessed_files, get_raw_files
+from preprocessing.epoch_store import EpochStore
+from preprocessing.features import FeatureExtractor
+from preprocessing.files import find_model_file, get_model_filename, get_preprocessed_files, get_raw_files, get_sequences_files
+from preprocessing.model_registry import ModelRegistry
 from preprocessing.preprocessor import Preprocessor
+from preprocessing.settings import EpochCollectorSettings, PreprocessorSettings
+from speller.classification.processing_worker import ProcessingWorker
+from speller.data_aquisition.record_file import RECORD_SUFFIX, RecordReader, SequencesReader, convert_csv_record
+from speller.data_aquisition.synthetic_data_collector import SyntheticRecordsWriter
 from speller.monitoring.visualizer import MonitoringVisualizer
 from speller.session.speller_runner import SpellerRunner
-from speller.settings import FilesSettings, LoggingSettings
+from speller.settings import FilesSettings, LoggingSettings, StrategySettings, ms_to_samples
 from speller.view.speller_view import SpellerView
 
 
@@ -29,10 +39,22 @@ def speller_group():
 @click.option("--stub", is_flag=True, show_default=True, default=False, help="Use stub dependencies")
 @click.option("--clf-name", required=False)
 @click.option("--clf-comment", required=False)
-def speller(stub: bool, clf_name: str | None, clf_comment: str | None) -> None:
+@click.option("--file", required=False, type=click.Path(exists=True, path_type=Path), help="Replay recorded data from file")
+@click.option("--speed", required=False, type=float, help="Replay speed, 0 for as fast as possible")
+@click.option("--synthetic", is_flag=True, show_default=True, default=False, help="Use synthetic P300 data")
+@click.option("--worker", is_flag=True, show_default=True, default=False, help="Preprocess and classify in a separate process")
+def speller(
+    stub: bool,
+    clf_name: str | None,
+    clf_comment: str | None,
+    file: Path | None,
+    speed: float | None,
+    synthetic: bool,
+    worker: bool,
+) -> None:
     # import sys
     # sys.setswitchinterval(0.001)
-    container = get_speller_container(stub, clf_name, clf_comment)
+    container = get_speller_container(stub, clf_name, clf_comment, file, speed, synthetic, worker)
 
     speller_runner = container.resolve(SpellerRunner)
     speller_view = container.resolve(SpellerView)
@@ -43,6 +65,8 @@ def speller(stub: bool, clf_name: str | None, clf_comment: str | None) -> None:
     speller_view.run()
 
     speller_runner_thread.join()
+    if worker:
+        container.resolve(ProcessingWorker).stop()  # the spawned process and its shared memory outlive the runner otherwise
 
 
 @click.group()
@@ -52,9 +76,10 @@ def monitoring_group():
 
 @monitoring_group.command()
 @click.option("--stub", is_flag=True, show_default=True, default=False, help="Use stub dependencies")
-@click.option("--file", is_flag=True, show_default=True, default=False, help="Read stub data from file")
-def monitoring(stub: bool, file: bool) -> None:
-    container = get_monitoring_container(stub, file)
+@click.option("--file", required=False, type=click.Path(exists=True, path_type=Path), help="Replay recorded data from file")
+@click.option("--speed", required=False, type=float, help="Replay speed, 0 for as fast as possible")
+def monitoring(stub: bool, file: Path | None, speed: float | None) -> None:
+    container = get_monitoring_container(stub, file, speed)
     monitoring = container.resolve(MonitoringVisualizer)
     monitoring.run()
 
@@ -66,8 +91,8 @@ def preprocessor_group():
 
 @preprocessor_group.command()
 @click.option("--name", required=True, help="Filter by name")
-@click.option("--day", required=True, help="Filter by name")
-@click.option("--iter", required=True, help="Filter by name")
+@click.option("--day", required=True, type=int, help="Filter by name")
+@click.option("--iter", required=True, type=int, help="Filter by name")
 @click.option("--no-save", is_flag=True, show_default=True, default=False)
 def preprocessor(name: str, day: int, iter: int, no_save: bool = False) -> None:
     container = get_model_container()
@@ -77,13 +102,33 @@ def preprocessor(name: str, day: int, iter: int, no_save: bool = False) -> None:
 
     files_settings = container.resolve(FilesSettings)
 
-    file =  get_raw_files(files_settings.records_dir, name, day, iter)[0]
+    files = get_raw_files(files_settings, name, day, iter)
+    if not files:
+        raise click.UsageError(f"No recording for name={name} day={day} iter={iter}, run catalog --scan if it was added since")
+    file = files[0]
 
     raw = preprocessor.preprocess(file, save=not no_save)
     epochs = epoch_collector.collect(raw)
     epoch_collector.plot_comparison(epochs)
 
 
+@click.group()
+def compare_filters_group():
+    pass
+
+
+@compare_filters_group.command()
+@click.option("--name", required=False, help="Filter by name")
+@click.option("--day", required=False, type=int, help="Filter by day")
+@click.option("--method", required=True, type=click.Choice(['causal', 'iir', 'fir']), help="Filter compared with MNE")
+def compare_filters(name: str | None, day: int | None, method: str) -> None:
+    files_settings = FilesSettings()
+    preprocessor = Preprocessor(PreprocessorSettings(filter_method=method), files_settings)
+
+    for file in get_raw_files(files_settings, name, day):
+        preprocessor.compare_filters(file)
+
+
 @click.group()
 def epoch_collector_group():
     pass
@@ -91,10 +136,11 @@ def epoch_collector_group():
 
 @epoch_collector_group.command() 
 @click.option("--name", required=False, help="Filter by name")
-@click.option("--day", required=False, help="Filter by name")
+@click.option("--day", required=False, type=int, help="Filter by name")
 @click.option("--raw", is_flag=True, show_default=True, default=False, help="Use raw files without annotations")
 @click.option("--view", required=False, default=10, help="View epochs examples")
-def epoch_collector(name: str | None, day: int | None, raw: bool, view: int) -> None:
+@click.option("--jobs", required=False, default=1, show_default=True, type=int, help="Files processed in parallel, 1 for serial")
+def epoch_collector(name: str | None, day: int | None, raw: bool, view: int, jobs: int) -> None:
     container = get_model_container()
 
     preprocessor = container.resolve(Preprocessor)
@@ -102,11 +148,9 @@ def epoch_collector(name: str | None, day: int | None, raw: bool, view: int) ->
     files_settings = container.resolve(FilesSettings)
 
     if raw:
-        files = [preprocessor.preprocess(file, silent=True) for file in get_raw_files(files_settings.records_dir, name, day)]
+        epochs = epoch_collector.collect_many(get_raw_files(files_settings, name, day), preprocessor, jobs=jobs)
     else:
-        files = get_preprocessed_files(files_settings.records_dir, name, day)
-
-    epochs = epoch_collector.collect_many(files)
+        epochs = epoch_collector.collect_many(get_preprocessed_files(files_settings, name, day), jobs=jobs)
     if view:
         epochs[:view].plot(events=True, event_color={2: "g", 7: "r"}, block=True)
 
@@ -120,12 +164,30 @@ def fit_model_group():
 
 @fit_model_group.command()
 @click.option("--name", required=False, help="Filter by name")
-@click.option("--day", required=False, help="Filter by name")
+@click.option("--day", required=False, type=int, help="Filter by name")
 @click.option("--raw", is_flag=True, show_default=True, default=False, help="Use raw files without annotations")
 @click.option("--stats", is_flag=True, show_default=True, default=False)
 @click.option("--save", is_flag=True, show_default=True, default=False)
 @click.option("--comment", required=False, help="Comment for model filename")
-def fit_model(raw: bool, name: str | None, stats: bool, save: bool, comment: str | None, day: int | None) -> None:
+@click.option("--jobs", required=False, default=1, show_default=True, type=int, help="Files processed in parallel, 1 for serial")
+@click.option("--store", is_flag=True, show_default=True, default=False, help="Use epochs from the epoch store")
+@click.option("--online", is_flag=True, show_default=True, default=False, help="Use features saved by online sessions")
+def fit_model(
+    raw: bool,
+    name: str | None,
+    stats: bool,
+    save: bool,
+    comment: str | None,
+    day: int | None,
+    jobs: int,
+    store: bool,
+    online: bool,
+) -> None:
+    if stats and save:
+        raise click.UsageError("--stats only cross-validates, there is no fitted model to --save")
+
+    from preprocessing.model import Model  # sklearn, the speller itself runs without it
+
     container = get_model_container()
 
     preprocessor = container.resolve(Preprocessor)
@@ -133,17 +195,234 @@ def fit_model(raw: bool, name: str | None, stats: bool, save: bool, comment: str
     model = container.resolve(Model)
     files_settings = container.resolve(FilesSettings)
 
-    if raw:
-        files = [preprocessor.preprocess(file, silent=True) for file in get_raw_files(files_settings.records_dir, name, day)]
+    if online:
+        sessions = get_sequences_files(files_settings, name, day)
+        epochs = model.load_sequences(sessions)
+    elif store:
+        epoch_store = EpochStore(files_settings)
+        epochs = epoch_store.select(name, day)
+        selected = set(epochs.meta['session'].tolist())
+        sessions = [session['path'] for session in epoch_store.get_sessions() if session['id'] in selected]
+    elif raw:
+        sessions = get_raw_files(files_settings, name, day)
+        epochs = epoch_collector.collect_many(sessions, preprocessor, jobs=jobs)
     else:
-        files = get_preprocessed_files(files_settings.records_dir, name, day)
-    
-    epochs = epoch_collector.collect_many(files)
+        sessions = get_preprocessed_files(files_settings, name, day)
+        epochs = epoch_collector.collect_many(sessions, jobs=jobs)
     clf_model = model.fit(epochs, stats=stats, split=not stats)
     if save:
-        filename = get_model_filename(files_settings, name, comment)
-        model.save(clf_model, filename)
-        print(f'ClassifierModel saved as {filename}')
+        try:
+            linear_model = model.export(clf_model)
+        except ValueError as e:
+            filename = get_model_filename(files_settings, name, comment)
+            model.save(clf_model, filename)
+            print(f'Model is not linear ({e}), ClassifierModel saved as {filename}')
+            return
+
+        manifest = model.get_manifest(clf_model, sessions)
+        manifest['settings'].update(
+            epoch_collector=container.resolve(EpochCollectorSettings).model_dump(),
+            preprocessor=container.resolve(PreprocessorSettings).model_dump(),
+        )
+        path = ModelRegistry(files_settings).register(linear_model, name, comment, manifest)
+        print(f'Model registered as {path}')
+
+
+@click.group()
+def compile_model_group():
+    pass
+
+
+@compile_model_group.command()
+@click.option("--clf-name", required=False)
+@click.option("--clf-comment", required=False)
+def compile_model(clf_name: str | None, clf_comment: str | None) -> None:
+    from preprocessing.model import Model
+
+    container = get_model_container()
+
+    model = container.resolve(Model)
+    files_settings = container.resolve(FilesSettings)
+    files_settings = FilesSettings(clf_name=clf_name or files_settings.clf_name, clf_comment=clf_comment or files_settings.clf_comment)
+
+    filename = find_model_file(files_settings)
+    print(f'Compiled model saved as {model.compile(model.load(filename), filename)}')
+
+
+@click.group()
+def store_epochs_group():
+    pass
+
+
+@store_epochs_group.command()
+@click.option("--name", required=False, help="Filter by name")
+@click.option("--day", required=False, type=int, help="Filter by day")
+@click.option("--raw", is_flag=True, show_default=True, default=False, help="Use raw files without annotations")
+@click.option("--jobs", required=False, default=1, show_default=True, type=int, help="Files processed in parallel, 1 for serial")
+def store_epochs(name: str | None, day: int | None, raw: bool, jobs: int) -> None:
+    container = get_model_container()
+
+    preprocessor = container.resolve(Preprocessor)
+    epoch_collector = container.resolve(EpochCollector)
+    files_settings = container.resolve(FilesSettings)
+
+    catalog = SessionCatalog(files_settings)
+    store = EpochStore(files_settings)
+
+    rows = catalog.get_recordings(name, day) if raw else catalog.get_preprocessed(name, day)
+    rows = [row for row in rows if not store.has_session(row['path'])]
+    all_epochs = epoch_collector.iter_collect([row['path'] for row in rows], preprocessor if raw else None, jobs=jobs)
+    for row, epochs in zip(rows, all_epochs):
+        store.append(epochs, row['path'], row['subject'], row['day'], row['iteration'])
+        print(f"Stored {len(epochs)} epochs of {row['path']}")
+
+
+@click.group()
+def sequences_group():
+    pass
+
+
+@sequences_group.command()
+@click.option("--name", required=False, help="Filter by name")
+@click.option("--day", required=False, type=int, help="Filter by day")
+@click.option("--drift", is_flag=True, show_default=True, default=False, help="Compare online features with features recomputed from the record")
+def sequences(name: str | None, day: int | None, drift: bool) -> None:
+    container = get_model_container()
+
+    preprocessor = container.resolve(Preprocessor)
+    feature_extractor = container.resolve(FeatureExtractor)
+    files_settings = container.resolve(FilesSettings)
+    strategy_settings = StrategySettings()
+
+    for file in get_sequences_files(files_settings, name, day):
+        reader = SequencesReader(Path(file))
+        if not reader.sequences_count:
+            print(f"{file}: no complete sequences")
+            continue
+        kept = reader.weights > 0
+        scores = np.asarray(reader.scores)
+        print(
+            f"{file}: {reader.sequences_count} sequences, {len(reader.items)} epochs, {np.sum(~kept)} rejected, "
+            f"mean score target {scores[kept & (reader.labels == 1)].mean():.3f} "
+            f"non-target {scores[kept & (reader.labels == 0)].mean():.3f}"
+        )
+        if not drift:
+            continue
+
+        record = RecordReader(Path(file).with_suffix(RECORD_SUFFIX))
+        if not np.array_equal(record.events['item'][:len(reader.items)], reader.items):
+            print("  record events do not match the online epochs, skipped")
+            continue
+        samples = preprocessor.preprocess_samples(record.read())
+        starts = record.events['index'][:len(reader.items)] - ms_to_samples(strategy_settings.epoch_baseline_ms)
+        offline = feature_extractor.extract(samples, starts, strategy_settings.epoch_size_samples)
+        error = reader.features - offline
+        print(f"  online vs offline features: relative RMS {np.sqrt(np.mean(error ** 2) / np.mean(offline ** 2)):.2%}")
+
+
+@click.group()
+def models_group():
+    pass
+
+
+@models_group.group()
+def models() -> None:
+    pass
+
+
+@models.command('list')
+@click.option("--name", required=False, help="Filter by name")
+def list_models(name: str | None) -> None:
+    for manifest in ModelRegistry(FilesSettings()).get_models(name):
+        metrics = ' '.join(f"{key}={value:.3f}" for key, value in manifest['metrics'].items() if isinstance(value, float))
+        print(
+            f"{'*' if manifest['promoted'] else ' '} {manifest['subject']} v{manifest['version']} {manifest['created_at']} "
+            f"comment={manifest['comment']} sessions={len(manifest['sessions'])} {metrics}"
+        )
+
+
+@models.command()
+@click.argument("name")
+@click.argument("version", type=int)
+def promote(name: str, version: int) -> None:
+    print(f"Promoted {ModelRegistry(FilesSettings()).promote(name, version)}")
+
+
+@click.group()
+def synthesize_group():
+    pass
+
+
+@synthesize_group.command()
+@click.option("--name", required=False, default="synthetic", show_default=True, help="Subject name")
+@click.option("--day", required=False, default=1, show_default=True, type=int)
+@click.option("--sessions", required=False, default=10, show_default=True, type=int, help="Number of records")
+@click.option("--reps", required=False, default=10, show_default=True, type=int, help="Repetitions per record")
+def synthesize(name: str, day: int, sessions: int, reps: int) -> None:
+    container = get_synthetic_container()
+    writer = container.resolve(SyntheticRecordsWriter)
+
+    filenames = writer.write(name, day, sessions, reps)
+    print(f'Written {len(filenames)} synthetic records')
+
+
+@click.group()
+def convert_records_group():
+    pass
+
+
+@convert_records_group.command()
+@click.option("--name", required=False, help="Filter by name")
+@click.option("--day", required=False, type=int, help="Filter by day")
+def convert_records(name: str | None, day: int | None) -> None:
+    files_settings = FilesSettings()
+
+    catalog = SessionCatalog(files_settings)
+
+    files = [file for file in get_raw_files(files_settings, name, day) if file.endswith('.csv')]
+    for file in files:
+        converted = convert_csv_record(Path(file))
+        catalog.add_recording(converted)
+        catalog.remove_recording(Path(file))
+        print(f'Converted {converted}')
+
+
+@click.group()
+def catalog_group():
+    pass
+
+
+@catalog_group.command()
+@click.option("--scan", is_flag=True, show_default=True, default=False, help="Index files not yet in the catalog")
+@click.option("--name", required=False, help="Filter by name")
+@click.option("--day", required=False, type=int, help="Filter by day")
+def catalog(scan: bool, name: str | None, day: int | None) -> None:
+    session_catalog = SessionCatalog(FilesSettings())
+
+    if scan:
+        print(f'Indexed {session_catalog.scan()} files')
+
+    for row in session_catalog.get_recordings(name, day):
+        print(f"{row['subject']}\tday={row['day']}\titer={row['iteration']}\ttarget={row['target']}\tsamples={row['samples_count']}\t{row['path']}")
+
+
+@click.group()
+def cache_group():
+    pass
+
+
+@cache_group.command()
+@click.argument("action", type=click.Choice(['stats', 'clear']))
+@click.option("--stage", required=False, type=click.Choice(['preprocess', 'epochs', 'features']), help="Clear only one stage")
+def cache(action: str, stage: str | None) -> None:
+    array_cache = ArrayCache(FilesSettings())
+
+    if action == 'clear':
+        print(f'Removed {array_cache.clear(stage)} cache entries')
+        return
+
+    for stage_name, stats in sorted(array_cache.stats().items()):
+        print(f"{stage_name}: {stats['entries']} entries, {stats['size'] / 2**20:.1f} MB")
 
 
 @click.group()
@@ -166,8 +445,17 @@ cli = click.CommandCollection(
         speller_group,
         monitoring_group,
         preprocessor_group,
+        compare_filters_group,
         epoch_collector_group,
         fit_model_group,
+        compile_model_group,
+        models_group,
+        store_epochs_group,
+        sequences_group,
+        synthesize_group,
+        convert_records_group,
+        catalog_group,
+        cache_group,
         statistical_emulator_group,
     ]
 )
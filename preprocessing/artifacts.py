@@ -0,0 +1,76 @@
+from typing import Any
+
+import mne
+import numpy as np
+
+from preprocessing.settings import PreprocessorSettings
+
+
+_UV_TO_VOLTS_FACTOR = 1e-6
+
+
+class ArtifactAnnotator:
+    ARTIFACT_KINDS = ('amplitude', 'flatline', 'step', 'hf_burst')
+
+    def __init__(self, settings: PreprocessorSettings):
+        self._settings = settings
+
+    def _get_windows(self, data: np.ndarray, sfreq: float) -> np.ndarray:
+        # data: (number_of_channels, number_of_samples) -> (number_of_channels, number_of_windows, window) view
+        window = int(self._settings.artifact_window_ms * sfreq / 1000)
+        step = int(self._settings.artifact_step_ms * sfreq / 1000)
+        if data.shape[1] < window:
+            return np.empty((data.shape[0], 0, window), dtype=data.dtype)  # a record shorter than a window has none
+        return np.lib.stride_tricks.sliding_window_view(data, window, axis=1)[:, ::step]
+
+    def _find_bad_windows(self, filtered: np.ndarray, unfiltered: np.ndarray, sfreq: float) -> dict[str, np.ndarray]:
+        # a window is bad if any channel is, drifts are gone from filtered data, steps and bursts only exist before filtering
+        filtered_windows = self._get_windows(filtered, sfreq)
+        unfiltered_windows = self._get_windows(unfiltered, sfreq)
+        differences = self._get_windows(np.diff(unfiltered, axis=1, prepend=unfiltered[:, :1]), sfreq)
+        if not differences.shape[1]:
+            return {kind: np.zeros(differences.shape[:2], dtype=bool) for kind in self.ARTIFACT_KINDS}
+
+        hf_rms = np.sqrt(np.mean(differences ** 2, axis=-1))  # first difference is a cheap high-pass
+        hf_ratio = hf_rms / np.maximum(np.median(hf_rms, axis=1, keepdims=True), np.finfo(float).tiny)
+
+        return {
+            'amplitude': np.ptp(filtered_windows, axis=-1) > self._settings.artifact_max_peak_to_peak_uv * _UV_TO_VOLTS_FACTOR,
+            'flatline': np.ptp(unfiltered_windows, axis=-1) < self._settings.artifact_min_peak_to_peak_uv * _UV_TO_VOLTS_FACTOR,
+            'step': np.abs(differences).max(axis=-1) > self._settings.artifact_max_step_uv * _UV_TO_VOLTS_FACTOR,
+            'hf_burst': hf_ratio > self._settings.artifact_max_hf_ratio,
+        }
+
+    def _get_bad_mask(self, bad_windows: np.ndarray, number_of_samples: int, sfreq: float) -> np.ndarray:
+        window = int(self._settings.artifact_window_ms * sfreq / 1000)
+        step = int(self._settings.artifact_step_ms * sfreq / 1000)
+        starts = np.flatnonzero(bad_windows.any(axis=0)) * step
+
+        coverage = np.zeros(number_of_samples + 1, dtype=np.int64)
+        np.add.at(coverage, starts, 1)
+        np.add.at(coverage, starts + window, -1)
+        return np.cumsum(coverage[:-1]) > 0
+
+    @staticmethod
+    def _get_spans(mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    def annotate(self, raw: mne.io.BaseRaw, unfiltered: np.ndarray) -> dict[str, Any]:
+        # raw: filtered, unfiltered: (number_of_channels, number_of_samples) EEG data of raw before filtering, in volts
+        sfreq = raw.info['sfreq']
+        filtered = raw.get_data(picks='eeg')
+        bad_windows = self._find_bad_windows(filtered, unfiltered, sfreq)
+
+        report: dict[str, Any] = {'duration_s': raw.n_times / sfreq}
+        rejected = np.zeros(raw.n_times, dtype=bool)
+        for kind in self.ARTIFACT_KINDS:
+            mask = self._get_bad_mask(bad_windows[kind], raw.n_times, sfreq)
+            starts, stops = self._get_spans(mask)
+            raw.annotations.append(raw.first_time + raw.times[starts], (stops - starts) / sfreq, f'bad_{kind}')
+            report[f'{kind}_s'] = mask.sum() / sfreq
+            rejected |= mask
+
+        report['rejected_s'] = rejected.sum() / sfreq
+        report['rejected_ratio'] = report['rejected_s'] / report['duration_s'] if raw.n_times else 0.
+        return report
@@ -0,0 +1,103 @@
+from hashlib import sha256
+import os
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from pydantic import BaseModel
+
+from preprocessing.catalog import get_checksum
+from speller.settings import FilesSettings
+
+
+class ArrayCache:
+    _SUFFIX = '.npz'
+
+    def __init__(self, files_settings: FilesSettings):
+        self._files_settings = files_settings
+        self._directory = files_settings.cache_dir
+        self._file_checksums: dict[tuple[str, int, int], str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._files_settings.cache_max_size_mb > 0
+
+    def get_file_checksum(self, path: str | Path) -> str:
+        stat = os.stat(path)
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        if key not in self._file_checksums:
+            self._file_checksums[key] = get_checksum(Path(path))
+        return self._file_checksums[key]
+
+    @staticmethod
+    def get_key(stage: str, *parts: Any) -> str:
+        digest = sha256()
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                part = np.ascontiguousarray(part)
+                digest.update(f'{part.dtype.str}{part.shape}'.encode())
+                digest.update(part.view(np.uint8).reshape(-1))
+            elif isinstance(part, BaseModel):
+                digest.update(part.model_dump_json().encode())
+            else:
+                digest.update(repr(part).encode())
+            digest.update(b'\0')
+        return f'{stage}-{digest.hexdigest()[:32]}'
+
+    def _get_path(self, key: str) -> Path:
+        return self._directory / f'{key}{self._SUFFIX}'
+
+    def get(self, key: str) -> dict[str, np.ndarray] | None:
+        if not self.enabled:
+            return None
+        path = self._get_path(key)
+        try:
+            with np.load(path) as data:
+                arrays = {name: data[name] for name in data.files}
+        except (FileNotFoundError, ValueError, OSError):
+            self.misses += 1
+            return None
+
+        os.utime(path)  # the modification time orders entries for the LRU eviction
+        self.hits += 1
+        return arrays
+
+    def put(self, key: str, **arrays: np.ndarray) -> None:
+        if not self.enabled:
+            return
+        self._directory.mkdir(parents=True, exist_ok=True)
+        path = self._get_path(key)
+        tmp_path = path.with_name(f'{path.stem}.tmp{self._SUFFIX}')  # readers never see a partial entry
+        np.savez(tmp_path, **arrays)
+        tmp_path.replace(path)
+        self._evict()
+
+    def _get_entries(self) -> list[Path]:
+        if not self._directory.exists():
+            return []
+        return [path for path in self._directory.glob(f'*{self._SUFFIX}') if '.tmp' not in path.name]
+
+    def _evict(self) -> None:
+        entries = sorted(self._get_entries(), key=lambda path: path.stat().st_mtime)
+        size = sum(path.stat().st_size for path in entries)
+        max_size = self._files_settings.cache_max_size_mb * 2**20
+        while entries and size > max_size:
+            path = entries.pop(0)
+            size -= path.stat().st_size
+            path.unlink(missing_ok=True)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        stats: dict[str, dict[str, int]] = {}
+        for path in self._get_entries():
+            stage = stats.setdefault(path.name.split('-')[0], {'entries': 0, 'size': 0})
+            stage['entries'] += 1
+            stage['size'] += path.stat().st_size
+        return stats
+
+    def clear(self, stage: str | None = None) -> int:
+        entries = [path for path in self._get_entries() if stage is None or path.name.startswith(f'{stage}-')]
+        for path in entries:
+            path.unlink(missing_ok=True)
+        return len(entries)
@@ -0,0 +1,222 @@
+from contextlib import closing
+from datetime import datetime
+import hashlib
+from pathlib import Path
+import re
+import sqlite3
+from typing import Any
+
+import pandas as pd
+
+from speller.data_aquisition.record_file import RECORD_SUFFIX, RecordReader, parse_record_meta
+from speller.settings import FilesSettings
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS recordings (
+    path TEXT PRIMARY KEY,
+    subject TEXT,
+    day INTEGER,
+    iteration INTEGER,
+    comment TEXT,
+    target INTEGER,
+    flash_ms INTEGER,
+    break_ms INTEGER,
+    reps INTEGER,
+    cycles INTEGER,
+    samples_count INTEGER,
+    events_count INTEGER,
+    size INTEGER,
+    checksum TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS recordings_subject ON recordings (subject, day, iteration);
+
+CREATE TABLE IF NOT EXISTS preprocessed (
+    path TEXT PRIMARY KEY,
+    recording_path TEXT,
+    subject TEXT,
+    day INTEGER,
+    iteration INTEGER,
+    target INTEGER,
+    size INTEGER,
+    checksum TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS preprocessed_subject ON preprocessed (subject, day, iteration);
+
+CREATE TABLE IF NOT EXISTS models (
+    path TEXT PRIMARY KEY,
+    subject TEXT,
+    comment TEXT,
+    size INTEGER,
+    checksum TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS models_subject ON models (subject, comment, created_at);
+"""
+
+_CHECKSUM_CHUNK_SIZE = 1 << 20
+_PREPROCESSED_INFIX = '__[PREPROCESSED]__'
+
+
+def get_checksum(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(_CHECKSUM_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_preprocessed_path(recording_path: Path, time_str: str) -> Path:
+    directory = Path(*('preprocessed' if part == 'raw' else part for part in recording_path.parent.parts))
+    return directory / f'{recording_path.name}{_PREPROCESSED_INFIX}{time_str}__eeg.fif'
+
+
+def get_recording_path(preprocessed_path: Path) -> Path:
+    directory = Path(*('raw' if part == 'preprocessed' else part for part in preprocessed_path.parent.parts))
+    return directory / preprocessed_path.name.split(_PREPROCESSED_INFIX)[0]
+
+
+class SessionCatalog:
+    def __init__(self, files_settings: FilesSettings):
+        self._files_settings = files_settings
+        self._filename = files_settings.records_dir / files_settings.catalog_filename
+
+    def _connect(self) -> sqlite3.Connection:
+        self._filename.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self._filename, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def _execute(self, query: str, parameters: dict[str, Any]) -> list[sqlite3.Row]:
+        with closing(self._connect()) as connection, connection:  # commits on success
+            return connection.execute(query, parameters).fetchall()
+
+    def _insert(self, table: str, row: dict[str, Any]) -> None:
+        columns = ', '.join(row)
+        values = ', '.join(f':{column}' for column in row)
+        self._execute(f"INSERT OR REPLACE INTO {table} ({columns}) VALUES ({values})", row)
+
+    @staticmethod
+    def _key(path: str | Path) -> str:
+        return str(Path(path).resolve())
+
+    def _get_created_at(self, path: Path, prefix: str) -> float:
+        match = re.match(f'{prefix}__(.+?)____', path.name)  # time string is followed by '__' + '__key=value' metadata
+        try:
+            return datetime.strptime(match.group(1), self._files_settings.time_format).timestamp()
+        except (AttributeError, ValueError):
+            return path.stat().st_mtime
+
+    @staticmethod
+    def _get_location(path: Path, meta: dict[str, Any]) -> dict[str, Any]:
+        day = re.search(r'day_(\d+)', str(path.parent))
+        iteration = re.search(r'iter_(\d+)', str(meta.get('comment', '')))
+        return {
+            'subject': meta.get('name'),
+            'day': int(day.group(1)) if day else None,
+            'iteration': int(iteration.group(1)) if iteration else None,
+        }
+
+    def add_recording(self, path: Path) -> None:
+        if path.suffix == RECORD_SUFFIX:
+            record = RecordReader(path)
+            meta = record.meta
+            samples_count, events_count = record.samples_count, len(record.events)
+            created_at = datetime.fromisoformat(meta['start_time']).timestamp() if 'start_time' in meta else self._get_created_at(path, 'record')
+        else:
+            meta = parse_record_meta(path)
+            flashes = pd.read_csv(path, usecols=['FLASH'])['FLASH'].to_numpy()
+            samples_count, events_count = len(flashes), int((flashes == 1).sum())
+            created_at = self._get_created_at(path, 'record')
+
+        self._insert('recordings', {
+            'path': self._key(path),
+            **self._get_location(path, meta),
+            'comment': meta.get('comment'),
+            'target': meta.get('target'),
+            'flash_ms': meta.get('flash'),
+            'break_ms': meta.get('break'),
+            'reps': meta.get('reps'),
+            'cycles': meta.get('cycles'),
+            'samples_count': samples_count,
+            'events_count': events_count,
+            'size': path.stat().st_size,
+            'checksum': get_checksum(path),
+            'created_at': created_at,
+        })
+
+    def remove_recording(self, path: Path) -> None:
+        self._execute("DELETE FROM recordings WHERE path = :path", {'path': self._key(path)})
+
+    def add_preprocessed(self, path: Path, recording_path: Path) -> None:
+        recording = self._execute("SELECT * FROM recordings WHERE path = :path", {'path': self._key(recording_path)})
+        if recording:
+            location = {key: recording[0][key] for key in ('subject', 'day', 'iteration', 'target')}
+        else:
+            meta = parse_record_meta(recording_path)
+            location = {**self._get_location(recording_path, meta), 'target': meta.get('target')}
+
+        self._insert('preprocessed', {
+            'path': self._key(path),
+            'recording_path': self._key(recording_path),
+            **location,
+            'size': path.stat().st_size,
+            'checksum': get_checksum(path),
+            'created_at': path.stat().st_mtime,
+        })
+
+    def add_model(self, path: Path) -> None:
+        meta = parse_record_meta(path)
+        self._insert('models', {
+            'path': self._key(path),
+            'subject': meta.get('name'),
+            'comment': meta.get('comment'),
+            'size': path.stat().st_size,
+            'checksum': get_checksum(path),
+            'created_at': self._get_created_at(path, 'model'),
+        })
+
+    def _select(self, table: str, conditions: dict[str, Any], order: str) -> list[sqlite3.Row]:
+        where = ' AND '.join(f'{column} = :{column}' for column, value in conditions.items() if value is not None)
+        query = f"SELECT * FROM {table}" + (f" WHERE {where}" if where else "") + f" ORDER BY {order}"
+        return self._execute(query, conditions)
+
+    def get_recordings(self, name: str | None, day: int | None, iteration: int | None = None) -> list[sqlite3.Row]:
+        conditions = {'subject': name, 'day': day, 'iteration': iteration}
+        return self._select('recordings', conditions, 'created_at, path')
+
+    def get_preprocessed(self, name: str | None, day: int | None) -> list[sqlite3.Row]:
+        return self._select('preprocessed', {'subject': name, 'day': day}, 'created_at, path')
+
+    def find_model(self, name: str | None, comment: str | None) -> sqlite3.Row | None:
+        models = self._select('models', {'subject': name, 'comment': comment}, 'created_at DESC, path DESC')
+        return models[0] if models else None
+
+    def _get_indexed(self, table: str) -> dict[str, int]:
+        return {row['path']: row['size'] for row in self._execute(f"SELECT path, size FROM {table}", {})}
+
+    def scan(self) -> int:
+        indexed = {table: self._get_indexed(table) for table in ('recordings', 'preprocessed', 'models')}
+
+        def is_changed(table: str, path: Path) -> bool:
+            return indexed[table].get(self._key(path)) != path.stat().st_size
+
+        added = 0
+        for path in sorted(self._files_settings.records_dir.rglob('record__*')):
+            if path.suffix == '.fif' and _PREPROCESSED_INFIX in path.name:
+                if is_changed('preprocessed', path):
+                    self.add_preprocessed(path, get_recording_path(path))
+                    added += 1
+            elif path.suffix == RECORD_SUFFIX or (path.suffix == '.csv' and not path.with_suffix(RECORD_SUFFIX).exists()):
+                if is_changed('recordings', path):
+                    self.add_recording(path)
+                    added += 1
+
+        for path in sorted(self._files_settings.models_dir.glob(f'model__*{Path(self._files_settings.model_pattern).suffix}')):
+            if is_changed('models', path):
+                self.add_model(path)
+                added += 1
+        return added
@@ -1,17 +1,24 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import random
 import sys
-from typing import Sequence
+from typing import Iterator
 import mne
 import numpy as np
 
+from preprocessing.cache import ArrayCache
+from preprocessing.preprocessor import Preprocessor
 from preprocessing.settings import NON_TARGET_MARKER, TARGET_MARKER, EpochCollectorSettings
-from speller.settings import FilesSettings, samples_to_ms
+from speller.settings import FilesSettings
 
 
 class EpochCollector:
+    _EVENT_DICT = {"non-target": NON_TARGET_MARKER, "target": TARGET_MARKER}
+
     def __init__(self, settings: EpochCollectorSettings, files_settings: FilesSettings):
         self._settings = settings
         self._files_settings = files_settings
+        self._cache = ArrayCache(files_settings)
 
     def _read_raw_data(self, src_file: str) -> mne.io.RawArray:
         return mne.io.read_raw(src_file)
@@ -46,14 +53,26 @@ class EpochCollector:
     def collect(self, raw: str | mne.io.RawArray) -> mne.EpochsArray:
         if not isinstance(raw, mne.io.RawArray):
             raw = self._read_raw_data(raw)
-        
+
+        annotations = raw.annotations
+        key = self._cache.get_key(
+            'epochs', raw.get_data(), annotations.onset, annotations.duration, list(annotations.description), self._settings
+        )
+        cached = self._cache.get(key)
+        if cached is not None:
+            return mne.EpochsArray(cached['data'], raw.info, cached['events'], tmin=self._settings.epoch_pre_time_s, event_id=self._EVENT_DICT)
+
+        epochs = self._collect(raw)
+        self._cache.put(key, data=epochs.get_data(), events=epochs.events)
+        return epochs
+
+    def _collect(self, raw: mne.io.RawArray) -> mne.EpochsArray:
         events = mne.find_events(raw, stim_channel="STIM_EVENT")
 
-        event_dict = {"non-target": NON_TARGET_MARKER, "target": TARGET_MARKER}
         epochs = mne.Epochs(
             raw,
             events,
-            event_id=event_dict,
+            event_id=self._EVENT_DICT,
             tmin=self._settings.epoch_pre_time_s,
             tmax=self._settings.epoch_post_time_s,
             baseline=(self._settings.baseline_start_s, self._settings.baseline_end_s),
@@ -69,23 +88,30 @@ class EpochCollector:
 
         return epochs
     
-    def collect_many(self, raws: list[str] | list[mne.io.RawArray]) -> mne.EpochsArray:
-        all_epochs = []
+    def _collect_arrays(self, raw: str, preprocessor: Preprocessor | None) -> tuple[np.ndarray, np.ndarray, mne.Info]:
+        if preprocessor is not None:
+            raw = preprocessor.preprocess(raw, silent=True)
+        epochs = self.collect(raw)
+        return epochs.get_data(), epochs.events, epochs.info  # arrays are cheap to send back, MNE objects are not
+
+    def iter_collect(
+        self, raws: list[str] | list[mne.io.RawArray], preprocessor: Preprocessor | None = None, jobs: int = 1
+    ) -> Iterator[mne.BaseEpochs]:
+        # preprocessor: raws are raw records to preprocess first, jobs: worker processes over the files
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                for data, events, info in executor.map(self._collect_arrays, raws, repeat(preprocessor)):  # keeps the files order
+                    yield mne.EpochsArray(data, info, events, tmin=self._settings.epoch_pre_time_s, event_id=self._EVENT_DICT)
+            return
+
         for raw in raws:
-            epochs = self.collect(raw)
-            all_epochs.append(epochs)
+            if preprocessor is not None:
+                raw = preprocessor.preprocess(raw, silent=True)
+            yield self.collect(raw)
 
-        result_epochs = mne.concatenate_epochs(all_epochs)
+    def collect_many(
+        self, raws: list[str] | list[mne.io.RawArray], preprocessor: Preprocessor | None = None, jobs: int = 1
+    ) -> mne.EpochsArray:
+        result_epochs = mne.concatenate_epochs(list(self.iter_collect(raws, preprocessor, jobs)))
         print("Collected epochs: ", len(result_epochs))
         return result_epochs
-    
-    def preprocess_epochs(self, epochs: Sequence[Sequence[float]]) -> np.ndarray:
-        epochs = np.array(epochs)
-        epochs = epochs.transpose((0, 2, 1))
-        
-        times_range_ms =  range(self._settings.epoch_pre_time_ms, self._settings.epoch_post_time_ms + 1, samples_to_ms(1))
-        times_s = np.array([int(ms * 1000) for ms in times_range_ms])
-        
-        epochs = mne.baseline.rescale(epochs, times_s, (self._settings.baseline_start_s, self._settings.baseline_end_s))
-        epochs = epochs.reshape(len(epochs), -1)
-        return epochs
\ No newline at end of file
@@ -0,0 +1,109 @@
+from dataclasses import dataclass
+import json
+from pathlib import Path
+from typing import Any
+
+import mne
+import numpy as np
+
+from preprocessing.settings import TARGET_MARKER
+from speller.settings import FilesSettings
+
+
+EPOCH_META_DTYPE = np.dtype([('session', '<i4'), ('label', '<i1'), ('sample', '<i8')])
+
+
+@dataclass
+class StoredEpochs:
+    X: np.ndarray  # (number_of_epochs, number_of_channels, epoch_size) float32 memmap of the whole store
+    indexes: np.ndarray  # selected rows of X
+    meta: np.ndarray  # EPOCH_META_DTYPE of the selected rows
+    sfreq: float
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self.meta['label']
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+
+class EpochStore:
+    _X_FILENAME = 'X.f32'
+    _META_FILENAME = 'meta.bin'
+    _INDEX_FILENAME = 'index.json'
+    _X_DTYPE = np.dtype('<f4')
+
+    def __init__(self, files_settings: FilesSettings):
+        self._directory = files_settings.epochs_dir
+
+    def _read_index(self) -> dict[str, Any]:
+        path = self._directory / self._INDEX_FILENAME
+        if not path.exists():
+            return {'count': 0, 'shape': None, 'sfreq': None, 'ch_names': None, 'sessions': []}
+        return json.loads(path.read_text())
+
+    def _write_index(self, index: dict[str, Any]) -> None:
+        path = self._directory / self._INDEX_FILENAME
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(index, indent=1))
+        tmp_path.replace(path)  # rows past the indexed count are ignored, an interrupted append leaves no partial session
+
+    def get_sessions(self) -> list[dict[str, Any]]:
+        return self._read_index()['sessions']
+
+    def has_session(self, path: str | Path) -> bool:
+        return any(session['path'] == str(path) for session in self.get_sessions())
+
+    def append(self, epochs: mne.BaseEpochs, path: str | Path, subject: str | None, day: int | None, iteration: int | None) -> int:
+        index = self._read_index()
+        X = epochs.get_data(picks='eeg').astype(self._X_DTYPE, copy=False)
+        ch_names = [epochs.ch_names[pick] for pick in mne.pick_types(epochs.info, eeg=True)]
+        if index['shape'] is None:
+            index.update(shape=list(X.shape[1:]), sfreq=epochs.info['sfreq'], ch_names=ch_names)
+        elif index['shape'] != list(X.shape[1:]) or index['sfreq'] != epochs.info['sfreq']:
+            raise ValueError(f"EpochStore: epochs {X.shape[1:]} at {epochs.info['sfreq']}Hz do not match the store {index['shape']} at {index['sfreq']}Hz")
+
+        session_id = len(index['sessions'])
+        meta = np.empty(len(X), dtype=EPOCH_META_DTYPE)
+        meta['session'] = session_id
+        meta['label'] = epochs.events[:, 2] == TARGET_MARKER
+        meta['sample'] = epochs.events[:, 0]
+
+        self._directory.mkdir(parents=True, exist_ok=True)
+        for filename, array, row_size in ((self._X_FILENAME, X, X[0].nbytes), (self._META_FILENAME, meta, meta.itemsize)):
+            with open(self._directory / filename, 'r+b' if (self._directory / filename).exists() else 'wb') as f:
+                f.truncate(index['count'] * row_size)  # drop rows of an interrupted append
+                f.seek(0, 2)
+                f.write(np.ascontiguousarray(array).tobytes())
+
+        index['sessions'].append({
+            'id': session_id,
+            'path': str(path),
+            'subject': subject,
+            'day': day,
+            'iteration': iteration,
+            'start': index['count'],
+            'count': len(X),
+        })
+        index['count'] += len(X)
+        self._write_index(index)
+        return session_id
+
+    def select(self, name: str | None = None, day: int | None = None) -> StoredEpochs:
+        index = self._read_index()
+        if not index['count']:
+            raise FileNotFoundError(f"EpochStore: no epochs in {self._directory}, run store_epochs")
+
+        X = np.memmap(self._directory / self._X_FILENAME, dtype=self._X_DTYPE, mode='r', shape=(index['count'], *index['shape']))
+        meta = np.memmap(self._directory / self._META_FILENAME, dtype=EPOCH_META_DTYPE, mode='r', shape=(index['count'],))
+
+        sessions = [
+            session for session in index['sessions']
+            if (name is None or session['subject'] == name) and (day is None or session['day'] == day)
+        ]
+        indexes = np.concatenate([np.arange(session['start'], session['start'] + session['count']) for session in sessions] or [[]])
+        indexes = indexes.astype(np.int64)
+
+        print(f"Selected {len(indexes)} stored epochs of {len(sessions)} sessions")
+        return StoredEpochs(X=X, indexes=indexes, meta=np.asarray(meta[indexes]), sfreq=index['sfreq'])
@@ -0,0 +1,87 @@
+import numpy as np
+
+from preprocessing.settings import EpochCollectorSettings, ModelSettings
+from speller.settings import ms_to_samples, samples_to_ms
+
+
+class FeatureExtractor:
+    _CHUNK_EPOCHS = 4096  # epochs extracted at once offline, bounds the cumulative sum memory
+
+    def __init__(self, settings: ModelSettings, epoch_collector_settings: EpochCollectorSettings):
+        self._settings = settings
+        self._epoch_collector_settings = epoch_collector_settings
+
+    @property
+    def _window_size(self) -> int:
+        return self._settings.feature_window_samples
+
+    def _get_baseline_slice(self, size: int) -> slice:
+        # the samples mne.baseline.rescale averages over
+        times_ms = self._epoch_collector_settings.epoch_pre_time_ms + samples_to_ms(np.arange(size))
+        start_s, end_s = self._epoch_collector_settings.baseline_start_s, self._epoch_collector_settings.baseline_end_s
+        start = 0 if start_s is None else int(np.searchsorted(times_ms, start_s * 1000, side='left'))
+        stop = size if end_s is None else int(np.searchsorted(times_ms, end_s * 1000, side='right'))
+        return slice(start, stop)
+
+    def _get_offsets(self, size: int) -> np.ndarray:
+        # first sample of every window within the epoch
+        pre_time_ms = self._epoch_collector_settings.epoch_pre_time_ms
+        start_ms, end_ms = self._settings.feature_start_ms, self._settings.feature_end_ms
+        start = 0 if start_ms is None else ms_to_samples(start_ms - pre_time_ms)
+        stop = size if end_ms is None else min(size, ms_to_samples(end_ms - pre_time_ms) + 1)
+        number_of_windows = (stop - start) // self._window_size
+        if start < 0 or number_of_windows <= 0:
+            raise ValueError(f"FeatureExtractor: no {self._window_size} samples windows in {start}:{stop} of {size} samples epochs")
+        return start + self._window_size * np.arange(number_of_windows)
+
+    def get_features_count(self, number_of_channels: int, size: int) -> int:
+        return number_of_channels * len(self._get_offsets(size))
+
+    def _get_windows(self, size: int) -> slice:
+        # the window means of an epoch among the means of the windows starting at each of its samples
+        offsets = self._get_offsets(size)
+        return slice(offsets[0], offsets[-1] + 1, self._window_size)
+
+    def _get_window_means(self, cumsum: np.ndarray) -> np.ndarray:
+        # cumsum: (..., number_of_samples + 1) -> (..., number_of_samples - window + 1) means of the windows starting at every sample
+        return (cumsum[..., self._window_size:] - cumsum[..., :-self._window_size]) / self._window_size
+
+    def extract(self, samples: np.ndarray, starts: np.ndarray, size: int, out: np.ndarray | None = None) -> np.ndarray:
+        # samples: (number_of_samples, number_of_channels) stream, epochs of size samples at starts
+        # -> (number_of_epochs, number_of_channels * number_of_windows) baseline corrected window means, channel-major
+        # out: preallocated result, e.g. a shared memory buffer
+        number_of_samples, number_of_channels = samples.shape
+        if out is None:
+            out = np.empty((len(starts), self.get_features_count(number_of_channels, size)), dtype=samples.dtype)
+
+        cumsum = np.zeros((number_of_channels, number_of_samples + 1))
+        np.cumsum(samples.transpose(), axis=1, out=cumsum[:, 1:])
+        window_means = self._get_window_means(cumsum)  # every window of the stream once, overlapping epochs share them
+        epochs_means = np.lib.stride_tricks.sliding_window_view(window_means, size - self._window_size + 1, axis=1)  # a view
+
+        features = epochs_means[:, starts, self._get_windows(size)]  # (channels, epochs, windows), the only gather
+        baseline = self._get_baseline_slice(size)
+        features -= ((cumsum[:, starts + baseline.stop] - cumsum[:, starts + baseline.start]) / (baseline.stop - baseline.start))[..., np.newaxis]
+        out.reshape(len(starts), number_of_channels, -1)[...] = features.transpose((1, 0, 2))  # channel-major as the epochs are
+        return out
+
+    def extract_epochs(self, epochs: np.ndarray, indexes: np.ndarray | None = None) -> np.ndarray:
+        # epochs: (number_of_epochs, number_of_channels, size) already cut, the same window means within every epoch
+        # indexes: rows of epochs to extract, e.g. of a memory map, read a chunk at a time
+        # one channel of a chunk at a time, temporaries stay a fraction of the chunk
+        _, number_of_channels, size = epochs.shape
+        number_of_epochs = len(epochs) if indexes is None else len(indexes)
+        features = np.empty((number_of_epochs, self.get_features_count(number_of_channels, size)), dtype=epochs.dtype)
+        channels_features = features.reshape(number_of_epochs, number_of_channels, -1)  # a view
+        windows, baseline = self._get_windows(size), self._get_baseline_slice(size)
+
+        for start in range(0, number_of_epochs, self._CHUNK_EPOCHS):
+            rows = slice(start, start + self._CHUNK_EPOCHS) if indexes is None else indexes[start: start + self._CHUNK_EPOCHS]
+            chunk = np.asarray(epochs[rows])
+            cumsum = np.zeros((len(chunk), size + 1))
+            for channel in range(number_of_channels):
+                np.cumsum(chunk[:, channel], axis=1, out=cumsum[:, 1:])
+                channel_features = self._get_window_means(cumsum)[:, windows]
+                channel_features -= ((cumsum[:, baseline.stop] - cumsum[:, baseline.start]) / (baseline.stop - baseline.start))[:, np.newaxis]
+                channels_features[start: start + len(chunk), channel] = channel_features
+        return features
@@ -1,35 +1,38 @@
 from datetime import datetime
-import glob
 from pathlib import Path
 
+from preprocessing.catalog import SessionCatalog
+from speller.data_aquisition.record_file import get_sequences_path
 from speller.settings import FilesSettings
 
 
-def get_raw_files(records_dir: Path, name: str | None, day: int | None, iter: int | None = None) -> list[str]:
-    pattern = "raw\\{name}\\day_{day}\\record*iter_{iter}*".format(
-        name=name or '*',
-        day=day or '*',
-        iter = iter or '*'
-    )
-    print(f"{records_dir}\\{pattern}")
-    files = glob.glob(f"{records_dir}\\{pattern}")
+def _get_catalog(settings: FilesSettings) -> SessionCatalog:
+    catalog = SessionCatalog(settings)
+    if not catalog.get_recordings(None, None):  # nothing indexed yet, fall back to scanning the records
+        print(f"Catalog is empty, indexed {catalog.scan()} files")
+    return catalog
+
+
+def get_raw_files(settings: FilesSettings, name: str | None, day: int | None, iter: int | None = None) -> list[str]:
+    files = [row['path'] for row in _get_catalog(settings).get_recordings(name, day, iter)]
 
     print(f"Got raw files: {files}")
     return files
 
 
-def get_preprocessed_files(records_dir: Path, name: str | None, day: int | None) -> list[str]:
-    pattern = "preprocessed\\{name}\\day_{day}\\record*".format(
-        name=name or '*',
-        day=day or '*',
-    )
-
-    print(f"{records_dir}\\{pattern}")
-    files = glob.glob(f"{records_dir}\\{pattern}")
+def get_preprocessed_files(settings: FilesSettings, name: str | None, day: int | None) -> list[str]:
+    files = [row['path'] for row in _get_catalog(settings).get_preprocessed(name, day)]
 
     print(f"Got preprocessed files: {files}")
     return files
 
+def get_sequences_files(settings: FilesSettings, name: str | None, day: int | None) -> list[str]:
+    records = [Path(row['path']) for row in _get_catalog(settings).get_recordings(name, day)]
+    files = [str(get_sequences_path(record)) for record in records if get_sequences_path(record).exists()]
+
+    print(f"Got online sequences files: {files}")
+    return files
+
 def get_model_filename(settings: FilesSettings, name: str | None, comment: str | None) -> str:
     time_str = datetime.now().strftime(settings.time_format)
     meta = (
@@ -40,12 +43,10 @@ def get_model_filename(settings: FilesSettings, name: str | None, comment: str |
     return filename
 
 def find_model_file(settings: FilesSettings) -> str:
-    pattern = "model__*"
-    if settings.clf_name:
-        pattern += f"name={settings.clf_name}*"
-    if settings.clf_comment:
-        pattern += f"comment={settings.clf_comment}*"
+    model = _get_catalog(settings).find_model(settings.clf_name, settings.clf_comment)
+    if model is None:
+        raise FileNotFoundError(f"No model for name={settings.clf_name} comment={settings.clf_comment} in the catalog, run catalog --scan")
 
-    file = glob.glob(f"{settings.models_dir}\\{pattern}")[-1]
+    file = model['path']
     print(f"Got ClassifierModel file: {file}")
-    return file
\ No newline at end of file
+    return file
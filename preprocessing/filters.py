@@ -0,0 +1,107 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+from preprocessing.settings import PreprocessorSettings
+
+
+FREQUENCY = 250
+LINE_FREQUENCY = 50.
+
+_FIR_HAMMING_LENGTH_FACTOR = 3.3  # transition bandwidths per filter length, as in MNE
+
+
+@lru_cache(maxsize=32)
+def _design_sos(sfreq: float, l_freq: float, h_freq: float, order: int, notch_freq: float, notch_quality: float) -> np.ndarray:
+    band_pass = signal.butter(order, [l_freq, h_freq], btype='bandpass', output='sos', fs=sfreq)
+    notch = signal.tf2sos(*signal.iirnotch(notch_freq, notch_quality, fs=sfreq))
+    return np.vstack([band_pass, notch])
+
+
+def _get_fir_length(sfreq: float, transition_bandwidth: float) -> int:
+    length = int(np.ceil(_FIR_HAMMING_LENGTH_FACTOR * sfreq / transition_bandwidth))
+    return length + 1 - length % 2  # odd length keeps the filter symmetric around a sample
+
+
+@lru_cache(maxsize=32)
+def _design_fir(sfreq: float, l_freq: float, h_freq: float, notch_freq: float, notch_quality: float) -> np.ndarray:
+    # MNE's default transition bandwidths, cutoffs in their middle
+    l_trans = min(max(0.25 * l_freq, 2.), l_freq)
+    h_trans = min(max(0.25 * h_freq, 2.), sfreq / 2 - h_freq)
+    band_pass = signal.firwin(
+        _get_fir_length(sfreq, min(l_trans, h_trans)),
+        [l_freq - l_trans / 2, h_freq + h_trans / 2],
+        pass_zero='bandpass',
+        window='hamming',
+        fs=sfreq,
+    )
+
+    notch_width = notch_freq / notch_quality
+    notch = signal.firwin(
+        _get_fir_length(sfreq, notch_width),
+        [notch_freq - notch_width / 2, notch_freq + notch_width / 2],
+        pass_zero='bandstop',
+        window='hamming',
+        fs=sfreq,
+    )
+    return np.convolve(band_pass, notch)
+
+
+def design_sos(settings: PreprocessorSettings) -> np.ndarray:
+    return _design_sos(
+        FREQUENCY,
+        settings.lower_passband_frequency,
+        settings.upper_passband_frequency,
+        settings.filter_order,
+        LINE_FREQUENCY,
+        settings.notch_quality,
+    )
+
+
+def design_fir(settings: PreprocessorSettings) -> np.ndarray:
+    return _design_fir(
+        FREQUENCY,
+        settings.lower_passband_frequency,
+        settings.upper_passband_frequency,
+        LINE_FREQUENCY,
+        settings.notch_quality,
+    )
+
+
+def _filter_fir(data: np.ndarray, taps: np.ndarray) -> np.ndarray:
+    pad = len(taps) // 2
+    data = np.pad(data, ((0, 0), (pad, pad)), mode='reflect')  # MNE pads with reflection too
+    filtered = signal.oaconvolve(data, taps[np.newaxis, :], mode='same', axes=-1)  # symmetric taps, zero phase
+    return filtered[:, pad: -pad]
+
+
+def filter_data(data: np.ndarray, settings: PreprocessorSettings) -> np.ndarray:
+    # data: (number_of_channels, number_of_samples), all channels are filtered in one pass
+    match settings.filter_method:
+        case 'causal':
+            return StreamingFilter(settings).process(data.transpose()).transpose()
+        case 'iir':
+            return signal.sosfiltfilt(design_sos(settings), data, axis=-1)
+        case 'fir':
+            return _filter_fir(data, design_fir(settings))
+    raise ValueError(f"filter_data: {settings.filter_method} filter is done by MNE")
+
+
+class StreamingFilter:
+    def __init__(self, settings: PreprocessorSettings):
+        self._sos = design_sos(settings)  # designed once, reused for every block
+        self._zi: np.ndarray | None = None
+
+    def reset(self) -> None:
+        self._zi = None
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        # samples: (number_of_samples, number_of_channels), filtered along time with the state kept between calls
+        if not len(samples):
+            return np.empty(samples.shape, dtype=np.float64)
+        if self._zi is None:
+            # start in the steady state of the first sample, electrode offsets would ring for seconds otherwise
+            self._zi = signal.sosfilt_zi(self._sos)[:, :, np.newaxis] * samples[0].astype(np.float64)
+        filtered, self._zi = signal.sosfilt(self._sos, samples, axis=0, zi=self._zi)
+        return filtered
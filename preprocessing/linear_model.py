@@ -0,0 +1,38 @@
+from pathlib import Path
+
+import numpy as np
+
+
+COMPILED_MODEL_SUFFIX = '.npz'
+
+
+def get_compiled_model_path(model_path: str | Path) -> Path:
+    return Path(model_path).with_suffix(COMPILED_MODEL_SUFFIX)
+
+
+class LinearModel:
+    # scores = clip(epochs @ weights + bias, score_min, score_max), the scaler and the calibration folded in, numpy only
+    def __init__(self, weights: np.ndarray, bias: float, score_min: float = -np.inf, score_max: float = np.inf):
+        self.weights = np.ascontiguousarray(weights, dtype=np.float64)
+        self.bias = float(bias)
+        self.score_min = float(score_min)
+        self.score_max = float(score_max)
+
+    @property
+    def features_count(self) -> int:
+        return len(self.weights)
+
+    def predict(self, epochs: np.ndarray) -> list[float]:
+        # epochs: (number_of_epochs, number_of_features)
+        scores = epochs @ self.weights
+        scores += self.bias
+        np.clip(scores, self.score_min, self.score_max, out=scores)
+        return scores.tolist()
+
+    def save(self, filename: str | Path) -> None:
+        np.savez(filename, weights=self.weights, bias=self.bias, score_min=self.score_min, score_max=self.score_max)
+
+    @classmethod
+    def load(cls, filename: str | Path) -> 'LinearModel':
+        with np.load(filename) as data:
+            return cls(data['weights'], data['bias'], data['score_min'], data['score_max'])
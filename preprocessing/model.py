@@ -1,24 +1,31 @@
 from dataclasses import dataclass
 from pathlib import Path
 import pickle
+from typing import Any
 from matplotlib import pyplot as plt
 import mne
 import numpy as np
 from sklearn import metrics
 from sklearn.base import ClassifierMixin
+from sklearn.calibration import CalibratedClassifierCV
 from sklearn.model_selection import ShuffleSplit, cross_val_score, train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.svm import SVC
 
-from preprocessing.settings import ModelSettings
-from speller.data_aquisition.data_collector import DataSampleType
+from preprocessing.cache import ArrayCache
+from preprocessing.catalog import SessionCatalog
+from preprocessing.epoch_store import StoredEpochs
+from preprocessing.features import FeatureExtractor
+from preprocessing.linear_model import LinearModel, get_compiled_model_path
+from preprocessing.settings import FEATURE_SETTINGS_FIELDS, ModelSettings
+from speller.data_aquisition.record_file import SequencesReader
 from speller.settings import FilesSettings
 
 
 @dataclass
 class Data:
-    X: list[DataSampleType]
-    y: list[int]
+    X: np.ndarray
+    y: np.ndarray
 
 
 @dataclass
@@ -28,38 +35,136 @@ class Dataset:
 
 
 class ClassifierModel:
-    def __init__(self, clf: SVC, scaler: StandardScaler):
+    _target_prior = 0.5  # models pickled before calibration were fitted on equalized events
+    _probability_clip = 1e-3
+    metrics: dict[str, float] = {}
+
+    def __init__(
+        self,
+        clf: SVC | CalibratedClassifierCV,
+        scaler: StandardScaler,
+        target_prior: float,
+        probability_clip: float,
+        metrics: dict[str, float],
+    ):
         self._clf = clf
         self._scaler = scaler
+        self._target_prior = target_prior
+        self._probability_clip = probability_clip
+        self.metrics = metrics
+
+    @property
+    def _svc(self) -> SVC:
+        if isinstance(self._clf, CalibratedClassifierCV):
+            return self._clf.calibrated_classifiers_[0].estimator  # fitted on all the training data, ensemble=False
+        return self._clf
+
+    @property
+    def is_calibrated(self) -> bool:
+        return isinstance(self._clf, CalibratedClassifierCV)
+
+    def decision_function(self, epochs: np.ndarray) -> np.ndarray:
+        return self._svc.decision_function(self._scaler.transform(epochs))
+
+    def predict_proba(self, epochs: np.ndarray) -> np.ndarray:
+        # probability of the target class given the epoch, under the training class balance
+        if not self.is_calibrated:
+            raise ValueError("ClassifierModel: the model is not calibrated, refit it with ModelSettings.calibration")
+        return self._clf.predict_proba(self._scaler.transform(epochs))[:, 1]
+
+    def predict_labels(self, epochs: np.ndarray) -> list[int]:
+        return self._svc.predict(self._scaler.transform(epochs)).astype(int).tolist()
+
+    def compile(self) -> LinearModel:
+        # the same scores as predict from one dot product: the scaler folds into the SVC weights, Platt scaling is affine
+        svc = self._svc
+        if svc.kernel != 'linear':
+            raise ValueError(f"ClassifierModel: {svc.kernel} kernel SVC is not linear")
+        weights = svc.coef_[0] / self._scaler.scale_
+        bias = svc.intercept_[0] - weights @ self._scaler.mean_
+        if not self.is_calibrated:
+            return LinearModel(weights, bias)
+
+        calibrator = self._clf.calibrated_classifiers_[0].calibrators[0]
+        if not hasattr(calibrator, 'a_'):
+            raise ValueError("ClassifierModel: only sigmoid calibration is linear")
+        # p = 1 / (1 + exp(a * decision + b)), so the log-odds are -(a * decision + b)
+        prior_log_odds = np.log(self._target_prior / (1 - self._target_prior))
+        max_log_odds = np.log((1 - self._probability_clip) / self._probability_clip)
+        return LinearModel(
+            -calibrator.a_ * weights,
+            -(calibrator.a_ * bias + calibrator.b_) - prior_log_odds,
+            score_min=-max_log_odds - prior_log_odds,
+            score_max=max_log_odds - prior_log_odds,
+        )
 
     def predict(self, epochs: np.ndarray) -> list[float]:
-        epochs = self._scaler.transform(epochs)
-        return self._clf.predict(epochs).tolist()
+        # log-likelihood ratio log p(epoch | target) / p(epoch | non-target) of every epoch, sums over repetitions
+        if not self.is_calibrated:
+            return self.decision_function(epochs).tolist()  # uncalibrated margins are only proportional to it
+
+        probabilities = np.clip(self.predict_proba(epochs), self._probability_clip, 1 - self._probability_clip)
+        prior_log_odds = np.log(self._target_prior / (1 - self._target_prior))
+        return (np.log(probabilities / (1 - probabilities)) - prior_log_odds).tolist()
 
 
 class Model:
-    def __init__(self, settings: ModelSettings, files_settings: FilesSettings):
+    _COMPILE_CHECK_EPOCHS = 1000
+    _COMPILE_TOLERANCE = 1e-9
+
+    def __init__(self, settings: ModelSettings, files_settings: FilesSettings, feature_extractor: FeatureExtractor):
         self._settings = settings
         self._files_settings = files_settings
+        self._feature_extractor = feature_extractor
+        self._catalog = SessionCatalog(files_settings)
+        self._cache = ArrayCache(files_settings)
 
     def _get_epochs_subset(self, epochs: mne.Epochs) -> mne.Epochs:
         upper_bound = int(len(epochs) * self._settings.data_proportion)
         return epochs[:upper_bound]
 
-    def _get_dataset_from_epochs(self, epochs: mne.Epochs, split: bool = True) -> Dataset:
+    def _get_subset_indexes(self, labels: np.ndarray) -> np.ndarray:
+        indexes = [np.flatnonzero(labels == k) for k in (0, 1)]  # order is important!
+        return np.concatenate([k_indexes[:int(len(k_indexes) * self._settings.data_proportion)] for k_indexes in indexes])
+
+    def _get_stored_features(self, epochs: StoredEpochs) -> tuple[np.ndarray, np.ndarray]:
+        indexes = self._get_subset_indexes(epochs.labels)
+        X = self._feature_extractor.extract_epochs(epochs.X, epochs.indexes[indexes])  # reads the selected rows a chunk at a time
+        return X, epochs.labels[indexes].astype(np.float64)
+
+    def _get_features(self, epochs: mne.Epochs | StoredEpochs | Data) -> tuple[np.ndarray, np.ndarray]:
+        if isinstance(epochs, StoredEpochs):
+            return self._get_stored_features(epochs)  # already on disk, nothing to cache
+        if isinstance(epochs, Data):
+            indexes = self._get_subset_indexes(epochs.y)  # features computed online
+            return epochs.X[indexes], epochs.y[indexes]
+
+        feature_settings = self._settings.model_dump(include=FEATURE_SETTINGS_FIELDS)
+        key = self._cache.get_key(
+            'features', epochs.get_data(), epochs.events, epochs.tmin, feature_settings, self._settings.data_proportion
+        )
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached['X'], cached['y']
+
         epochs_list = [self._get_epochs_subset(epochs[k]) for k in ('non-target', 'target')]  # order is important!
         X = [e.get_data(picks='eeg') for e in epochs_list]
         y = [k * np.ones(len(this_X)) for k, this_X in enumerate(X)]
-        X = np.concatenate(X)
-        X = X.reshape(len(X), -1)
+        X = self._feature_extractor.extract_epochs(np.concatenate(X))
         y = np.concatenate(y)
 
+        self._cache.put(key, X=X, y=y)
+        return X, y
+
+    def _get_dataset_from_epochs(self, epochs: mne.Epochs | StoredEpochs | Data, split: bool = True) -> Dataset:
+        X, y = self._get_features(epochs)
+
         if split:
             X_train, X_test, y_train, y_test = train_test_split(
                 X, y, stratify=y, test_size=self._settings.test_proportion, random_state=self._settings.random_seed
             )
         else:
-            X_train, X_test, y_train, y_test = X, np.ndarray((0, 1608)), y, np.ndarray((0,))
+            X_train, X_test, y_train, y_test = X, np.empty((0, X.shape[1])), y, np.empty((0,))
 
         return Dataset(train=Data(X=X_train, y=y_train), test=Data(X=X_test, y=y_test))
 
@@ -74,8 +179,16 @@ class Model:
     def _get_clf(self) -> ClassifierMixin:
         return SVC(C=self._settings.classifier__C, kernel=self._settings.classifier__kernel)
     
+    def _get_calibrated_clf(self) -> ClassifierMixin:
+        if self._settings.calibration == 'none':
+            return self._get_clf()
+        # the calibrator is fitted on out-of-fold decision values, the final classifier on all the training data
+        return CalibratedClassifierCV(
+            self._get_clf(), method=self._settings.calibration, cv=self._settings.calibration_folds, ensemble=False
+        )
+
     def _fit_classifier(self, data: Dataset) -> ClassifierMixin:
-        clf = self._get_clf()
+        clf = self._get_calibrated_clf()
 
         print("Start fitting...")
         clf.fit(data.train.X, data.train.y)
@@ -83,30 +196,49 @@ class Model:
 
         return clf
     
-    def _print_scores(self, y_test: list[int], y_pred: list[int]) -> None:
-        print("Accuracy:", metrics.accuracy_score(y_test, y_pred))
-        print("Precision:", metrics.precision_score(y_test, y_pred))
-        print("Recall:", metrics.recall_score(y_test, y_pred))
-        print("F1-score:", metrics.f1_score(y_test, y_pred))
+    def _print_scores(self, y_test: list[int], y_pred: list[int]) -> dict[str, float]:
+        scores = {
+            'accuracy': metrics.accuracy_score(y_test, y_pred),
+            'precision': metrics.precision_score(y_test, y_pred),
+            'recall': metrics.recall_score(y_test, y_pred),
+            'f1': metrics.f1_score(y_test, y_pred),
+        }
+        print("Accuracy:", scores['accuracy'])
+        print("Precision:", scores['precision'])
+        print("Recall:", scores['recall'])
+        print("F1-score:", scores['f1'])
 
         print(metrics.classification_report(y_test, y_pred))
         print(metrics.confusion_matrix(y_test, y_pred, labels=[0, 1], normalize='true'))
+        return scores
 
-    def _report(self, clf: ClassifierMixin, data: Dataset) -> None:
+    def _print_calibration(self, y_test: list[int], probabilities: np.ndarray) -> dict[str, float]:
+        scores = {
+            'roc_auc': metrics.roc_auc_score(y_test, probabilities),
+            'log_loss': metrics.log_loss(y_test, probabilities, labels=[0, 1]),
+            'brier': metrics.brier_score_loss(y_test, probabilities),
+        }
+        print("ROC AUC:", scores['roc_auc'])
+        print("Log loss:", scores['log_loss'])
+        print("Brier score:", scores['brier'])
+        return scores
+
+    def _report(self, clf: ClassifierMixin, data: Dataset) -> dict[str, float]:
         y_test = list(map(int, data.test.y))
         y_pred = list(map(int, clf.predict(data.test.X)))
         
-        self._print_scores(y_test, y_pred)
+        scores = self._print_scores(y_test, y_pred)
+        if isinstance(clf, CalibratedClassifierCV):
+            scores.update(self._print_calibration(y_test, clf.predict_proba(data.test.X)[:, 1]))
 
         metrics.ConfusionMatrixDisplay.from_predictions(
             y_test, y_pred, display_labels=['non-target', 'target'], labels=[0, 1], normalize='true', cmap='gist_yarg'
         )
         plt.show()
-    
-    def fit(self, epochs: mne.Epochs, stats: bool = False, split: bool = True) -> ClassifierModel | None:
-        if self._settings.downsample_freq:
-            epochs.resample(self._settings.downsample_freq)
 
+        return {name: float(value) for name, value in scores.items()}
+    
+    def fit(self, epochs: mne.Epochs | StoredEpochs | Data, stats: bool = False, split: bool = True) -> ClassifierModel | None:
         data = self._get_dataset_from_epochs(epochs, split=split)
         scaler = self._apply_scaler(data)
 
@@ -119,14 +251,73 @@ class Model:
             print("Mean F1: ", np.mean(scores))
         else:
             clf = self._fit_classifier(data)
-            self._report(clf, data)
+            scores = self._report(clf, data)
 
-            return ClassifierModel(clf, scaler)
+            return ClassifierModel(
+                clf,
+                scaler,
+                target_prior=float(np.mean(data.train.y)),
+                probability_clip=self._settings.probability_clip,
+                metrics={'train_epochs': len(data.train.y), 'test_epochs': len(data.test.y), **scores},
+            )
             
+    def load_sequences(self, files: list[str]) -> Data:
+        feature_settings = self._settings.model_dump(include=FEATURE_SETTINGS_FIELDS)
+
+        X, y = [], []
+        for file in files:
+            reader = SequencesReader(Path(file))
+            if not reader.sequences_count:
+                continue
+            online_settings = {key: reader.meta.get('features', {}).get(key) for key in feature_settings}
+            if online_settings != feature_settings:
+                raise ValueError(f"Model: {file} features were extracted with {online_settings}, not {feature_settings}")
+            kept = reader.weights > 0  # gated epochs were not classified online
+            X.append(reader.features[kept])
+            y.append(reader.labels[kept].astype(np.float64))
+
+        if not X:
+            raise FileNotFoundError(f"Model: no online sequences in {files}")
+        data = Data(X=np.concatenate(X), y=np.concatenate(y))
+        print(f"Loaded {len(data.y)} online epochs of {len(files)} records")
+        return data
+
     def save(self, clf_model: ClassifierModel, filename: str) -> None:
         with open(filename, "wb") as f:
-            return pickle.dump(clf_model, f)
+            pickle.dump(clf_model, f)
+        self._catalog.add_model(Path(filename))
 
     def load(self, filename: str) -> ClassifierModel:
         with open(filename, "rb") as f:
             return pickle.load(f)
+
+    def _check_compiled(self, clf_model: ClassifierModel, linear_model: LinearModel) -> float:
+        # epochs drawn around the training distribution the scaler was fitted on
+        scaler = clf_model._scaler
+        rng = np.random.default_rng(self._settings.random_seed)
+        epochs = scaler.mean_ + scaler.scale_ * rng.standard_normal((self._COMPILE_CHECK_EPOCHS, linear_model.features_count))
+
+        expected, actual = np.asarray(clf_model.predict(epochs)), np.asarray(linear_model.predict(epochs))
+        error = np.max(np.abs(actual - expected)) / max(np.max(np.abs(expected)), 1.)
+        if error > self._COMPILE_TOLERANCE:
+            raise ValueError(f"Model: compiled scores differ from the classifier scores by {error:.2e}")
+        return error
+
+    def export(self, clf_model: ClassifierModel) -> LinearModel:
+        linear_model = clf_model.compile()
+        error = self._check_compiled(clf_model, linear_model)
+        print(f"Compiled {linear_model.features_count} features model, max relative error {error:.2e}")
+        return linear_model
+
+    def compile(self, clf_model: ClassifierModel, filename: str) -> Path:
+        compiled_filename = get_compiled_model_path(filename)
+        self.export(clf_model).save(compiled_filename)
+        return compiled_filename
+
+    def get_manifest(self, clf_model: ClassifierModel, sessions: list[str]) -> dict[str, Any]:
+        return {
+            'sessions': sessions,
+            'settings': {'model': self._settings.model_dump()},
+            'metrics': clf_model.metrics,
+            'features': self._settings.model_dump(include=FEATURE_SETTINGS_FIELDS),
+        }
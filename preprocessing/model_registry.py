@@ -0,0 +1,135 @@
+from datetime import datetime
+import hashlib
+import json
+from pathlib import Path
+import re
+import shutil
+import uuid
+from typing import Any
+
+import numpy as np
+
+from preprocessing.linear_model import LinearModel
+from speller.settings import FilesSettings
+
+
+_VERSION_PATTERN = re.compile(r'v(\d{4,})')
+
+
+class ModelRegistry:
+    _REGISTRY_DIRNAME = 'registry'
+    _MANIFEST_FILENAME = 'manifest.json'
+    _WEIGHTS_FILENAME = 'weights.npy'
+    _PROMOTED_FILENAME = 'promoted'
+    _DEFAULT_SUBJECT = 'default'
+
+    def __init__(self, files_settings: FilesSettings):
+        self._directory = files_settings.models_dir / self._REGISTRY_DIRNAME
+
+    def _get_subject_dir(self, subject: str | None) -> Path:
+        return self._directory / (subject or self._DEFAULT_SUBJECT)
+
+    def _get_versions(self, subject: str | None) -> list[int]:
+        subject_dir = self._get_subject_dir(subject)
+        if not subject_dir.exists():
+            return []
+        matches = (_VERSION_PATTERN.fullmatch(path.name) for path in subject_dir.iterdir() if path.is_dir())
+        return sorted(int(match.group(1)) for match in matches if match)
+
+    def _get_version_dir(self, subject: str | None, version: int) -> Path:
+        return self._get_subject_dir(subject) / f'v{version:04d}'
+
+    @staticmethod
+    def _get_checksum(path: Path) -> str:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+
+    def _write_atomic(self, path: Path, text: str) -> None:
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_text(text)
+        tmp_path.replace(path)
+
+    def register(self, linear_model: LinearModel, subject: str | None, comment: str | None, manifest: dict[str, Any]) -> Path:
+        # the version directory is written aside and renamed in place, readers never see a partial model
+        subject_dir = self._get_subject_dir(subject)
+        subject_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = subject_dir / f'.tmp-{uuid.uuid4().hex}'  # unique, a crashed registration may have left its own behind
+        tmp_dir.mkdir()
+        try:
+            return self._register(tmp_dir, linear_model, subject, comment, manifest)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)  # gone once renamed
+
+    def _register(self, tmp_dir: Path, linear_model: LinearModel, subject: str | None, comment: str | None, manifest: dict[str, Any]) -> Path:
+        np.save(tmp_dir / self._WEIGHTS_FILENAME, linear_model.weights)
+        while True:
+            version = max(self._get_versions(subject), default=0) + 1
+            manifest = {
+                **manifest,
+                'subject': subject or self._DEFAULT_SUBJECT,
+                'comment': comment,
+                'version': version,
+                'created_at': datetime.now().isoformat(),
+                'model': {
+                    'weights': self._WEIGHTS_FILENAME,
+                    'weights_sha256': self._get_checksum(tmp_dir / self._WEIGHTS_FILENAME),
+                    'features_count': linear_model.features_count,
+                    'bias': linear_model.bias,
+                    'score_min': linear_model.score_min,
+                    'score_max': linear_model.score_max,
+                },
+            }
+            (tmp_dir / self._MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=1))
+            try:
+                tmp_dir.rename(self._get_version_dir(subject, version))
+                return self._get_version_dir(subject, version)
+            except OSError:
+                if not self._get_version_dir(subject, version).exists():
+                    raise  # otherwise registered concurrently, take the next version
+
+    def read_manifest(self, path: Path) -> dict[str, Any]:
+        return json.loads((path / self._MANIFEST_FILENAME).read_text())
+
+    def get_models(self, subject: str | None = None) -> list[dict[str, Any]]:
+        subjects = [subject or self._DEFAULT_SUBJECT] if subject else sorted(
+            path.name for path in self._directory.glob('*') if path.is_dir()
+        )
+        manifests = []
+        for subject in subjects:
+            promoted = self.get_promoted(subject)
+            for version in self._get_versions(subject):
+                manifest = self.read_manifest(self._get_version_dir(subject, version))
+                manifests.append({**manifest, 'path': str(self._get_version_dir(subject, version)), 'promoted': version == promoted})
+        return manifests
+
+    def get_promoted(self, subject: str | None) -> int | None:
+        path = self._get_subject_dir(subject) / self._PROMOTED_FILENAME
+        return int(path.read_text()) if path.exists() else None
+
+    def promote(self, subject: str | None, version: int) -> Path:
+        if version not in self._get_versions(subject):
+            raise FileNotFoundError(f"ModelRegistry: no version {version} of {subject or self._DEFAULT_SUBJECT} models")
+        self._write_atomic(self._get_subject_dir(subject) / self._PROMOTED_FILENAME, str(version))
+        return self._get_version_dir(subject, version)
+
+    def find(self, subject: str | None, comment: str | None = None) -> Path | None:
+        # the promoted version, otherwise the newest one, of the models with the comment if given
+        versions = [
+            version for version in self._get_versions(subject)
+            if comment is None or self.read_manifest(self._get_version_dir(subject, version))['comment'] == comment
+        ]
+        if not versions:
+            return None
+        promoted = self.get_promoted(subject)
+        return self._get_version_dir(subject, promoted if promoted in versions else versions[-1])
+
+    def load(self, path: Path) -> tuple[LinearModel, dict[str, Any]]:
+        manifest = self.read_manifest(path)
+        weights_path = path / manifest['model']['weights']
+        if self._get_checksum(weights_path) != manifest['model']['weights_sha256']:
+            raise ValueError(f"ModelRegistry: {weights_path} does not match its manifest checksum")
+
+        weights = np.load(weights_path, mmap_mode='r', allow_pickle=False)
+        if weights.shape != (manifest['model']['features_count'],):
+            raise ValueError(f"ModelRegistry: {weights_path} has {weights.shape} weights, {manifest['model']['features_count']} expected")
+        linear_model = LinearModel(weights, manifest['model']['bias'], manifest['model']['score_min'], manifest['model']['score_max'])
+        return linear_model, manifest
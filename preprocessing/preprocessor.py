@@ -1,13 +1,19 @@
 from functools import partial
-import re
-from typing import Any, Sequence
+from pathlib import Path
+from typing import Any
 import mne
 import numpy as np
 from numpy import ndarray
 import pandas as pd
 from datetime import datetime
+import time
 
+from preprocessing.artifacts import ArtifactAnnotator
+from preprocessing.cache import ArrayCache
+from preprocessing.catalog import SessionCatalog, get_preprocessed_path
+from preprocessing.filters import filter_data
 from preprocessing.settings import NON_TARGET_MARKER, TARGET_MARKER, PreprocessorSettings
+from speller.data_aquisition.record_file import RECORD_HEADERS, RecordReader, parse_record_meta
 from speller.settings import FilesSettings
 
 
@@ -22,25 +28,44 @@ class Preprocessor:
     def __init__(self, settings: PreprocessorSettings, files_settings: FilesSettings):
         self._settings = settings
         self._files_settings = files_settings
+        self._catalog = SessionCatalog(files_settings)
+        self._cache = ArrayCache(files_settings)
+        self._artifact_annotator = ArtifactAnnotator(settings)
 
     @staticmethod
-    def _get_target_from_filename(filename: str) -> int:
-        return int(re.search('target=(\d+)', filename).group(1))
-    
-    @staticmethod
-    def _calculate_marker(target: int, row: Any) -> int:
-        if row['FLASH'] == 1:
-            if row['ITEM'] == target:
-                return TARGET_MARKER
-            return NON_TARGET_MARKER
-        return 0
+    def _get_markers(number_of_samples: int, flash_indexes: ndarray, items: ndarray, target: int) -> ndarray:
+        markers = np.zeros(number_of_samples)
+        markers[flash_indexes] = np.where(items == target, TARGET_MARKER, NON_TARGET_MARKER)
+        return markers
 
     def _read_file(self, src_file: str) -> ndarray:
-        data = pd.read_csv(src_file)
-        target = self._get_target_from_filename(src_file)
+        if Path(src_file).suffix == '.csv':
+            return self._read_csv_file(src_file)
+
+        record = RecordReader(Path(src_file))
+        markers = self._get_markers(record.samples_count, record.events['index'], record.events['item'], record.meta['target'])
+        return np.vstack([record.read().transpose(), markers])
+
+    def _read_csv_file(self, src_file: str) -> ndarray:
+        target = parse_record_meta(src_file)['target']
+
+        eeg_columns = RECORD_HEADERS[:-2]
+        dtypes = {**{column: np.float32 for column in eeg_columns}, 'FLASH': np.int8, 'ITEM': np.int16}
+        chunks = pd.read_csv(src_file, usecols=RECORD_HEADERS, dtype=dtypes, chunksize=self._settings.csv_chunk_size_rows)
+
+        samples, flash_indexes, items = [], [], []
+        offset = 0
+        for chunk in chunks:
+            samples.append(chunk[eeg_columns].to_numpy().transpose())
+            chunk_flash_indexes = np.flatnonzero(chunk['FLASH'].to_numpy() == 1)
+            flash_indexes.append(chunk_flash_indexes + offset)
+            items.append(chunk['ITEM'].to_numpy()[chunk_flash_indexes])
+            offset += len(chunk)
 
-        data['EVENT_MARKER'] = data.apply(partial(self._calculate_marker, target), axis=1)
-        return data[['EEG 1', 'EEG 2', 'EEG 3', 'EEG 4', 'EEG 5', 'EEG 6', 'EEG 7', 'EEG 8', 'EVENT_MARKER']].to_numpy().transpose()
+        eeg_data = np.empty((len(eeg_columns) + 1, offset))
+        np.concatenate(samples, axis=1, out=eeg_data[:-1])
+        eeg_data[-1] = self._get_markers(offset, np.concatenate(flash_indexes), np.concatenate(items), target)
+        return eeg_data
     
     @classmethod
     def _create_info(cls) -> mne.Info:
@@ -48,11 +73,26 @@ class Preprocessor:
         info.set_montage("standard_1020")
         return info
     
-    def _preprocess(self, raw: mne.io.RawArray) -> mne.io.RawArray:
-        raw.crop(tmin=self._settings.crop_time_s)  # DATA LOSS
-        raw.apply_function(lambda x: x * self._ORIGIN_UNITS_TO_VOLTS_FACTOR)
+    def _filter(self, raw: mne.io.RawArray) -> None:
+        if self._settings.filter_method != 'mne':
+            # causal is the filter the acquisition runs online, applied over the whole record
+            raw.apply_function(partial(filter_data, settings=self._settings), channel_wise=False)  # DATA LOSS
+            return
         raw.filter(l_freq=self._settings.lower_passband_frequency, h_freq=self._settings.upper_passband_frequency)  # DATA LOSS
         raw.notch_filter(freqs=50, method='spectrum_fit', filter_length=self._settings.notch_filter_length)  # DATA LOSS
+
+    def _preprocess(self, raw: mne.io.RawArray, annotate: bool = False) -> mne.io.RawArray:
+        raw.crop(tmin=self._settings.crop_time_s)  # DATA LOSS
+        raw.apply_function(lambda x: x * self._ORIGIN_UNITS_TO_VOLTS_FACTOR)
+        unfiltered = raw.get_data(picks='eeg') if annotate else None
+        self._filter(raw)
+
+        if annotate:
+            report = self._artifact_annotator.annotate(raw, unfiltered)  # DATA LOSS (annotate 'bad')
+            print(
+                f"Rejected {report['rejected_s']:.1f}s ({report['rejected_ratio']:.1%}) of {report['duration_s']:.1f}s: "
+                + ', '.join(f"{kind} {report[f'{kind}_s']:.1f}s" for kind in self._artifact_annotator.ARTIFACT_KINDS)
+            )
         return raw
     
     def _annotate(self, raw: mne.io.RawArray) -> mne.io.RawArray:
@@ -60,25 +100,48 @@ class Preprocessor:
         return raw
 
     def preprocess(self, src_file: str, silent: bool = False, save: bool = True) -> mne.io.RawArray:
-        eeg_data = self._read_file(src_file)
         info = self._create_info()
 
-        raw = mne.io.RawArray(eeg_data, info)
-        raw = self._preprocess(raw)
+        settings = self._settings.model_dump(exclude={'csv_chunk_size_rows'})
+        key = self._cache.get_key('preprocess', self._cache.get_file_checksum(src_file), settings)
+        cached = self._cache.get(key) if silent else None  # manual annotations are not reproducible
+        if cached is not None and 'first_samp' in cached:  # annotation onsets count from the first sample kept by the crop
+            raw = mne.io.RawArray(cached['data'], info, first_samp=int(cached['first_samp']))
+            onsets = cached['onsets'] - raw.first_time  # set_annotations counts onsets from the first sample without a measurement date
+            raw.set_annotations(mne.Annotations(onsets, cached['durations'], cached['descriptions']))
+        else:
+            raw = mne.io.RawArray(self._read_file(src_file), info)
+            raw = self._preprocess(raw, annotate=self._settings.annotate_artifacts)  # reviewed below unless silent
+            if silent:
+                annotations = raw.annotations
+                self._cache.put(
+                    key,
+                    data=raw.get_data(),
+                    first_samp=np.asarray(raw.first_samp),
+                    onsets=annotations.onset,
+                    durations=annotations.duration,
+                    descriptions=np.asarray(annotations.description, dtype=str),
+                )
+
         if not silent:
             raw = self._annotate(raw)
 
         if save:
             time_str = datetime.now().strftime(self._files_settings.time_format)
-            filename = src_file + f'__[PREPROCESSED]__{time_str}__eeg.fif'
-            raw.save(filename.replace('\\raw\\', '\\preprocessed\\'))
+            filename = get_preprocessed_path(Path(src_file), time_str)
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            raw.save(filename)
+            self._catalog.add_preprocessed(filename, Path(src_file))
 
         return raw
     
-    def preprocess_samples(self, samples: Sequence[Sequence[float]]) -> Sequence[Sequence[float]]:
-        samples = np.array(samples)
-        samples *= self._ORIGIN_UNITS_TO_VOLTS_FACTOR
-        samples = samples.transpose()
+    def preprocess_samples(self, samples: np.ndarray, filtered: bool = False) -> np.ndarray:
+        if filtered:
+            return np.multiply(samples, self._ORIGIN_UNITS_TO_VOLTS_FACTOR, dtype=np.float64)
+
+        samples = np.multiply(samples.transpose(), self._ORIGIN_UNITS_TO_VOLTS_FACTOR, dtype=np.float64)  # MNE filters float64 only
+        if self._settings.filter_method != 'mne':
+            return filter_data(samples, self._settings).transpose()
 
         samples = mne.filter.filter_data(
             samples,
@@ -94,5 +157,32 @@ class Preprocessor:
             filter_length=self._settings.notch_filter_length,
         )
         
-        samples = samples.transpose()
-        return samples.tolist()
+        return samples.transpose()
+
+    def compare_filters(self, src_file: str, edge_s: float = 10.) -> dict[str, Any]:
+        eeg_data = self._read_file(src_file)
+
+        outputs, durations = {}, {}
+        for method in ('mne', self._settings.filter_method):
+            preprocessor = Preprocessor(self._settings.model_copy(update={'filter_method': method}), self._files_settings)
+            start_time = time.perf_counter()
+            raw = preprocessor._preprocess(mne.io.RawArray(eeg_data.copy(), self._create_info()))
+            durations[method] = time.perf_counter() - start_time
+            outputs[method] = raw.get_data(picks='eeg')
+
+        edge = int(edge_s * self._FREQUENCY) if eeg_data.shape[1] > 4 * edge_s * self._FREQUENCY else 0  # skip edge effects
+        reference = outputs['mne'][:, edge: eeg_data.shape[1] - edge]
+        error = outputs[self._settings.filter_method][:, edge: eeg_data.shape[1] - edge] - reference
+
+        report = {
+            'method': self._settings.filter_method,
+            'mne_time_s': durations['mne'],
+            'time_s': durations[self._settings.filter_method],
+            'max_abs_error_uv': float(np.abs(error).max()) / self._ORIGIN_UNITS_TO_VOLTS_FACTOR,
+            'relative_rms_error': float(np.sqrt(np.mean(error ** 2) / np.mean(reference ** 2))),
+        }
+        print(
+            f"{report['method']} filter: {report['time_s']:.2f}s vs MNE {report['mne_time_s']:.2f}s, "
+            f"max error {report['max_abs_error_uv']:.3f}uV, relative RMS error {report['relative_rms_error']:.2%}"
+        )
+        return report
@@ -1,10 +1,13 @@
 from functools import cached_property
+from typing import Literal
 from pydantic_settings import BaseSettings
 
 
 TARGET_MARKER = 7
 NON_TARGET_MARKER = 2
 
+FEATURE_SETTINGS_FIELDS = {'feature_start_ms', 'feature_end_ms', 'feature_window_samples'}  # ModelSettings shared online
+
 
 class PreprocessorSettings(BaseSettings):
     crop_time_s: float = 0.
@@ -12,6 +15,24 @@ class PreprocessorSettings(BaseSettings):
     upper_passband_frequency: float = 15.
     notch_filter_length: str = "10s"
 
+    # causal filters online as samples arrive, iir (zero-phase) and fir (FFT overlap-add) are fast offline engines,
+    # models must be fitted with the method used online, the speller refuses a registered model fitted with another one
+    # offline causal runs over a record of concatenated sequences, its state at the joins is not the online one
+    filter_method: Literal['mne', 'causal', 'iir', 'fir'] = 'mne'
+    filter_order: int = 4
+    notch_quality: float = 30.
+
+    csv_chunk_size_rows: int = 250_000
+
+    # silent preprocessing annotates bad_ spans automatically: a sliding window is bad if any channel exceeds a limit
+    annotate_artifacts: bool = True
+    artifact_window_ms: int = 500
+    artifact_step_ms: int = 100
+    artifact_max_peak_to_peak_uv: float = 150.  # filtered, blinks and movements
+    artifact_min_peak_to_peak_uv: float = 0.5  # unfiltered, flat or disconnected electrode
+    artifact_max_step_uv: float = 100.  # unfiltered, between two samples
+    artifact_max_hf_ratio: float = 5.  # unfiltered high-frequency RMS over its median on the channel, muscle bursts
+
 
 class EpochCollectorSettings(BaseSettings):
     epoch_pre_time_ms: int = -200
@@ -33,7 +54,11 @@ class EpochCollectorSettings(BaseSettings):
 
 
 class ModelSettings(BaseSettings):
-    downsample_freq: int | None = None
+    # features are means of feature_window_samples consecutive samples from feature_start_ms to feature_end_ms
+    # after the onset (the whole epoch if None), the same offline and online
+    feature_start_ms: int | None = None
+    feature_end_ms: int | None = None
+    feature_window_samples: int = 1
     data_proportion: float = 1
     test_proportion: float = 0.2
     random_seed: int = 0
@@ -41,4 +66,9 @@ class ModelSettings(BaseSettings):
     classifier__C: float = 0.1
     classifier__kernel: str = 'linear'
 
+    # scores are log-likelihood ratios from calibrated probabilities, 'none' leaves raw SVC margins
+    calibration: Literal['sigmoid', 'isotonic', 'none'] = 'sigmoid'
+    calibration_folds: int = 3
+    probability_clip: float = 1e-3  # bounds the evidence of a single epoch
+
     
@@ -3,38 +3,78 @@ import logging
 import os
 from pathlib import Path
 import pickle
-from random import random
-from typing import Sequence
+from random import gauss
+from typing import TYPE_CHECKING, Sequence
 
 import numpy as np
-from sklearn.svm import SVC
 
+from preprocessing.features import FeatureExtractor
 from preprocessing.files import find_model_file
-from preprocessing.model import ClassifierModel, Model
-from speller.data_aquisition.data_collector import DataSampleType
-from speller.data_aquisition.epoch_getter import EpochType
+from preprocessing.linear_model import LinearModel, get_compiled_model_path
+from preprocessing.model_registry import ModelRegistry
+from preprocessing.settings import FEATURE_SETTINGS_FIELDS, ModelSettings, PreprocessorSettings
 from speller.settings import FilesSettings
 
+if TYPE_CHECKING:
+    from preprocessing.model import ClassifierModel
+
 
 logger = logging.getLogger(__name__)
 
 
 class IClassifier(abc.ABC):
     @abc.abstractmethod
-    def classify(self, epochs: np.ndarray) -> list[float]:  # returns bools or probabilities
+    def classify(self, epochs: np.ndarray) -> list[float]:  # returns log-likelihood ratios of target vs non-target
         pass
 
 
 class StubClassifier(IClassifier):
     def classify(self, epochs: np.ndarray) -> list[float]:
         logger.debug("StubClassifier: called classify()")
-        return [1 if random() >= 0.5 else 0 for _ in epochs]
+        return [gauss(0, 1) for _ in epochs]
     
 
 class Classifier(IClassifier):
-    def __init__(self, files_settings: FilesSettings, model: Model):
+    def __init__(
+        self,
+        files_settings: FilesSettings,
+        preprocessor_settings: PreprocessorSettings,
+        model_settings: ModelSettings,
+        feature_extractor: FeatureExtractor,
+    ):
         self._files_settings = files_settings
-        self._clf_model = model.load(find_model_file(self._files_settings))
+        self._preprocessor_settings = preprocessor_settings
+        self._model_settings = model_settings
+        self._feature_extractor = feature_extractor
+        self._clf_model = self._load()
+
+    def _load_registered(self, registry: ModelRegistry, path: Path) -> LinearModel:
+        linear_model, manifest = registry.load(path)
+        feature_settings = self._model_settings.model_dump(include=FEATURE_SETTINGS_FIELDS)
+        if manifest['features'] != feature_settings:
+            raise ValueError(f"Classifier: {path} was trained on {manifest['features']} features, not {feature_settings}")
+        filter_method = manifest['settings'].get('preprocessor', {}).get('filter_method', 'mne')  # models before filter methods
+        if filter_method != self._preprocessor_settings.filter_method:
+            raise ValueError(f"Classifier: {path} was trained on {filter_method} filtered data, not {self._preprocessor_settings.filter_method}")
+        logger.info("Classifier: using registered %s", path)
+        return linear_model
+
+    def _load(self) -> 'ClassifierModel | LinearModel':
+        registry = ModelRegistry(self._files_settings)
+        path = registry.find(self._files_settings.clf_name, self._files_settings.clf_comment)
+        if path is not None:
+            return self._load_registered(registry, path)
+
+        filename = find_model_file(self._files_settings)  # models saved before the registry
+        if self._preprocessor_settings.filter_method != 'mne':
+            logger.warning("Classifier: %s keeps no filter method, check it was trained on %s filtered data", filename, self._preprocessor_settings.filter_method)
+        compiled_filename = get_compiled_model_path(filename)
+        if compiled_filename.exists():
+            logger.info("Classifier: using compiled %s", compiled_filename)
+            return LinearModel.load(compiled_filename)  # nothing to unpickle, scores with one dot product
+
+        from preprocessing.model import Model  # sklearn is only needed for models never compiled
+        return Model(self._model_settings, self._files_settings, self._feature_extractor).load(filename)
 
     def classify(self, epochs: np.ndarray) -> list[float]:
         logger.debug("Classifier: called classify()")
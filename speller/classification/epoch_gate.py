@@ -0,0 +1,41 @@
+import abc
+import logging
+
+import numpy as np
+
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT
+from speller.settings import EpochGateSettings
+
+
+logger = logging.getLogger(__name__)
+
+
+_UV_TO_VOLTS_FACTOR = 1e-6
+
+
+class IEpochGate(abc.ABC):
+    @abc.abstractmethod
+    def get_weights(self, samples: np.ndarray, starts: np.ndarray, size: int) -> np.ndarray:
+        pass
+
+
+class EpochGate(IEpochGate):
+    def __init__(self, settings: EpochGateSettings):
+        self._settings = settings
+
+    def get_weights(self, samples: np.ndarray, starts: np.ndarray, size: int) -> np.ndarray:
+        # samples: (number_of_samples, EEG_CHANNELS_COUNT) filtered stream in volts, epochs of size samples at starts
+        # -> weight of each epoch, the limits apply to the epoch samples, not to the features extracted from them
+        weights = np.ones(len(starts))
+        if not self._settings.enabled or not len(starts):
+            return weights
+
+        epochs = np.lib.stride_tricks.sliding_window_view(samples[:, :EEG_CHANNELS_COUNT], size, axis=0)[starts]  # (epochs, channels, size)
+        rejected = (
+            (np.ptp(epochs, axis=-1) > self._settings.max_peak_to_peak_uv * _UV_TO_VOLTS_FACTOR)
+            | (np.var(epochs, axis=-1) > self._settings.max_variance_uv2 * _UV_TO_VOLTS_FACTOR ** 2)
+            | (np.abs(np.diff(epochs, axis=-1)).max(axis=-1) > self._settings.max_gradient_uv * _UV_TO_VOLTS_FACTOR)
+        ).any(axis=-1)  # one bad channel rejects the epoch
+
+        weights[rejected] = self._settings.rejected_weight
+        return weights
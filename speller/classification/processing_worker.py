@@ -0,0 +1,252 @@
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+import time
+import traceback
+from typing import Any
+
+import numpy as np
+
+from preprocessing.features import FeatureExtractor
+from preprocessing.preprocessor import Preprocessor
+from preprocessing.settings import EpochCollectorSettings, ModelSettings, PreprocessorSettings
+from speller.classification.classifier import Classifier, IClassifier
+from speller.classification.epoch_gate import EpochGate
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT, SAMPLES_DTYPE, SamplesBlockType
+from speller.data_aquisition.epochs_builder import EpochsBuilder, IEpochsBuilder
+from speller.settings import EpochGateSettings, FilesSettings, StrategySettings, WorkerSettings
+
+
+logger = logging.getLogger(__name__)
+
+
+class SharedArray:
+    def __init__(self, shape: tuple[int, ...], dtype: Any, name: str | None = None):
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * self.dtype.itemsize)
+        self._shm = SharedMemory(name=name, create=name is None, size=size)
+        self.array = np.ndarray(shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def fits(self, shape: tuple[int, ...]) -> bool:
+        return shape[1:] == self.shape[1:] and shape[0] <= self.shape[0]
+
+    def close(self, unlink: bool = False) -> None:
+        del self.array
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+class _WorkerState:
+    def __init__(self, epochs_builder: EpochsBuilder, classifier: Classifier):
+        self._epochs_builder = epochs_builder
+        self._classifier = classifier
+        self._arrays: dict[str, SharedArray] = {}
+
+    def _attach(self, name: str, shape: tuple[int, ...], dtype: Any) -> np.ndarray:
+        array = self._arrays.get(name)
+        if array is None or array.shape != shape:
+            if array is not None:
+                array.close()
+            array = self._arrays[name] = SharedArray(shape, dtype, name)
+        return array.array
+
+    def _forget(self, names: set[str]) -> None:
+        for name in list(self._arrays.keys() - names):
+            self._arrays.pop(name).close()
+
+    def build(
+        self,
+        samples: tuple[str, tuple[int, ...]],
+        epochs: tuple[str, tuple[int, ...]],
+        number_of_samples: int,
+        starts: np.ndarray,
+        padding: int,
+        filtered: bool,
+    ) -> tuple[tuple[int, ...], np.ndarray]:
+        self._forget({samples[0], epochs[0]})
+        samples_array = self._attach(*samples, SAMPLES_DTYPE)
+        epochs_array = self._attach(*epochs, np.float64)
+
+        result, weights = self._epochs_builder.build(samples_array[:number_of_samples], starts, padding, filtered, out=epochs_array[:len(starts)])
+        return result.shape, weights
+
+    def classify(self, epochs: tuple[str, tuple[int, ...]], scores: tuple[str, tuple[int, ...]], start: int, number_of_epoches: int) -> int:
+        epochs_array = self._attach(*epochs, np.float64)
+        scores_array = self._attach(*scores, np.float64)
+
+        result = self._classifier.classify(epochs_array[start: start + number_of_epoches])
+        scores_array[:len(result)] = result
+        return len(result)
+
+
+def _run_worker(
+    connection: Connection,
+    preprocessor_settings: PreprocessorSettings,
+    epoch_collector_settings: EpochCollectorSettings,
+    model_settings: ModelSettings,
+    strategy_settings: StrategySettings,
+    files_settings: FilesSettings,
+    epoch_gate_settings: EpochGateSettings,
+) -> None:
+    try:
+        feature_extractor = FeatureExtractor(model_settings, epoch_collector_settings)
+        epochs_builder = EpochsBuilder(
+            Preprocessor(preprocessor_settings, files_settings), feature_extractor, EpochGate(epoch_gate_settings), strategy_settings,
+        )
+        classifier = Classifier(files_settings, preprocessor_settings, model_settings, feature_extractor)
+        state = _WorkerState(epochs_builder, classifier)
+    except Exception:
+        connection.send(('error', traceback.format_exc()))
+        return
+    connection.send(('ok', None))
+
+    while True:
+        command, kwargs = connection.recv()
+        if command == 'stop':
+            return
+        try:
+            connection.send(('ok', getattr(state, command)(**kwargs)))
+        except Exception:
+            connection.send(('error', traceback.format_exc()))
+
+
+class ProcessingWorker:
+    _POLL_INTERVAL_S = 0.1
+
+    def __init__(
+        self,
+        settings: WorkerSettings,
+        preprocessor_settings: PreprocessorSettings,
+        epoch_collector_settings: EpochCollectorSettings,
+        model_settings: ModelSettings,
+        strategy_settings: StrategySettings,
+        files_settings: FilesSettings,
+        epoch_gate_settings: EpochGateSettings,
+    ):
+        self._settings = settings
+        feature_extractor = FeatureExtractor(model_settings, epoch_collector_settings)
+        self._epoch_size = feature_extractor.get_features_count(EEG_CHANNELS_COUNT, strategy_settings.epoch_size_samples)
+
+        self._samples = SharedArray((self._settings.initial_samples_capacity, EEG_CHANNELS_COUNT), SAMPLES_DTYPE)
+        self._epochs = SharedArray((self._settings.initial_epochs_capacity, self._epoch_size), np.float64)
+        self._inputs = SharedArray((self._settings.initial_epochs_capacity, self._epoch_size), np.float64)  # epochs not built here
+        self._scores = SharedArray((self._settings.initial_epochs_capacity,), np.float64)
+
+        context = multiprocessing.get_context('spawn')  # the parent runs Tk and acquisition threads, do not fork them
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(
+            target=_run_worker,
+            args=(
+                child_connection, preprocessor_settings, epoch_collector_settings, model_settings, strategy_settings, files_settings,
+                epoch_gate_settings,
+            ),
+            daemon=True,
+        )
+        self._process.start()
+        self._receive()
+        logger.info("ProcessingWorker: started process %s", self._process.pid)
+
+    def _receive(self) -> Any:
+        deadline = time.monotonic() + self._settings.timeout_s
+        while not self._connection.poll(self._POLL_INTERVAL_S):
+            if not self._process.is_alive():
+                raise RuntimeError(f"ProcessingWorker: worker exited with code {self._process.exitcode}")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"ProcessingWorker: no response in {self._settings.timeout_s}s")
+        status, result = self._connection.recv()
+        if status == 'error':
+            raise RuntimeError(f"ProcessingWorker: worker failed\n{result}")
+        return result
+
+    def _call(self, command: str, **kwargs: Any) -> Any:
+        self._connection.send((command, kwargs))
+        return self._receive()
+
+    @staticmethod
+    def _ensure_capacity(shared: SharedArray, shape: tuple[int, ...]) -> SharedArray:
+        if shared.fits(shape):
+            return shared
+        capacity = max(shape[0], 2 * shared.shape[0])
+        new_shared = SharedArray((capacity, *shape[1:]), shared.dtype)
+        shared.close(unlink=True)
+        return new_shared
+
+    def build(self, samples: SamplesBlockType, starts: np.ndarray, padding: int, filtered: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        self._samples = self._ensure_capacity(self._samples, samples.shape)
+        self._epochs = self._ensure_capacity(self._epochs, (len(starts), self._epoch_size))
+        self._samples.array[:len(samples)] = samples
+
+        shape, weights = self._call(
+            'build',
+            samples=(self._samples.name, self._samples.shape),
+            epochs=(self._epochs.name, self._epochs.shape),
+            number_of_samples=len(samples),
+            starts=starts,
+            padding=padding,
+            filtered=filtered,
+        )
+        return self._epochs.array[:shape[0]], weights  # epochs valid until the next build
+
+    def _get_built_start(self, epochs: np.ndarray) -> int | None:
+        # first row of epochs within the build output if they are consecutive rows of it, None otherwise
+        built = self._epochs.array
+        if epochs.dtype != built.dtype or epochs.shape[1:] != built.shape[1:] or not epochs.flags.c_contiguous:
+            return None
+        if not np.shares_memory(epochs, built):
+            return None
+        offset = epochs.__array_interface__['data'][0] - built.__array_interface__['data'][0]
+        return offset // built[0].nbytes if offset % built[0].nbytes == 0 else None
+
+    def classify(self, epochs: np.ndarray) -> list[float]:
+        start = self._get_built_start(epochs)
+        if start is None:
+            shared = self._inputs = self._ensure_capacity(self._inputs, epochs.shape)  # the build output stays intact
+            shared.array[:len(epochs)] = epochs
+            start = 0
+        else:
+            shared = self._epochs  # no copy
+        self._scores = self._ensure_capacity(self._scores, (len(epochs),))
+
+        number_of_scores = self._call(
+            'classify',
+            epochs=(shared.name, shared.shape),
+            scores=(self._scores.name, self._scores.shape),
+            start=start,
+            number_of_epoches=len(epochs),
+        )
+        return self._scores.array[:number_of_scores].tolist()
+
+    def stop(self) -> None:
+        if self._process.is_alive():
+            self._connection.send(('stop', {}))
+            self._process.join(self._settings.timeout_s)
+        if self._process.is_alive():
+            logger.warning("ProcessingWorker: process %s did not stop in %ss, terminating it", self._process.pid, self._settings.timeout_s)
+            self._process.terminate()
+            self._process.join()
+        for shared in (self._samples, self._epochs, self._inputs, self._scores):
+            shared.close(unlink=True)
+
+
+class WorkerEpochsBuilder(IEpochsBuilder):
+    def __init__(self, worker: ProcessingWorker):
+        self._worker = worker
+
+    def build(self, samples: SamplesBlockType, starts: np.ndarray, padding: int, filtered: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        return self._worker.build(samples, starts, padding, filtered)
+
+
+class WorkerClassifier(IClassifier):
+    def __init__(self, worker: ProcessingWorker):
+        self._worker = worker
+
+    def classify(self, epochs: np.ndarray) -> list[float]:
+        logger.debug("WorkerClassifier: called classify()")
+        return self._worker.classify(epochs)
@@ -0,0 +1,119 @@
+import abc
+import logging
+from threading import Event, Thread
+import time
+from typing import Sequence
+
+import numpy as np
+
+from preprocessing.filters import StreamingFilter
+from preprocessing.settings import PreprocessorSettings
+from speller.data_aquisition.data_collector import IDataCollector, SamplesBlockType
+from speller.data_aquisition.health import AcquisitionHealth
+from speller.data_aquisition.ring_buffer import SamplesOverwrittenError, SamplesRingBuffer
+from speller.settings import AcquisitionSettings
+
+
+logger = logging.getLogger(__name__)
+
+
+class IAcquisition(abc.ABC):
+    @abc.abstractmethod
+    def start(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def stop(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    def time_to_index(self, t: float) -> int:
+        pass
+
+    @abc.abstractmethod
+    def times_to_indexes(self, times: Sequence[float]) -> np.ndarray:
+        pass
+
+    @abc.abstractmethod
+    def get_samples(self, start: int, stop: int) -> SamplesBlockType:
+        pass
+
+    @abc.abstractmethod
+    def get_filtered_samples(self, start: int, stop: int) -> SamplesBlockType:
+        pass
+
+
+class BackgroundAcquisition(IAcquisition):
+    def __init__(
+        self,
+        data_collector: IDataCollector,
+        settings: AcquisitionSettings,
+        preprocessor_settings: PreprocessorSettings,
+        health: AcquisitionHealth,
+    ):
+        self._data_collector = data_collector
+        self._settings = settings
+        self._health = health
+
+        self._buffer = SamplesRingBuffer(
+            self._settings.buffer_length_samples,
+            self._settings.drift_window_samples // self._settings.block_size_samples,
+        )
+        self._filter: StreamingFilter | None = None
+        self._filtered_buffer: SamplesRingBuffer | None = None
+        if preprocessor_settings.filter_method == 'causal':
+            self._filter = StreamingFilter(preprocessor_settings)
+            self._filtered_buffer = SamplesRingBuffer(self._settings.buffer_length_samples)
+        self._stop_event = Event()
+        self._thread: Thread | None = None
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        logger.info("BackgroundAcquisition: start")
+        self._stop_event.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self._thread:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        logger.info("BackgroundAcquisition: stopped")
+
+    def _run(self) -> None:
+        try:
+            call_time = time.monotonic()
+            for samples in self._data_collector.collect_continuously(self._settings.block_size_samples, self._stop_event):
+                receive_time = time.monotonic()
+                if self._filter is not None:
+                    self._filtered_buffer.write(self._filter.process(samples), receive_time)  # before raw, readers wait on raw
+                self._buffer.write(samples, receive_time)
+                self._health.record_block(self._settings.block_size_samples, len(samples), call_time, receive_time)
+                call_time = time.monotonic()
+        except Exception:
+            logger.exception("BackgroundAcquisition: acquisition failed")
+            raise
+
+    def time_to_index(self, t: float) -> int:
+        return int(self.times_to_indexes([t])[0])
+
+    def times_to_indexes(self, times: Sequence[float]) -> np.ndarray:
+        self._buffer.wait(1, self._settings.stall_timeout_s)
+        return self._buffer.times_to_indexes(np.asarray(times) + self._settings.latency_ms / 1000)
+
+    def get_samples(self, start: int, stop: int) -> SamplesBlockType:
+        try:
+            samples = self._buffer.read(start, stop, self._settings.stall_timeout_s)
+        except SamplesOverwrittenError:
+            self._health.record_overrun()
+            raise
+        self._health.record_read(self._buffer.written - stop)  # samples that arrived before the consumer got here
+        return samples
+
+    def get_filtered_samples(self, start: int, stop: int) -> SamplesBlockType:
+        if self._filtered_buffer is None:
+            raise RuntimeError("BackgroundAcquisition: causal filtering is disabled")
+        return self._filtered_buffer.read(start, stop, self._settings.stall_timeout_s)
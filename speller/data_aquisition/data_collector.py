@@ -1,13 +1,13 @@
 import abc
-from collections import deque
 from contextlib import contextmanager
 import logging
-import random
 from threading import Event
 import time
-from typing import Iterator, Sequence, cast
+from typing import Iterator, cast
 
-from pkg_resources import yield_lines
+import numpy as np
+
+from speller.data_aquisition.health import AcquisitionHealth
 from speller.settings import StubDataCollectorSettings, UnicornDataCollectorSettings
 from unapi import Unicorn
 
@@ -15,45 +15,44 @@ from unapi import Unicorn
 logger = logging.getLogger(__name__)
 
 
-DataSampleType = Sequence[float]
+EEG_CHANNELS_COUNT = 8
+SAMPLES_DTYPE = np.float32
+
+DataSampleType = np.ndarray  # (EEG_CHANNELS_COUNT,)
+SamplesBlockType = np.ndarray  # (number_of_samples, EEG_CHANNELS_COUNT), SAMPLES_DTYPE
 
 
 class IDataCollector(abc.ABC):
     @abc.abstractmethod
-    def collect(self, number_of_samples: int) -> Iterator[DataSampleType]:
+    def collect(self, number_of_samples: int) -> SamplesBlockType:
         pass
 
     @abc.abstractmethod
-    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[list[DataSampleType]]:
+    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[SamplesBlockType]:
         pass
 
 
 class StubDataCollector(IDataCollector):
     def __init__(self, settings: StubDataCollectorSettings):
         self._settings = settings
+        self._rng = np.random.default_rng()
 
-    @staticmethod
-    def _get_random_sample() -> DataSampleType:
-        sample = []
-        for _ in range(8):
-            sample.append(random.random())
-        return sample
-
-    def collect(self, number_of_samples: int) -> Iterator[DataSampleType]:
+    def collect(self, number_of_samples: int) -> SamplesBlockType:
         time.sleep(self._settings.ms_per_sample * number_of_samples / 1000)
-        for _ in range(number_of_samples):
-            yield self._get_random_sample()
+        return self._rng.random((number_of_samples, EEG_CHANNELS_COUNT), dtype=SAMPLES_DTYPE)
 
-    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[list[DataSampleType]]:
+    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[SamplesBlockType]:
         while not shutdown_event.is_set():
-            yield list(self.collect(number_of_samples))
+            yield self.collect(number_of_samples)
 
 
 class UnicornDataCollector(IDataCollector): 
     _NAMES_OF_EEG_CHANNELS = [f'EEG {i}' for i in range(1, 9)]
+    _COUNTER_CHANNEL_NAME = 'Counter'
 
-    def __init__(self, settings: UnicornDataCollectorSettings):
+    def __init__(self, settings: UnicornDataCollectorSettings, health: AcquisitionHealth):
         self._settings = settings
+        self._health = health
         self.handle_id = None
         
         self.bci = Unicorn()
@@ -69,6 +68,15 @@ class UnicornDataCollector(IDataCollector):
 
         channel_name_to_index = {channel.name.decode(): channel.index for channel in self.config.channels}
         self.eeg_indexes = [channel_name_to_index[name] for name in self._NAMES_OF_EEG_CHANNELS]
+        self._eeg_selector = self._get_eeg_selector(self.eeg_indexes)
+        self._counter_index = channel_name_to_index.get(self._COUNTER_CHANNEL_NAME)
+
+    @staticmethod
+    def _get_eeg_selector(eeg_indexes: list[int]) -> slice | list[int]:
+        first = eeg_indexes[0]
+        if eeg_indexes == list(range(first, first + len(eeg_indexes))):
+            return slice(first, first + len(eeg_indexes))  # basic slicing keeps the batch a view
+        return eeg_indexes
 
     @contextmanager
     def _start_acquisition(self) -> Iterator[None]:
@@ -76,37 +84,29 @@ class UnicornDataCollector(IDataCollector):
         yield
         self.bci.stopAcquisition(self.handle_id)
 
-    def _eeg_sample(self, sample: DataSampleType) -> DataSampleType:
-        return [sample[i] for i in self.eeg_indexes]
-    
-    def collect(self, number_of_samples: int) -> Iterator[DataSampleType]:
+    def _eeg_samples(self, flatten_batch) -> SamplesBlockType:
+        batch = np.asarray(flatten_batch, dtype=SAMPLES_DTYPE).reshape(-1, self.number_of_channels)
+        if self._counter_index is not None:
+            self._health.record_counter(batch[:, self._counter_index])  # float32 keeps the counter exact for ~18h
+        return batch[:, self._eeg_selector]
+
+    def collect(self, number_of_samples: int) -> SamplesBlockType:
         batch_size = self._settings.batch_size
+        samples = np.empty((number_of_samples, EEG_CHANNELS_COUNT), dtype=SAMPLES_DTYPE)
 
         with self._start_acquisition():
-            flatten_batches = deque()
-            for _ in range(number_of_samples // batch_size):
-                flatten_batches.append(self.bci.getData(self.handle_id, batch_size))
-            if size := number_of_samples % batch_size:
-                flatten_batches.append(self.bci.getData(self.handle_id, size))
-
-        for flatten_batch in flatten_batches:
-            for i in range(len(flatten_batch) // self.number_of_channels):
-                sample = flatten_batch[i * self.number_of_channels: (i + 1) * self.number_of_channels]
-                yield self._eeg_sample(sample)
-
-    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[list[DataSampleType]]:
+            for start in range(0, number_of_samples, batch_size):
+                size = min(batch_size, number_of_samples - start)
+                samples[start: start + size] = self._eeg_samples(self.bci.getData(self.handle_id, size))
+
+        return samples
+
+    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[SamplesBlockType]:
         assert number_of_samples <= self._settings.batch_size
 
         with self._start_acquisition():
             while not shutdown_event.is_set():
-                samples = []
-
-                flatten_batch = self.bci.getData(self.handle_id, number_of_samples)
-                for i in range(len(flatten_batch) // self.number_of_channels):
-                    sample = flatten_batch[i * self.number_of_channels: (i + 1) * self.number_of_channels]
-                    samples.append(self._eeg_sample(sample))
-                
-                yield samples
+                yield self._eeg_samples(self.bci.getData(self.handle_id, number_of_samples))
 
     def __del__(self):
         if self.handle_id:
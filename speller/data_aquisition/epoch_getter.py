@@ -1,61 +1,71 @@
 import abc
-from itertools import islice
 import logging
-from typing import Iterable, Sequence
+from typing import Sequence
 
-from preprocessing.epoch_collector import EpochCollector
-from preprocessing.preprocessor import Preprocessor
-from speller.data_aquisition.data_collector import DataSampleType, IDataCollector
+import numpy as np
+
+from preprocessing.settings import PreprocessorSettings
+from speller.data_aquisition.acquisition import IAcquisition
+from speller.data_aquisition.epochs_builder import IEpochsBuilder
 from speller.data_aquisition.recorder import IRecorder
-from speller.settings import StrategySettings
+from speller.settings import AcquisitionSettings, StrategySettings, ms_to_samples
 
 
 logger = logging.getLogger(__name__)
 
 
-EpochType = Sequence[DataSampleType]
+EpochType = np.ndarray  # (epoch_size_samples, EEG_CHANNELS_COUNT)
 
 
 class IEpochGetter(abc.ABC):
     @abc.abstractmethod
-    def get_epochs(self, number_of_epoches: int) -> Iterable[EpochType]:
+    def get_epochs(self, onset_times: Sequence[float]) -> tuple[np.ndarray, np.ndarray]:
+        # -> features and weights of the epochs
+        pass
+
+    @abc.abstractmethod
+    def record_samples(self, onset_times: Sequence[float]) -> None:
         pass
 
 
 class EpochGetter(IEpochGetter):
     def __init__(
         self,
-        data_collector: IDataCollector,
+        acquisition: IAcquisition,
         recorder: IRecorder,
         strategy_settings: StrategySettings,
-        preprocessor: Preprocessor,
-        epoch_collector: EpochCollector,
+        acquisition_settings: AcquisitionSettings,
+        preprocessor_settings: PreprocessorSettings,
+        epochs_builder: IEpochsBuilder,
     ):
-        self._data_collector = data_collector
+        self._acquisition = acquisition
         self._strategy_settings = strategy_settings
+        self._acquisition_settings = acquisition_settings
+        self._preprocessor_settings = preprocessor_settings
         self._recorder = recorder
-        self._preprocessor = preprocessor
-        self._epoch_collector = epoch_collector
+        self._epochs_builder = epochs_builder
 
-    def get_epochs(self, number_of_epoches: int) -> Iterable[EpochType]:
-        logger.debug("EpochGetter: start collecting epochs", number_of_epoches)
-        number_of_samples = self._strategy_settings.get_number_of_samples(number_of_epoches)
+    def _get_range(self, onset_times: Sequence[float]) -> tuple[np.ndarray, np.ndarray, int, int]:
+        onsets = self._acquisition.times_to_indexes(onset_times)
+        starts = onsets - ms_to_samples(self._strategy_settings.epoch_baseline_ms)
+        return onsets, starts, starts.min(), starts.max() + self._strategy_settings.epoch_size_samples
 
-        collector = self._data_collector.collect(number_of_samples)
+    def get_epochs(self, onset_times: Sequence[float]) -> tuple[np.ndarray, np.ndarray]:
+        logger.debug("EpochGetter: start collecting %s epochs", len(onset_times))
+        _, starts, first, stop = self._get_range(onset_times)
 
-        samples = list(islice(collector, self._strategy_settings.wait_samples, None))  # block until all samples are received
-        self._recorder.record_samples(samples)
-
-        samples = self._preprocessor.preprocess_samples(samples)
-
-        epochs = []
-        start = 0
-        stop = self._strategy_settings.epoch_size_samples
-        for _ in range(number_of_epoches):
-            epochs.append(samples[start:stop])
-            start += self._strategy_settings.epoch_interval_samples
-            stop += self._strategy_settings.epoch_interval_samples
-        
-        epochs = self._epoch_collector.preprocess_epochs(epochs)
+        if self._preprocessor_settings.filter_method == 'causal':
+            self._acquisition.get_samples(stop - 1, stop)  # block until the last epoch is received
+            filtered_samples = self._acquisition.get_filtered_samples(first, stop)  # filtered while flashing
+            epochs, weights = self._epochs_builder.build(filtered_samples, starts - first, padding=0, filtered=True)
+        else:
+            padding = min(self._acquisition_settings.filter_padding_samples, first)  # filter edge effects fall on the padding
+            samples = self._acquisition.get_samples(first - padding, stop)
+            epochs, weights = self._epochs_builder.build(samples, starts - first, padding)
         logger.debug("EpochGetter: stop collecting epochs")
-        return epochs
+        return epochs, weights
+
+    def record_samples(self, onset_times: Sequence[float]) -> None:
+        # once per sequence, the epochs of a sequence stopped early are collected in several overlapping parts
+        onsets, _, first, stop = self._get_range(onset_times)
+        self._recorder.record_samples(self._acquisition.get_samples(first, stop), onsets - first)
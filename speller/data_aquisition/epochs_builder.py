@@ -0,0 +1,37 @@
+import abc
+
+import numpy as np
+
+from preprocessing.features import FeatureExtractor
+from preprocessing.preprocessor import Preprocessor
+from speller.classification.epoch_gate import IEpochGate
+from speller.data_aquisition.data_collector import SamplesBlockType
+from speller.settings import StrategySettings
+
+
+class IEpochsBuilder(abc.ABC):
+    @abc.abstractmethod
+    def build(self, samples: SamplesBlockType, starts: np.ndarray, padding: int, filtered: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        # -> features and weights of the epochs, the weights gate the filtered epoch samples
+        pass
+
+
+class EpochsBuilder(IEpochsBuilder):
+    def __init__(
+        self,
+        preprocessor: Preprocessor,
+        feature_extractor: FeatureExtractor,
+        epoch_gate: IEpochGate,
+        strategy_settings: StrategySettings,
+    ):
+        self._preprocessor = preprocessor
+        self._feature_extractor = feature_extractor
+        self._epoch_gate = epoch_gate
+        self._strategy_settings = strategy_settings
+
+    def build(
+        self, samples: SamplesBlockType, starts: np.ndarray, padding: int, filtered: bool = False, out: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        samples = self._preprocessor.preprocess_samples(samples, filtered)[padding:]
+        size = self._strategy_settings.epoch_size_samples
+        return self._feature_extractor.extract(samples, starts, size, out), self._epoch_gate.get_weights(samples, starts, size)
@@ -0,0 +1,115 @@
+from threading import Lock
+from typing import Any
+
+import numpy as np
+
+from speller.settings import ms_to_samples, samples_to_ms
+
+
+class AcquisitionHealth:
+    LATENCY_BUCKETS_MS = (2, 5, 10, 20, 50, 100, 200, 500, 1000)  # upper bounds, the last bucket is open
+
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._start_time: float | None = None
+            self._last_time: float | None = None
+            self._blocks = 0
+            self._short_blocks = 0
+            self._samples_requested = 0
+            self._samples_received = 0
+
+            self._last_counter: int | None = None
+            self._counter_gaps = 0
+            self._samples_lost = 0
+
+            self._latency_counts = np.zeros(len(self.LATENCY_BUCKETS_MS) + 1, dtype=np.int64)
+            self._latency_max_ms = 0.
+
+            self._reads = 0
+            self._lag_total_samples = 0
+            self._lag_max_samples = 0
+            self._overruns = 0
+            self._overwritten_samples = 0
+
+    def record_block(self, requested: int, received: int, call_time: float, return_time: float) -> None:
+        latency_ms = (return_time - call_time) * 1000
+        with self._lock:
+            if self._start_time is None:
+                self._start_time = call_time
+            self._last_time = return_time
+            self._blocks += 1
+            self._short_blocks += received < requested
+            self._samples_requested += requested
+            self._samples_received += received
+            self._latency_counts[np.searchsorted(self.LATENCY_BUCKETS_MS, latency_ms)] += 1
+            self._latency_max_ms = max(self._latency_max_ms, latency_ms)
+
+    def record_counter(self, counter: np.ndarray) -> None:
+        if not len(counter):
+            return
+        counter = counter.astype(np.int64)
+        with self._lock:
+            previous = counter[:1] - 1 if self._last_counter is None else [self._last_counter]
+            steps = np.diff(counter, prepend=previous)
+            gaps = steps[steps != 1]
+            self._counter_gaps += len(gaps)
+            self._samples_lost += int((gaps[gaps > 1] - 1).sum())
+            self._last_counter = int(counter[-1])
+
+    def record_read(self, lag_samples: int) -> None:
+        with self._lock:
+            self._reads += 1
+            self._lag_total_samples += lag_samples
+            self._lag_max_samples = max(self._lag_max_samples, lag_samples)
+
+    def record_overrun(self) -> None:
+        with self._lock:
+            self._overruns += 1
+
+    def record_overwritten(self, number_of_samples: int) -> None:
+        with self._lock:
+            self._overwritten_samples += number_of_samples
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            duration_s = (self._last_time - self._start_time) if self._start_time is not None else 0.
+            return {
+                'duration_s': round(duration_s, 3),
+                'blocks': self._blocks,
+                'short_blocks': self._short_blocks,
+                'samples_requested': self._samples_requested,
+                'samples_received': self._samples_received,
+                'samples_expected': int(duration_s * ms_to_samples(1000)),
+                'counter_gaps': self._counter_gaps,
+                'samples_lost': self._samples_lost,
+                'latency_buckets_ms': list(self.LATENCY_BUCKETS_MS),
+                'latency_counts': self._latency_counts.tolist(),
+                'latency_max_ms': round(self._latency_max_ms, 3),
+                'reads': self._reads,
+                'lag_mean_ms': samples_to_ms(self._lag_total_samples) / self._reads if self._reads else 0.,
+                'lag_max_ms': samples_to_ms(self._lag_max_samples),
+                'overruns': self._overruns,
+                'overwritten_samples': self._overwritten_samples,
+            }
+
+    def format(self) -> str:
+        health = self.snapshot()
+        latency_quantile_ms = self._get_latency_quantile_ms(health['latency_counts'], 0.99)
+        return (
+            f"received {health['samples_received']}/{health['samples_expected']} expected samples "
+            f"in {health['duration_s']:.1f}s, {health['short_blocks']}/{health['blocks']} short blocks, "
+            f"{health['counter_gaps']} counter gaps ({health['samples_lost']} lost), "
+            f"getData p99 <= {latency_quantile_ms} max {health['latency_max_ms']:.1f}ms, "
+            f"consumer lag mean {health['lag_mean_ms']:.0f} max {health['lag_max_ms']}ms, "
+            f"{health['overruns']} overruns, {health['overwritten_samples']} overwritten samples"
+        )
+
+    def _get_latency_quantile_ms(self, counts: list[int], quantile: float) -> str:
+        if not sum(counts):
+            return '-'
+        bucket = int(np.searchsorted(np.cumsum(counts), quantile * sum(counts)))
+        return f'{self.LATENCY_BUCKETS_MS[bucket]}ms' if bucket < len(self.LATENCY_BUCKETS_MS) else 'inf'
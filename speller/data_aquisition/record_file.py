@@ -0,0 +1,275 @@
+import abc
+import json
+import logging
+import os
+from pathlib import Path
+import struct
+from typing import Any, BinaryIO, Iterator, Sequence
+
+import numpy as np
+import pandas as pd
+
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT, SAMPLES_DTYPE, SamplesBlockType
+
+
+logger = logging.getLogger(__name__)
+
+
+RECORD_HEADERS = [f'EEG {i}' for i in range(1, 9)] + ['FLASH', 'ITEM']
+RECORD_FREQUENCY = 250
+RECORD_SUFFIX = '.spr'
+SEQUENCES_SUFFIX = '.sps'
+
+EVENTS_DTYPE = np.dtype([('index', '<i8'), ('item', '<i4')])
+
+# layout: magic | header length | JSON header padded to 8 bytes | chunks
+# chunk: tag | row size | number of rows | rows, INFO chunks hold JSON bytes
+_MAGIC = b'SPLREC01'
+_SEQUENCES_MAGIC = b'SPLSEQ01'  # online sequences sidecar of a record, same layout
+_HEADER_LENGTH = struct.Struct('<I')
+_CHUNK_HEADER = struct.Struct('<4sIQ')
+_SAMPLES_TAG = b'SMPL'
+_EVENTS_TAG = b'EVNT'
+_INFO_TAG = b'INFO'
+_FEATURES_TAG = b'FEAT'
+_ITEMS_TAG = b'ITEM'
+_SCORES_TAG = b'SCOR'
+_WEIGHTS_TAG = b'WGHT'
+_ALIGNMENT = 8
+
+_META_INT_FIELDS = ('flash', 'break', 'reps', 'target', 'cycles')
+
+
+def format_record_meta(meta: dict[str, Any]) -> str:
+    return ''.join(f'__{key}={meta[key]}' for key in ('flash', 'break', 'reps', 'name', 'comment', 'target', 'cycles'))
+
+
+def parse_record_meta(filename: str | Path) -> dict[str, Any]:
+    meta = dict(part.split('=', 1) for part in Path(filename).stem.split('__') if '=' in part)
+    for key in _META_INT_FIELDS:
+        if key in meta:
+            meta[key] = int(meta[key])
+    return meta
+
+
+def get_sequences_path(record_path: Path) -> Path:
+    return record_path.with_suffix(SEQUENCES_SUFFIX)
+
+
+def _create_file(filename: Path, magic: bytes, header: dict[str, Any]) -> BinaryIO:
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (-(len(magic) + _HEADER_LENGTH.size + len(header_bytes)) % _ALIGNMENT)
+
+    file = open(filename, 'wb')
+    file.write(magic + _HEADER_LENGTH.pack(len(header_bytes)) + header_bytes)
+    return file
+
+
+def _read_header(filename: Path, buffer: np.ndarray, magic: bytes) -> tuple[dict[str, Any], int]:
+    if buffer[:len(magic)].tobytes() != magic:
+        raise ValueError(f"{filename} is not a speller {'record' if magic == _MAGIC else 'sequences file'}")
+
+    offset = len(magic)
+    (header_length,) = _HEADER_LENGTH.unpack_from(buffer, offset)
+    offset += _HEADER_LENGTH.size
+    return json.loads(buffer[offset: offset + header_length].tobytes()), offset + header_length
+
+
+def _iter_chunks(filename: Path, buffer: np.ndarray, offset: int) -> Iterator[tuple[bytes, int, np.ndarray]]:
+    while offset + _CHUNK_HEADER.size <= len(buffer):
+        tag, row_size, rows = _CHUNK_HEADER.unpack_from(buffer, offset)
+        start, offset = offset + _CHUNK_HEADER.size, offset + _CHUNK_HEADER.size + row_size * rows
+        if offset > len(buffer):
+            logger.warning("%s ends with a truncated chunk, ignoring it", filename)
+            return
+        yield tag, rows, buffer[start: offset]
+
+
+def _open_to_append(filename: Path, magic: bytes, last_tag: bytes | None = None) -> BinaryIO:
+    # drops a chunk half-written before a crash, otherwise everything appended after it is unreadable
+    # last_tag: keep only groups of chunks ending with this tag
+    buffer = np.memmap(filename, dtype=np.uint8, mode='r')
+    _, offset = _read_header(filename, buffer, magic)
+    end = offset
+    for tag, _, data in _iter_chunks(filename, buffer, offset):
+        offset += _CHUNK_HEADER.size + len(data)
+        if last_tag is None or tag == last_tag:
+            end = offset
+    size = len(buffer)
+    del buffer
+
+    file = open(filename, 'r+b')
+    if end < size:
+        logger.warning("%s: dropping %d bytes after the last complete chunk", filename, size - end)
+        file.truncate(end)
+    file.seek(end)
+    return file
+
+
+class _ChunkWriter(abc.ABC):
+    def __init__(self, filename: Path, meta: dict[str, Any]):
+        self._filename = filename
+        self._meta = meta
+        self._file: BinaryIO | None = None
+
+    @abc.abstractmethod
+    def _open(self) -> BinaryIO:
+        pass
+
+    def _write_chunk(self, tag: bytes, rows: np.ndarray) -> None:
+        if self._file is None:
+            self._file = self._open()
+        self._file.write(_CHUNK_HEADER.pack(tag, rows[0].nbytes if len(rows) else 0, len(rows)))
+        self._file.write(rows.tobytes())
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def fsync(self) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class RecordWriter(_ChunkWriter):
+    def __init__(self, filename: Path, meta: dict[str, Any]):
+        super().__init__(filename, meta)
+        self._samples_count = 0
+
+    def _open(self) -> BinaryIO:
+        if self._filename.exists() and self._filename.stat().st_size > 0:
+            self._samples_count = RecordReader(self._filename).samples_count  # continue the session record
+            return _open_to_append(self._filename, _MAGIC)
+
+        return _create_file(self._filename, _MAGIC, {
+            **self._meta,
+            'frequency': RECORD_FREQUENCY,
+            'channels': RECORD_HEADERS[:EEG_CHANNELS_COUNT],
+            'dtype': np.dtype(SAMPLES_DTYPE).str,
+        })
+
+    def write(self, samples: SamplesBlockType, flash_indexes: Sequence[int], items: Sequence[int]) -> None:
+        if self._file is None:
+            self._file = self._open()  # the samples count of a continued record is read here
+
+        events = np.empty(len(flash_indexes), dtype=EVENTS_DTYPE)
+        events['index'] = np.asarray(flash_indexes) + self._samples_count  # event indexes are absolute in the record
+        events['item'] = items
+
+        self._write_chunk(_SAMPLES_TAG, np.ascontiguousarray(samples, dtype=SAMPLES_DTYPE))
+        self._write_chunk(_EVENTS_TAG, events)
+        self._samples_count += len(samples)
+
+    def write_info(self, info: dict[str, Any]) -> None:
+        self._write_chunk(_INFO_TAG, np.frombuffer(json.dumps(info).encode(), dtype=np.uint8))
+
+
+class RecordReader:
+    def __init__(self, filename: Path):
+        self._filename = filename
+        self._buffer = np.memmap(filename, dtype=np.uint8, mode='r')
+        self.meta, offset = _read_header(filename, self._buffer, _MAGIC)
+
+        self._chunks: list[np.ndarray] = []
+        self.info: list[dict[str, Any]] = []
+        events = []
+        for tag, rows, data in _iter_chunks(filename, self._buffer, offset):
+            if tag == _SAMPLES_TAG:
+                self._chunks.append(data.view(SAMPLES_DTYPE).reshape(rows, EEG_CHANNELS_COUNT))
+            elif tag == _EVENTS_TAG:
+                events.append(data.view(EVENTS_DTYPE))
+            elif tag == _INFO_TAG:
+                self.info.append(json.loads(data.tobytes()))
+
+        self._chunk_starts = np.cumsum([0] + [len(chunk) for chunk in self._chunks])
+        self.events = np.concatenate(events) if events else np.empty(0, dtype=EVENTS_DTYPE)
+
+    @property
+    def samples_count(self) -> int:
+        return int(self._chunk_starts[-1])
+
+    @property
+    def frequency(self) -> int:
+        return self.meta['frequency']
+
+    def read(self, start: int = 0, stop: int | None = None) -> SamplesBlockType:
+        stop = self.samples_count if stop is None else min(stop, self.samples_count)
+        start = min(max(start, 0), stop)
+
+        first = max(np.searchsorted(self._chunk_starts, start, side='right') - 1, 0)
+        last = np.searchsorted(self._chunk_starts, stop, side='left')
+        parts = [
+            self._chunks[i][max(start - self._chunk_starts[i], 0): stop - self._chunk_starts[i]]
+            for i in range(first, min(last, len(self._chunks)))
+        ]
+        if len(parts) == 1:
+            return parts[0]  # read-only view into the memory map
+        return np.concatenate(parts) if parts else np.empty((0, EEG_CHANNELS_COUNT), dtype=SAMPLES_DTYPE)
+
+    def read_time(self, start_s: float, stop_s: float | None = None) -> SamplesBlockType:
+        stop = None if stop_s is None else round(stop_s * self.frequency)
+        return self.read(round(start_s * self.frequency), stop)
+
+
+class SequencesWriter(_ChunkWriter):
+    # meta: record meta and the feature settings the online features were extracted with
+    def _open(self) -> BinaryIO:
+        if self._filename.exists() and self._filename.stat().st_size > 0:
+            return _open_to_append(self._filename, _SEQUENCES_MAGIC, _WEIGHTS_TAG)  # the last chunk of a sequence
+        return _create_file(self._filename, _SEQUENCES_MAGIC, self._meta)
+
+    def write(self, features: np.ndarray, items: Sequence[int], scores: Sequence[float], weights: Sequence[float]) -> None:
+        # one chunk group per sequence, features: (number_of_epochs, number_of_features)
+        self._write_chunk(_FEATURES_TAG, np.ascontiguousarray(features, dtype=np.float32))
+        self._write_chunk(_ITEMS_TAG, np.asarray(items, dtype=np.int32))
+        self._write_chunk(_SCORES_TAG, np.asarray(scores, dtype=np.float64))
+        self._write_chunk(_WEIGHTS_TAG, np.asarray(weights, dtype=np.float64))
+
+
+class SequencesReader:
+    def __init__(self, filename: Path):
+        self._filename = filename
+        self._buffer = np.memmap(filename, dtype=np.uint8, mode='r')
+        self.meta, offset = _read_header(filename, self._buffer, _SEQUENCES_MAGIC)
+
+        chunks: dict[bytes, list[np.ndarray]] = {_FEATURES_TAG: [], _ITEMS_TAG: [], _SCORES_TAG: [], _WEIGHTS_TAG: []}
+        for tag, rows, data in _iter_chunks(filename, self._buffer, offset):
+            if tag == _FEATURES_TAG:
+                chunks[tag].append(data.view(np.float32).reshape(rows, -1))
+            elif tag == _ITEMS_TAG:
+                chunks[tag].append(data.view(np.int32))
+            elif tag in chunks:
+                chunks[tag].append(data.view(np.float64))
+
+        self.sequences_count = min(len(arrays) for arrays in chunks.values())  # a sequence is complete with all its chunks
+        complete = {tag: arrays[:self.sequences_count] for tag, arrays in chunks.items()}
+        self.sequence_ids = np.repeat(np.arange(self.sequences_count), [len(items) for items in complete[_ITEMS_TAG]])
+        self.features = np.concatenate(complete[_FEATURES_TAG]) if self.sequences_count else np.empty((0, 0), dtype=np.float32)
+        self.items = np.concatenate(complete[_ITEMS_TAG]) if self.sequences_count else np.empty(0, dtype=np.int32)
+        self.scores = np.concatenate(complete[_SCORES_TAG]) if self.sequences_count else np.empty(0)
+        self.weights = np.concatenate(complete[_WEIGHTS_TAG]) if self.sequences_count else np.empty(0)
+
+    @property
+    def labels(self) -> np.ndarray:
+        return (self.items == self.meta.get('target')).astype(np.int64)
+
+
+def convert_csv_record(src_file: Path, dst_file: Path | None = None) -> Path:
+    dst_file = dst_file or src_file.with_suffix(RECORD_SUFFIX)
+    data = pd.read_csv(src_file, usecols=RECORD_HEADERS, dtype={header: SAMPLES_DTYPE for header in RECORD_HEADERS[:-2]})
+
+    flash_indexes = np.flatnonzero(data['FLASH'].to_numpy() == 1)
+    items = data['ITEM'].to_numpy()[flash_indexes]
+
+    tmp_file = dst_file.with_name(dst_file.name + '.tmp')  # never leave a half-converted record behind
+    tmp_file.unlink(missing_ok=True)
+    writer = RecordWriter(tmp_file, parse_record_meta(src_file))
+    writer.write(data[RECORD_HEADERS[:-2]].to_numpy(), flash_indexes, items)
+    writer.close()
+    tmp_file.replace(dst_file)
+    return dst_file
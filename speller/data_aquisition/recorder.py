@@ -1,15 +1,28 @@
 import abc
 from collections import deque
-from copy import deepcopy
 from enum import Enum
-import os
+from itertools import groupby
+import logging
 from pathlib import Path
-from typing import Sequence
+from queue import Empty, Full, Queue
+import sqlite3
+from threading import Lock, Thread
+import time
+from typing import Any, NamedTuple, Sequence
 
-from speller.data_aquisition.data_collector import DataSampleType
+import numpy as np
+
+from preprocessing.catalog import SessionCatalog
+from preprocessing.settings import FEATURE_SETTINGS_FIELDS, ModelSettings
+from speller.data_aquisition.data_collector import SamplesBlockType
+from speller.data_aquisition.health import AcquisitionHealth
+from speller.data_aquisition.record_file import RecordWriter, SequencesWriter, format_record_meta, get_sequences_path
 from speller.session.entity import FlashingSequenceType
 from speller.session.state_manager import IStateManager
-from speller.settings import ExperimentSettings, FilesSettings, StrategySettings
+from speller.settings import ExperimentSettings, FilesSettings, RecorderSettings, StrategySettings
+
+
+logger = logging.getLogger(__name__)
 
 
 class SpellerEvent(Enum):
@@ -19,82 +32,251 @@ class SpellerEvent(Enum):
     TARGET = 7
 
 
+def get_record_meta(
+    strategy_settings: StrategySettings, reps: int, name: str, comment: str, target: int, cycles: int
+) -> dict[str, Any]:
+    return {
+        'flash': strategy_settings.flash_duration_ms,
+        'break': strategy_settings.break_duration_ms,
+        'reps': reps,
+        'name': name,
+        'comment': comment,
+        'target': target,
+        'cycles': cycles,
+    }
+
+
+class _RecordJob(NamedTuple):
+    filename: Path
+    meta: dict[str, Any]
+    samples: SamplesBlockType
+    flash_indexes: Sequence[int]
+    items: Sequence[int]
+    health: dict[str, Any]
+
+
+class _SequenceJob(NamedTuple):
+    filename: Path
+    meta: dict[str, Any]
+    features: np.ndarray
+    items: Sequence[int]
+    scores: Sequence[float]
+    weights: Sequence[float]
+
+
 class IRecorder(abc.ABC):
     @abc.abstractmethod
-    def record_samples(self, samples: Sequence[DataSampleType]) -> None:
+    def record_samples(self, samples: SamplesBlockType, flash_indexes: Sequence[int]) -> None:
         pass
 
     @abc.abstractmethod
     def record_flashing_sequence(self, flashing_sequecne: FlashingSequenceType) -> None:
         pass
 
+    @abc.abstractmethod
+    def record_sequence(
+        self, flashing_sequence: FlashingSequenceType, features: np.ndarray, scores: Sequence[float], weights: Sequence[float]
+    ) -> None:
+        pass
+
+    @abc.abstractmethod
+    def stop(self) -> None:
+        pass
 
-class Recorder(abc.ABC):
-    _HEADERS = [f'EEG {i}' for i in range(1, 9)] + ['FLASH', 'ITEM']
 
+class Recorder(IRecorder):
     def __init__(
-        self, files_settings: FilesSettings, strategy_settings: StrategySettings, experiment_settings: ExperimentSettings, state_manager: IStateManager):
+        self,
+        settings: RecorderSettings,
+        files_settings: FilesSettings,
+        strategy_settings: StrategySettings,
+        experiment_settings: ExperimentSettings,
+        model_settings: ModelSettings,
+        state_manager: IStateManager,
+        health: AcquisitionHealth,
+    ):
+        self._settings = settings
         self._files_settings = files_settings
         self._strategy_settings = strategy_settings
         self._experiment_settings = experiment_settings
+        self._model_settings = model_settings
         self._state_manager = state_manager
+        self._health = health
 
+        self._lock = Lock()
         self._samples_queue = deque()
         self._flashing_sequence_queue = deque()
 
-    def _get_meta(self) -> str:
-        return (
-            f'__flash={self._strategy_settings.flash_duration_ms}'
-            f'__break={self._strategy_settings.break_duration_ms}'
-            f'__reps={self._state_manager.session_reps}'
-            f'__name={self._state_manager.session_name}'
-            f'__comment={self._state_manager.session_comment}'
-            f'__target={self._state_manager.session_target}'
-            f'__cycles={self._state_manager.session_cycles}'
+        self._jobs: Queue[_RecordJob | _SequenceJob | None] = Queue(maxsize=self._settings.queue_size)
+        self._thread: Thread | None = None
+        self._blocked_count = 0
+        self._blocked_s = 0.
+
+        self._catalog = SessionCatalog(files_settings)
+        self._writer: RecordWriter | None = None
+        self._sequences_writer: SequencesWriter | None = None
+        self._filename: Path | None = None
+
+    def _get_meta(self) -> dict[str, Any]:
+        return get_record_meta(
+            self._strategy_settings,
+            reps=self._state_manager.session_reps,
+            name=self._state_manager.session_name,
+            comment=self._state_manager.session_comment,
+            target=self._state_manager.session_target,
+            cycles=self._state_manager.session_cycles,
         )
 
-    def _get_filename(self) -> Path:
+    def _get_filename(self, meta: dict[str, Any]) -> Path:
         time_str = self._state_manager.session_start_time.strftime(self._files_settings.time_format)
-        meta = self._get_meta()
-        filename = self._files_settings.record_pattern.format(time_str, meta)
+        filename = self._files_settings.record_pattern.format(time_str, format_record_meta(meta))
         return self._files_settings.records_dir / filename
-    
-    def _write(self, value: str):
-        filename = self._get_filename()
-            
-        with open(filename, 'a+') as f:
-            if os.stat(filename).st_size == 0:
-                header = ",".join(self._HEADERS) + "\n"
-                f.write(header)
-            f.write(value)
 
-    @staticmethod
-    def _make_record(sample: DataSampleType, flash: int, item: int):
-        return ",".join(map(str, sample + [flash, item]))
-    
-    def record_samples(self, samples: Sequence[DataSampleType]) -> None:
-        self._samples_queue.appendleft(deepcopy(samples))
-        self._record()
+    def record_samples(self, samples: SamplesBlockType, flash_indexes: Sequence[int]) -> None:
+        with self._lock:
+            self._samples_queue.appendleft((samples, flash_indexes))  # acquisition returns a new block per read, no copy needed
+            self._record()
 
     def record_flashing_sequence(self, flashing_sequence: FlashingSequenceType) -> None:
-        self._flashing_sequence_queue.appendleft(flashing_sequence)
-        self._record()
+        with self._lock:
+            self._flashing_sequence_queue.appendleft(flashing_sequence)
+            self._record()
 
     def _record(self) -> None:
         if all((self._samples_queue, self._flashing_sequence_queue)):
-            samples = self._samples_queue.pop()
+            samples, indexes = self._samples_queue.pop()
             flashing_sequence = self._flashing_sequence_queue.pop()
 
-            indexes = self._strategy_settings.get_flashing_samples_indexes(len(flashing_sequence))
+            meta = self._get_meta()  # session state is read here, the writer thread may lag behind
+            meta['start_time'] = self._state_manager.session_start_time.isoformat()
+            job = _RecordJob(self._get_filename(meta), meta, samples, indexes, self._get_items(flashing_sequence), self._health.snapshot())
+            self._put(job)
+
+    @staticmethod
+    def _get_items(flashing_sequence: FlashingSequenceType) -> list[int]:
+        return [i * 4 + j for (i, j), *_ in flashing_sequence]
+
+    def record_sequence(
+        self, flashing_sequence: FlashingSequenceType, features: np.ndarray, scores: Sequence[float], weights: Sequence[float]
+    ) -> None:
+        meta = self._get_meta()
+        meta['features'] = {
+            **self._model_settings.model_dump(include=FEATURE_SETTINGS_FIELDS),
+            'epoch_size_samples': self._strategy_settings.epoch_size_samples,
+        }
+        items = self._get_items(flashing_sequence)[:len(features)]
+        self._put(_SequenceJob(self._get_filename(meta), meta, np.array(features, dtype=np.float32), items, scores, weights))
+
+    def _put(self, job: _RecordJob | _SequenceJob | None) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='Recorder', daemon=True)
+            self._thread.start()
+
+        try:
+            self._jobs.put_nowait(job)
+        except Full:
+            start_time = time.monotonic()
+            self._jobs.put(job)  # never drop recorded data, wait for the writer instead
+            blocked_s = time.monotonic() - start_time
+            self._blocked_count += 1
+            self._blocked_s += blocked_s
+            logger.warning(
+                "Recorder: write queue is full (%s records), blocked for %.3fs, %s times in total",
+                self._settings.queue_size, blocked_s, self._blocked_count,
+            )
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + self._settings.stop_timeout_s
+        try:
+            self._jobs.put(None, timeout=self._settings.stop_timeout_s)
+            self._thread.join(max(deadline - time.monotonic(), 0.))
+        except Full:
+            pass
+        if self._thread.is_alive():
+            logger.error("Recorder: writer did not finish in %.1fs, %s queued records are not written", self._settings.stop_timeout_s, self._jobs.qsize())
+        self._thread = None
+        logger.info("Recorder: stopped, blocked %s times for %.3fs in total", self._blocked_count, self._blocked_s)
+
+    def _run(self) -> None:
+        last_flush_time = last_fsync_time = time.monotonic()
+        is_stopping = False
+        while not is_stopping:
+            try:
+                jobs = [self._jobs.get(timeout=self._settings.flush_interval_s)]
+            except Empty:
+                jobs = []
+            while jobs and len(jobs) < self._settings.batch_size:
+                try:
+                    jobs.append(self._jobs.get_nowait())
+                except Empty:
+                    break
+
+            is_stopping = None in jobs
+            for is_record, group in groupby([job for job in jobs if job is not None], key=lambda job: isinstance(job, _RecordJob)):
+                batches = [list(group)] if is_record else [[job] for job in group]  # a failed sequence does not drop the others
+                for batch in batches:
+                    try:
+                        if is_record:
+                            self._write(batch)
+                        else:
+                            self._write_sequence(batch[0])
+                    except Exception:
+                        logger.exception("Recorder: failed to write %s", batch[0].filename)  # keep draining, later records may succeed
+
+            try:
+                now = time.monotonic()
+                writers = [writer for writer in (self._writer, self._sequences_writer) if writer is not None]
+                if writers and (is_stopping or now - last_flush_time >= self._settings.flush_interval_s):
+                    for writer in writers:
+                        writer.flush()
+                    last_flush_time = now
+                    if is_stopping or now - last_fsync_time >= self._settings.fsync_interval_s:
+                        for writer in writers:
+                            writer.fsync()
+                        last_fsync_time = now
+            except Exception:
+                logger.exception("Recorder: failed to flush %s", self._filename)
+
+        self._close_writer()
+
+    def _write(self, jobs: list[_RecordJob]) -> None:
+        for filename, group in groupby(jobs, key=lambda job: job.filename):
+            group = list(group)
+            offsets = np.cumsum([0] + [len(job.samples) for job in group[:-1]])
+
+            samples = np.concatenate([job.samples for job in group])
+            indexes = np.concatenate([np.asarray(job.flash_indexes, dtype=np.int64) + offset for job, offset in zip(group, offsets)])
+            items = np.concatenate([np.asarray(job.items, dtype=np.int64) for job in group])
+            writer = self._get_writer(filename, group[0].meta)
+            writer.write(samples, indexes, items)
+            writer.write_info({'acquisition_health': group[-1].health})
+
+    def _write_sequence(self, job: _SequenceJob) -> None:
+        if job.filename != self._filename:
+            return  # the samples of the sequence are always written first, the record was closed by a session change
+        if self._sequences_writer is None:
+            self._sequences_writer = SequencesWriter(get_sequences_path(job.filename), job.meta)
+        self._sequences_writer.write(job.features, job.items, job.scores, job.weights)
 
-            flash_list = [0] * len(samples)
-            item_list = [0] * len(samples)
-            for index, flashing_list in zip(indexes, flashing_sequence):
-                flash_list[index] = 1
+    def _close_writer(self) -> None:
+        if self._sequences_writer is not None:
+            self._sequences_writer.close()
+            self._sequences_writer = None
+        if self._writer is None:
+            return
+        self._writer.close()
+        try:
+            self._catalog.add_recording(self._filename)
+        except (OSError, sqlite3.Error):
+            logger.exception("Recorder: failed to add %s to the catalog", self._filename)
+        self._writer = None
+        self._filename = None
 
-                i, j = flashing_list[0]
-                item_list[index] = i * 4 + j
-                
-            records = '\n'.join(map(self._make_record, samples, flash_list, item_list)) + '\n'
-            self._write(records)
-        
+    def _get_writer(self, filename: Path, meta: dict[str, Any]) -> RecordWriter:
+        if filename != self._filename:
+            self._close_writer()
+            self._writer = RecordWriter(filename, meta)
+            self._filename = filename
+        return self._writer
@@ -0,0 +1,96 @@
+import logging
+from pathlib import Path
+from threading import Event
+import time
+from typing import Iterator
+
+import mne
+import numpy as np
+import pandas as pd
+
+from speller.data_aquisition.data_collector import SAMPLES_DTYPE, IDataCollector, SamplesBlockType
+from speller.data_aquisition.record_file import RECORD_SUFFIX, RecordReader
+from speller.settings import ReplayDataCollectorSettings, samples_to_ms
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayDataCollector(IDataCollector):
+    _EEG_COLUMNS = [f'EEG {i}' for i in range(1, 9)]
+    _VOLTS_TO_ORIGIN_UNITS_FACTOR = 1e6
+
+    def __init__(self, settings: ReplayDataCollectorSettings):
+        self._settings = settings
+        self._samples = self._read_file(self._settings.file)
+        logger.info("ReplayDataCollector: loaded %s samples from %s", len(self._samples), self._settings.file)
+
+        self._position = 0
+        self._next_time: float | None = None
+        self._replayed_samples = 0
+        self._replay_start_time: float | None = None
+
+    def _read_file(self, file: Path | None) -> SamplesBlockType:
+        if file is None:
+            raise RuntimeError("ReplayDataCollector: file is not set")
+
+        if file.suffix == '.fif':
+            raw = mne.io.read_raw_fif(file, preload=True)
+            samples = raw.get_data(picks='eeg').transpose() * self._VOLTS_TO_ORIGIN_UNITS_FACTOR
+            return np.ascontiguousarray(samples, dtype=SAMPLES_DTYPE)
+
+        if file.suffix == RECORD_SUFFIX:
+            return RecordReader(file).read()  # memory-mapped, _take copies what it hands out
+
+        data = pd.read_csv(file, usecols=self._EEG_COLUMNS, dtype=SAMPLES_DTYPE)
+        return data[self._EEG_COLUMNS].to_numpy()
+
+    def _pace(self, number_of_samples: int) -> None:
+        now = time.monotonic()
+        if self._replay_start_time is None:
+            self._replay_start_time = now
+        self._replayed_samples += number_of_samples
+
+        if not self._settings.speed:
+            return
+        if self._next_time is None or self._next_time < now - self._settings.max_lag_s:
+            self._next_time = now  # do not burst to catch up after a long pause between calls
+        self._next_time += samples_to_ms(number_of_samples) / 1000 / self._settings.speed
+        time.sleep(max(0, self._next_time - now))
+
+    def _take(self, number_of_samples: int) -> SamplesBlockType:
+        stop = self._position + number_of_samples
+        if stop <= len(self._samples):
+            samples = self._samples[self._position: stop].copy()
+        elif self._settings.loop:
+            indexes = np.arange(self._position, stop) % len(self._samples)
+            samples = self._samples[indexes]
+            stop %= len(self._samples)
+        else:
+            raise EOFError(f"ReplayDataCollector: {self._settings.file} is over")
+
+        self._position = stop
+        return samples
+
+    def collect(self, number_of_samples: int) -> SamplesBlockType:
+        samples = self._take(number_of_samples)
+        self._pace(number_of_samples)
+        return samples
+
+    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[SamplesBlockType]:
+        try:
+            while not shutdown_event.is_set():
+                yield self.collect(number_of_samples)
+        except EOFError:
+            logger.info("ReplayDataCollector: reached the end of %s", self._settings.file)
+        self.report()
+
+    def report(self) -> None:
+        if self._replay_start_time is None:
+            return
+        duration_s = time.monotonic() - self._replay_start_time
+        recorded_s = samples_to_ms(self._replayed_samples) / 1000
+        logger.info(
+            "ReplayDataCollector: replayed %s samples (%.1fs of recording) in %.1fs, %.0f samples/s, %.2fx real time",
+            self._replayed_samples, recorded_s, duration_s, self._replayed_samples / duration_s, recorded_s / duration_s,
+        )
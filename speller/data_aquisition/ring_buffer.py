@@ -0,0 +1,103 @@
+from threading import Condition
+
+import numpy as np
+
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT, SAMPLES_DTYPE, SamplesBlockType
+from speller.settings import samples_to_ms
+
+
+class SamplesOverwrittenError(RuntimeError):
+    pass
+
+
+class SamplesRingBuffer:
+    _MIN_ANCHORS_TO_FIT = 20
+
+    def __init__(self, capacity: int, anchors_capacity: int = 1):
+        self._capacity = capacity
+        self._sample_duration_s = samples_to_ms(1) / 1000
+
+        self._samples = np.zeros((capacity, EEG_CHANNELS_COUNT), dtype=SAMPLES_DTYPE)
+        self._written = 0
+        self._writing = 0  # stop of the block being copied in, ahead of _written until the copy is done
+        self._condition = Condition()
+
+        # (index of the last sample of a block, its receive time), used to map time onto the sample clock
+        self._anchors = np.zeros((anchors_capacity, 2), dtype=np.float64)
+        self._anchors_written = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    def _slices(self, start: int, stop: int) -> list[tuple[slice, slice]]:
+        # (buffer slice, output slice) pairs, two of them when [start, stop) wraps around
+        begin, size = start % self._capacity, stop - start
+        head = min(size, self._capacity - begin)
+        slices = [(slice(begin, begin + head), slice(0, head))]
+        if head < size:
+            slices.append((slice(0, size - head), slice(head, size)))
+        return slices
+
+    def write(self, samples: SamplesBlockType, receive_time: float) -> None:
+        start, stop = self._written, self._written + len(samples)
+        samples = samples[-self._capacity:]
+
+        self._writing = stop  # published before the copy so readers see the slots it overwrites
+        for buffer_slice, samples_slice in self._slices(stop - len(samples), stop):
+            self._samples[buffer_slice] = samples[samples_slice]
+
+        with self._condition:
+            self._anchors[self._anchors_written % len(self._anchors)] = (stop - 1, receive_time)
+            self._anchors_written += 1
+            self._written = stop
+            self._condition.notify_all()
+
+    def _check_available(self, start: int) -> None:
+        oldest = self._writing - self._capacity
+        if start < oldest:
+            raise SamplesOverwrittenError(f"Samples from {start} were overwritten, the oldest is {oldest}")
+
+    def wait(self, stop: int, stall_timeout: float | None = None) -> None:
+        with self._condition:
+            while self._written < stop:
+                written = self._written
+                if not self._condition.wait_for(lambda: self._written != written, stall_timeout):
+                    raise TimeoutError(f"No samples were received for {stall_timeout}s while waiting for sample {stop - 1}")
+
+    def read(self, start: int, stop: int, stall_timeout: float | None = None) -> SamplesBlockType:
+        self.wait(stop, stall_timeout)
+        self._check_available(start)
+
+        samples = np.empty((stop - start, EEG_CHANNELS_COUNT), dtype=SAMPLES_DTYPE)
+        for buffer_slice, samples_slice in self._slices(start, stop):
+            samples[samples_slice] = self._samples[buffer_slice]
+
+        self._check_available(start)  # writer could lap the reader during the copy, _writing covers a block still being copied in
+        return samples
+
+    def _get_clock(self) -> tuple[float, float, float]:
+        # least squares fit of receive time against sample index over the recent blocks,
+        # it follows the drift of the device clock and averages out transfer jitter
+        with self._condition:
+            if not self._anchors_written:
+                raise RuntimeError("No samples were received yet")
+            anchors = self._anchors[:min(self._anchors_written, len(self._anchors))].copy()
+
+        last_index = anchors[:, 0].max()
+        offsets = anchors[:, 0] - last_index
+        if len(anchors) < self._MIN_ANCHORS_TO_FIT:
+            return last_index, float(np.mean(anchors[:, 1] - offsets * self._sample_duration_s)), self._sample_duration_s
+        slope, intercept = np.polyfit(offsets, anchors[:, 1], 1)
+        return last_index, intercept, slope
+
+    def times_to_indexes(self, times: np.ndarray) -> np.ndarray:
+        last_index, last_time, sample_duration_s = self._get_clock()
+        return np.rint(last_index + (np.asarray(times) - last_time) / sample_duration_s).astype(np.int64)
+
+    def time_to_index(self, t: float) -> int:
+        return int(self.times_to_indexes(np.array([t]))[0])
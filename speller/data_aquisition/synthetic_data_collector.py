@@ -0,0 +1,193 @@
+from datetime import datetime, timedelta
+import logging
+from pathlib import Path
+from threading import Event
+import time
+from typing import Any, Iterator
+
+import numpy as np
+from scipy import signal
+
+from preprocessing.catalog import SessionCatalog
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT, SAMPLES_DTYPE, IDataCollector, SamplesBlockType
+from speller.data_aquisition.record_file import RecordWriter, format_record_meta
+from speller.data_aquisition.recorder import get_record_meta
+from speller.session.state_manager import IStateManager
+from speller.settings import FilesSettings, StrategySettings, SyntheticDataCollectorSettings, ms_to_samples, samples_to_ms
+
+
+logger = logging.getLogger(__name__)
+
+
+class P300SignalGenerator:
+    _NOISE_FILTERS = {
+        'white': ([1.], [1.]),
+        'pink': ([0.049922035, -0.095993537, 0.050612699, -0.004408786], [1., -2.494956002, 2.017265875, -0.522189400]),
+        'brown': ([1.], [1., -0.995]),
+    }
+    _NOISE_GAIN_SAMPLES = 10000
+
+    def __init__(self, settings: SyntheticDataCollectorSettings):
+        self._settings = settings
+        self._rng = np.random.default_rng(self._settings.seed)
+
+        self._b, self._a = self._NOISE_FILTERS[self._settings.noise_color]
+        self._noise_scale = self._settings.noise_amplitude_uv / self._get_noise_gain(self._b, self._a)
+        self._noise_state = np.zeros((max(len(self._a), len(self._b)) - 1, EEG_CHANNELS_COUNT))
+
+        self._channel_weights = np.asarray(self._settings.channel_weights)
+        self._line_phases = self._rng.uniform(0, 2 * np.pi, EEG_CHANNELS_COUNT)
+        self._sample_duration_ms = samples_to_ms(1)
+        self._response_samples = ms_to_samples(self._settings.p300_latency_ms + 4 * self._settings.p300_width_ms + 4 * self._settings.p300_jitter_ms)
+
+        self._index = 0
+        self._onsets = np.empty(0, dtype=np.int64)
+        self._latencies_ms = np.empty(0)
+        self._amplitudes_uv = np.empty(0)
+
+    @classmethod
+    def _get_noise_gain(cls, b: list[float], a: list[float]) -> float:
+        impulse = np.zeros(cls._NOISE_GAIN_SAMPLES)
+        impulse[0] = 1
+        return float(np.sqrt(np.sum(signal.lfilter(b, a, impulse) ** 2)))
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    def add_flash(self, index: int, is_target: bool) -> None:
+        amplitude = self._settings.p300_amplitude_uv * (1 if is_target else self._settings.non_target_amplitude_ratio)
+        latency = self._settings.p300_latency_ms + self._rng.normal(0, self._settings.p300_jitter_ms)
+
+        self._onsets = np.append(self._onsets, index)
+        self._latencies_ms = np.append(self._latencies_ms, latency)
+        self._amplitudes_uv = np.append(self._amplitudes_uv, amplitude)
+
+    def _get_evoked(self, indexes: np.ndarray) -> np.ndarray:
+        active = (self._onsets > indexes[0] - self._response_samples) & (self._onsets <= indexes[-1])
+        onsets, latencies, amplitudes = self._onsets[active], self._latencies_ms[active], self._amplitudes_uv[active]
+
+        times_ms = (indexes[None, :] - onsets[:, None]) * self._sample_duration_ms
+        waves = amplitudes[:, None] * np.exp(-0.5 * ((times_ms - latencies[:, None]) / self._settings.p300_width_ms) ** 2)
+        waves[times_ms < 0] = 0
+        return waves.sum(axis=0)
+
+    def _forget_old_flashes(self) -> None:
+        keep = self._onsets > self._index - self._response_samples
+        self._onsets, self._latencies_ms, self._amplitudes_uv = self._onsets[keep], self._latencies_ms[keep], self._amplitudes_uv[keep]
+
+    def generate(self, number_of_samples: int) -> SamplesBlockType:
+        indexes = np.arange(self._index, self._index + number_of_samples)
+
+        white = self._rng.standard_normal((number_of_samples, EEG_CHANNELS_COUNT))
+        noise, self._noise_state = signal.lfilter(self._b, self._a, white, axis=0, zi=self._noise_state)
+
+        line_phases = 2 * np.pi * self._settings.line_frequency * indexes[:, None] * self._sample_duration_ms / 1000 + self._line_phases
+        line_noise = self._settings.line_noise_amplitude_uv * np.sin(line_phases)
+
+        samples = noise * self._noise_scale + line_noise + self._get_evoked(indexes)[:, None] * self._channel_weights
+
+        self._index += number_of_samples
+        self._forget_old_flashes()
+        return samples.astype(SAMPLES_DTYPE)
+
+
+class SyntheticDataCollector(IDataCollector):
+    def __init__(
+        self,
+        settings: SyntheticDataCollectorSettings,
+        strategy_settings: StrategySettings,
+        state_manager: IStateManager,
+    ):
+        self._settings = settings
+        self._strategy_settings = strategy_settings
+        self._state_manager = state_manager
+
+        self._generator = P300SignalGenerator(self._settings)
+        self._flash_number = -1
+        self._next_time: float | None = None
+
+    def _register_flash(self) -> None:
+        # flashes are sampled at block boundaries, block size bounds the onset error
+        state = self._state_manager.get_state()
+        if state.flashing_list and state.flash_number != self._flash_number:
+            size = self._strategy_settings.keyboard_size
+            is_target = any(i * size + j == self._state_manager.session_target for i, j in state.flashing_list)
+            self._generator.add_flash(self._generator.index, is_target)
+            self._flash_number = state.flash_number
+
+    def _pace(self, number_of_samples: int) -> None:
+        now = time.monotonic()
+        if self._next_time is None or self._next_time < now - 1:
+            self._next_time = now
+        self._next_time += samples_to_ms(number_of_samples) / 1000
+        time.sleep(max(0, self._next_time - now))
+
+    def collect(self, number_of_samples: int) -> SamplesBlockType:
+        self._register_flash()
+        samples = self._generator.generate(number_of_samples)
+        self._pace(number_of_samples)
+        return samples
+
+    def collect_continuously(self, number_of_samples: int, shutdown_event: Event) -> Iterator[SamplesBlockType]:
+        while not shutdown_event.is_set():
+            yield self.collect(number_of_samples)
+
+
+class SyntheticRecordsWriter:
+    _CHUNK_SIZE_SAMPLES = 2500
+
+    def __init__(
+        self,
+        settings: SyntheticDataCollectorSettings,
+        strategy_settings: StrategySettings,
+        files_settings: FilesSettings,
+    ):
+        self._settings = settings
+        self._strategy_settings = strategy_settings
+        self._files_settings = files_settings
+        self._catalog = SessionCatalog(files_settings)
+        self._rng = np.random.default_rng(self._settings.seed)
+
+    def _get_items(self, reps: int) -> np.ndarray:
+        items_count = self._strategy_settings.keyboard_size ** 2
+        items = np.concatenate([self._rng.permutation(items_count) for _ in range(reps)])
+        repeated = np.flatnonzero(items[1:] == items[:-1]) + 1  # only possible at repetition borders
+        items[repeated], items[repeated + 1] = items[repeated + 1], items[repeated].copy()
+        return items
+
+    def _get_filename(self, directory: Path, start_time: datetime, meta: dict[str, Any]) -> Path:
+        time_str = start_time.strftime(self._files_settings.time_format)
+        return directory / self._files_settings.record_pattern.format(time_str, format_record_meta(meta))
+
+    def write(self, name: str, day: int, sessions: int, reps: int) -> list[Path]:
+        directory = self._files_settings.records_dir / 'raw' / name / f'day_{day}'
+        directory.mkdir(parents=True, exist_ok=True)
+
+        start_time = datetime.now()
+        filenames = []
+        for iteration in range(1, sessions + 1):
+            generator = P300SignalGenerator(self._settings.model_copy(update={'seed': self._rng.integers(2**32)}))
+            target = int(self._rng.integers(self._strategy_settings.keyboard_size ** 2))
+            items = self._get_items(reps)
+            indexes = self._strategy_settings.get_flashing_samples_indexes(len(items))
+            for index, item in zip(indexes, items):
+                generator.add_flash(index, item == target)
+
+            number_of_samples = self._strategy_settings.get_number_of_samples(len(items))
+            samples = np.concatenate([
+                generator.generate(min(self._CHUNK_SIZE_SAMPLES, number_of_samples - start))
+                for start in range(0, number_of_samples, self._CHUNK_SIZE_SAMPLES)
+            ])
+
+            record_time = start_time + timedelta(seconds=iteration)
+            meta = get_record_meta(self._strategy_settings, reps=reps, name=name, comment=f'iter_{iteration}', target=target, cycles=1)
+            filename = self._get_filename(directory, record_time, meta)
+            writer = RecordWriter(filename, {**meta, 'start_time': record_time.isoformat()})
+            writer.write(samples, indexes, items)
+            writer.close()
+            self._catalog.add_recording(filename)
+            filenames.append(filename)
+            logger.info("SyntheticRecordsWriter: written %s", filename)
+
+        return filenames
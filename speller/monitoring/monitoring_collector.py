@@ -1,10 +1,12 @@
 import abc
-from collections import deque
 from threading import Event
 from threading import Thread
-from typing import Sequence
+import time
 
-from speller.data_aquisition.data_collector import DataSampleType, IDataCollector
+import numpy as np
+
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT, SAMPLES_DTYPE, IDataCollector, SamplesBlockType
+from speller.data_aquisition.health import AcquisitionHealth
 from speller.settings import MonitoringSettings
 
 class IMonitoringCollector(abc.ABC):
@@ -13,23 +15,37 @@ class IMonitoringCollector(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def get_data(self) -> Sequence[DataSampleType]:
+    def get_data(self) -> SamplesBlockType:
         pass
 
 class MonitoringCollector:
-    def __init__(self, data_collector: IDataCollector, settings: MonitoringSettings):
+    def __init__(self, data_collector: IDataCollector, settings: MonitoringSettings, health: AcquisitionHealth):
         self._data_collector = data_collector
         self._settings = settings
+        self._health = health
 
     def run(self, accumulator_size: int, shutdown_event: Event) -> None:
-        self._accumulator = deque([[0] * 8] * accumulator_size, maxlen=accumulator_size)
+        self._accumulator = np.zeros((accumulator_size, EEG_CHANNELS_COUNT), dtype=SAMPLES_DTYPE)
+        self._unseen_samples = 0
         self._collector_thread = Thread(target=self._collect, args=(shutdown_event,))
         self._collector_thread.start()
 
     def _collect(self, shutdown_event):
+        size = len(self._accumulator)
+        call_time = time.monotonic()
         for samples in self._data_collector.collect_continuously(self._settings.collect_interval_samples, shutdown_event):
-            self._accumulator.extend(samples)
-        
+            self._health.record_block(self._settings.collect_interval_samples, len(samples), call_time, time.monotonic())
+
+            # samples pushed out before get_data saw them
+            unseen_samples = self._unseen_samples + len(samples)
+            self._health.record_overwritten(max(0, unseen_samples - size) - max(0, self._unseen_samples - size))
+            self._unseen_samples = unseen_samples
+
+            samples = samples[-size:]
+            self._accumulator[:-len(samples)] = self._accumulator[len(samples):]
+            self._accumulator[-len(samples):] = samples
+            call_time = time.monotonic()
 
-    def get_data(self) -> Sequence[DataSampleType]:
+    def get_data(self) -> SamplesBlockType:
+        self._unseen_samples = 0
         return self._accumulator
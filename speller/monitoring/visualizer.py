@@ -1,19 +1,25 @@
 from collections import deque
+import logging
 import signal
 from threading import Event
 from typing import Callable
 import numpy as np
 import pyqtgraph as pg
 
-from speller.data_aquisition.data_collector import DataSampleType
+from speller.data_aquisition.data_collector import SamplesBlockType
+from speller.data_aquisition.health import AcquisitionHealth
 from speller.monitoring.monitoring_collector import IMonitoringCollector
 from speller.settings import MonitoringSettings
 
 
+logger = logging.getLogger(__name__)
+
+
 class MonitoringVisualizer:
-    def __init__(self, monitoring_collector: IMonitoringCollector, settings: MonitoringSettings):
+    def __init__(self, monitoring_collector: IMonitoringCollector, settings: MonitoringSettings, health: AcquisitionHealth):
         self._monitoring_collector = monitoring_collector
         self._settings = settings
+        self._health = health
 
         self._shutdown_event = Event()
 
@@ -40,14 +46,17 @@ class MonitoringVisualizer:
     def _update(self):
         data = self._monitoring_collector.get_data()
         for i in range(8):
-            self._plots[i].setData(self._xs, [s[i] for s in data])
+            self._plots[i].setData(self._xs, data[:, i])
 
     def _update_qualities(self):
-        data = list(self._monitoring_collector.get_data())
+        data = self._monitoring_collector.get_data()
         self._quality_data.append(self._get_channels_qualities(data[1 - self._settings.quality_interval_samples:]))
         for i in range(8):
             self._quality_plots[i].setData(self._quality_xs, [s[i] for s in self._quality_data])
 
+    def _report_health(self):
+        logger.info("MonitoringVisualizer: %s", self._health.format())
+
     def _start_timer(self, func: Callable[[], None], interval: int) -> None:
         timer = pg.QtCore.QTimer()
         timer.timeout.connect(func)
@@ -61,16 +70,17 @@ class MonitoringVisualizer:
 
         self._start_timer(self._update, self._settings.update_interval_ms)
         self._start_timer(self._update_qualities, self._settings.update_quality_interval_ms)
+        self._start_timer(self._report_health, self._settings.health_report_interval_ms)
 
         pg.QtWidgets.QApplication.exec()
         self._shutdown_event.set()
+        self._report_health()
 
     def _exit(self, *args):
         pg.QtWidgets.QApplication.quit()
     
-    def _get_channels_qualities(self, samples: list[DataSampleType]) -> list[float]:
-        array = np.array(samples)
-        sd = np.std((array - array.mean(axis=0)), axis=0)
+    def _get_channels_qualities(self, samples: SamplesBlockType) -> list[float]:
+        sd = np.std((samples - samples.mean(axis=0)), axis=0)
 
         return sd.tolist()
     
\ No newline at end of file
@@ -11,7 +11,6 @@ from langchain.prompts.chat import (
     SystemMessagePromptTemplate,
 )
 from langchain.schema import AIMessage, HumanMessage, SystemMessage
-from sklearn.metrics import max_error
 from speller.secrets_settings import ChatGPTSecretsSettings
 from speller.settings import ChatGPTSettings
 
@@ -0,0 +1,29 @@
+import numpy as np
+
+
+class FlashOnsets:
+    def __init__(self, number_of_flashes: int = 0):
+        self._scheduled = np.full(number_of_flashes, np.nan)
+        self._shown = np.full(number_of_flashes, np.nan)
+
+    def __len__(self) -> int:
+        return len(self._scheduled)
+
+    def schedule(self, flash_number: int, time: float) -> None:
+        self._scheduled[flash_number] = time
+
+    def confirm(self, flash_number: int, time: float) -> None:
+        if flash_number < len(self._shown):
+            self._shown[flash_number] = time
+
+    @property
+    def confirmed_count(self) -> int:
+        return int(np.count_nonzero(~np.isnan(self._shown)))
+
+    @property
+    def delays_ms(self) -> np.ndarray:
+        return (self._shown - self._scheduled)[~np.isnan(self._shown)] * 1000
+
+    def get_times(self) -> np.ndarray:
+        # the view confirms a flash when it is drawn, the scheduled time is a fallback for missed confirmations
+        return np.where(np.isnan(self._shown), self._scheduled, self._shown)
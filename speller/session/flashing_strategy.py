@@ -4,13 +4,29 @@ from itertools import product
 import logging
 import random
 
-from speller.data_aquisition.recorder import IRecorder
+import numpy as np
+
 from speller.session.entity import FlashingSequenceType, ItemPositionType
 from speller.settings import StrategySettings
 
 
 logger = logging.getLogger(__name__)
-    
+
+
+def get_log_likelihoods(flashing_sequence: FlashingSequenceType, scores: list[float], keyboard_size: int) -> np.ndarray:
+    # log p(epochs | item is the target) of every item up to a common constant, flashes of other items are non-target
+    log_likelihoods = np.zeros(keyboard_size ** 2)
+    for flashing_list, score in zip(flashing_sequence, scores):
+        for i, j in flashing_list:
+            log_likelihoods[i * keyboard_size + j] += score
+    return log_likelihoods
+
+
+def get_posterior(log_likelihoods: np.ndarray) -> np.ndarray:
+    # uniform prior over items
+    posterior = np.exp(log_likelihoods - log_likelihoods.max())
+    return posterior / posterior.sum()
+
 
 class IFlashingStrategy(abc.ABC):
     @abc.abstractmethod
@@ -18,8 +34,12 @@ class IFlashingStrategy(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def predict_item_position(self, flashing_sequence: FlashingSequenceType, probabilities: list[float]) -> ItemPositionType:
-        pass
+    def predict_item_position(self, flashing_sequence: FlashingSequenceType, scores: list[float]) -> ItemPositionType:
+        pass  # scores: log-likelihood ratios of target vs non-target of every flash
+
+    @abc.abstractmethod
+    def get_posterior(self, flashing_sequence: FlashingSequenceType, scores: list[float]) -> np.ndarray:
+        pass  # probability of every item i * keyboard_size + j to be the target
 
 
 class SquareRowColumnFlashingStrategy(IFlashingStrategy):
@@ -44,23 +64,25 @@ class SquareRowColumnFlashingStrategy(IFlashingStrategy):
 
         return sequence
     
-    def predict_item_position(self, flashing_sequence: FlashingSequenceType, probabilities: list[float]) -> ItemPositionType:
-        accumulators = (defaultdict(float), defaultdict(float))  # (rows_probabilities_by_row_number, columns_probabilities_by_column_number)
+    def predict_item_position(self, flashing_sequence: FlashingSequenceType, scores: list[float]) -> ItemPositionType:
+        accumulators = (defaultdict(float), defaultdict(float))  # (rows_log_likelihoods_by_row_number, columns_log_likelihoods_by_column_number)
 
         for i, flashing_list in enumerate(flashing_sequence):
             number = flashing_list[0][i % 2]
-            accumulators[i % 2][number] += probabilities[i]
+            accumulators[i % 2][number] += scores[i]
         
         return (
             max(accumulators[0], key=accumulators[0].__getitem__),
             max(accumulators[1], key=accumulators[1].__getitem__),
         )
 
+    def get_posterior(self, flashing_sequence: FlashingSequenceType, scores: list[float]) -> np.ndarray:
+        return get_posterior(get_log_likelihoods(flashing_sequence, scores, self._settings.keyboard_size))
+
 
 class SquareSingleCharacterFlashingStrategy(IFlashingStrategy):
-    def __init__(self, strategy_settings: StrategySettings, recorder: IRecorder):
+    def __init__(self, strategy_settings: StrategySettings):
         self._strategy_settings = strategy_settings
-        self._recorder = recorder
    
     def _generate_flat_sequence(self, repetitions_count: int) -> list[int]:
         size = self._strategy_settings.keyboard_size
@@ -76,24 +98,22 @@ class SquareSingleCharacterFlashingStrategy(IFlashingStrategy):
         return result
     
     def get_flashing_sequence(self, repetitions_count: int) -> FlashingSequenceType:
-        sequence = [[(i // 4, i % 4)] for i in self._generate_flat_sequence(repetitions_count)]
-        self._recorder.record_flashing_sequence(sequence)
-        return sequence
+        return [[(i // 4, i % 4)] for i in self._generate_flat_sequence(repetitions_count)]
     
-    def predict_item_position(self, flashing_sequence: FlashingSequenceType, probabilities: list[float]) -> ItemPositionType:
-        accumulators = [0] * (self._strategy_settings.keyboard_size ** 2)
+    def get_posterior(self, flashing_sequence: FlashingSequenceType, scores: list[float]) -> np.ndarray:
+        return get_posterior(get_log_likelihoods(flashing_sequence, scores, self._strategy_settings.keyboard_size))
 
-        for flashing_list, probability in zip(flashing_sequence, probabilities):
-            for i, j in flashing_list:
-                accumulators[i * 4 + j] += probability
+    def predict_item_position(self, flashing_sequence: FlashingSequenceType, scores: list[float]) -> ItemPositionType:
+        log_likelihoods = get_log_likelihoods(flashing_sequence, scores, self._strategy_settings.keyboard_size)
+        posterior = get_posterior(log_likelihoods)
 
         lines = []
         for i in range(self._strategy_settings.keyboard_size):
-            row = accumulators[i * self._strategy_settings.keyboard_size: (i + 1) * self._strategy_settings.keyboard_size]
-            lines.append('\t'.join(map(str, row)))
-        logger.info("Probabilities distribution:\n%s", '\n'.join(lines))
+            row = slice(i * self._strategy_settings.keyboard_size, (i + 1) * self._strategy_settings.keyboard_size)
+            lines.append('\t'.join(f'{value:.2f} ({probability:.2f})' for value, probability in zip(log_likelihoods[row], posterior[row])))
+        logger.info("Log-likelihoods (posterior) distribution:\n%s", '\n'.join(lines))
 
-        index = max(range(len(accumulators)), key=accumulators.__getitem__)
+        index = int(np.argmax(log_likelihoods))
         return index // 4, index % 4
     
     # @staticmethod
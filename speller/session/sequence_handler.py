@@ -1,14 +1,19 @@
 import abc
 import logging
 from multiprocessing.pool import ThreadPool
+from threading import Condition, Event
 import time
+
+import numpy as np
+
 from speller.classification.classifier import IClassifier
 from speller.data_aquisition.epoch_getter import IEpochGetter
+from speller.data_aquisition.recorder import IRecorder
 from speller.session.command_decoder import ICommandDecoder
 from speller.session.entity import FlashingSequenceType, ItemPositionType
 from speller.session.flashing_strategy import IFlashingStrategy
 from speller.session.state_manager import IStateManager
-from speller.settings import StrategySettings
+from speller.settings import DynamicStoppingSettings, StrategySettings
 from speller.utils import Timer
 
 
@@ -26,57 +31,143 @@ class SequenceHandler(ISequenceHandler):
         self,
         epoch_getter: IEpochGetter,
         classifier: IClassifier,
+        recorder: IRecorder,
         flashing_strategy: IFlashingStrategy,
         command_decoder: ICommandDecoder,
         state_manager: IStateManager,
         strategy_settings: StrategySettings,
+        stopping_settings: DynamicStoppingSettings,
     ):
         self._epoch_getter = epoch_getter
         self._classifier = classifier
+        self._recorder = recorder
         self._flashing_strategy = flashing_strategy
         self._command_decoder = command_decoder
         self._state_manager = state_manager
         self._strategy_settings = strategy_settings
+        self._stopping_settings = stopping_settings
 
         self._future = None
         self._pool = ThreadPool(processes=1)
 
+        self._stop_event = Event()  # set by the handler, the state updater shows no more flashes
+        self._flashes_condition = Condition()
+        self._flashes_count = 0  # flashes shown by the state updater in the current sequence
+        self._is_flashing = False
+
+    def _get_repetitions_count(self) -> int:
+        if not self._stopping_settings.enabled or self._stopping_settings.max_repetitions is None:
+            return self._state_manager.session_reps
+        return min(self._state_manager.session_reps, self._stopping_settings.max_repetitions)
+
+    def _get_classification_stops(self, number_of_flashes: int, repetitions_count: int) -> list[int]:
+        # numbers of flashes after which the sequence is classified, the whole sequence at once without dynamic stopping
+        if not self._stopping_settings.enabled:
+            return [number_of_flashes]
+        interval = self._stopping_settings.interval_flashes or number_of_flashes // repetitions_count
+        return list(range(interval, number_of_flashes, interval)) + [number_of_flashes]
+
+    def _is_confident(self, posterior: np.ndarray) -> bool:
+        top, second = np.sort(posterior)[::-1][:2]
+        if top >= self._stopping_settings.probability_threshold:
+            return True
+        return self._stopping_settings.margin_threshold is not None and top - second >= self._stopping_settings.margin_threshold
+
     def handle_sequence(self) -> ItemPositionType:
         logger.info("SequnceHandler: start handling sequence")
-        flashing_sequence = self._flashing_strategy.get_flashing_sequence(self._state_manager.session_reps)
+        repetitions_count = self._get_repetitions_count()
+        flashing_sequence = self._flashing_strategy.get_flashing_sequence(repetitions_count)
         logger.debug("SequnceHandler: got flashing sequence")
         
+        self._state_manager.start_flashing(len(flashing_sequence))
         self._run_state_updater(flashing_sequence, time.monotonic())
 
-        epochs = self._epoch_getter.get_epochs(len(flashing_sequence))
-        probabilities = self._classifier.classify(epochs)
+        min_flashes = self._stopping_settings.min_repetitions * len(flashing_sequence) // repetitions_count
+        features, scores, weights = [], [], []
+        for stop in self._get_classification_stops(len(flashing_sequence), repetitions_count):
+            start = len(scores)
+            if self._wait_flashes(stop + 1) < stop:  # the next flash is shown once the view confirmed the last one
+                break  # the state updater stopped early, e.g. on a failure
+
+            epochs, epochs_weights = self._epoch_getter.get_epochs(self._state_manager.get_flash_onsets()[start:stop])
+            features.append(np.array(epochs))  # a worker reuses the epochs memory on the next build
+            scores += self._classify(epochs, epochs_weights)
+            if len(scores) < stop:
+                raise RuntimeError("SequnceHandler: run out of epochs")
+            weights.append(epochs_weights)
 
-        if len(probabilities) < len(flashing_sequence):
-            raise RuntimeError("SequnceHandler: run out of epochs")
+            posterior = self._flashing_strategy.get_posterior(flashing_sequence, scores)
+            logger.debug("SequnceHandler: posterior max=%.3f after %s flashes", posterior.max(), stop)
+            if stop < len(flashing_sequence) and stop >= min_flashes and self._is_confident(posterior):
+                self._stop_event.set()
+                logger.info("SequnceHandler: stopped after %s/%s flashes, posterior %.3f", stop, len(flashing_sequence), posterior.max())
+                break
+        self._future.get()
+
+        flashing_sequence = flashing_sequence[:len(scores)]  # flashes shown after the stop decision are not recorded
+
+        self._recorder.record_flashing_sequence(flashing_sequence)
+        self._epoch_getter.record_samples(self._state_manager.get_flash_onsets()[:len(scores)])
+        self._recorder.record_sequence(flashing_sequence, np.concatenate(features), scores, np.concatenate(weights))
 
         logger.info("SequnceHandler: finishing handling sequence")
-        predicted_item_position = self._flashing_strategy.predict_item_position(flashing_sequence, probabilities)
+        predicted_item_position = self._flashing_strategy.predict_item_position(flashing_sequence, scores)
     
         logger.debug("SequnceHandler: got position=%s", predicted_item_position)
         command = self._command_decoder.decode_command(predicted_item_position)
         logger.info("SequnceHandler: got command %s", command)
         self._state_manager.handle_command(command)
     
+    def _classify(self, epochs: np.ndarray, weights: np.ndarray) -> list[float]:
+        rejected_count = int((weights < 1).sum())
+        logger.info("SequnceHandler: rejected %s/%s epochs", rejected_count, len(epochs))
+        if not rejected_count:
+            return self._classifier.classify(epochs)
+
+        scores = np.zeros(len(epochs))  # a zero log-likelihood ratio adds no evidence for any item
+        kept = weights > 0
+        if kept.any():
+            scores[kept] = np.asarray(self._classifier.classify(epochs[kept])) * weights[kept]  # tempered evidence
+        else:
+            logger.warning("SequnceHandler: all epochs rejected")
+        return scores.tolist()
+
     def _run_state_updater(self, flashing_sequence: FlashingSequenceType, start_time: float):
         if self._future:
             self._future.wait()
+        self._stop_event.clear()
+        self._set_flashes_count(0, is_flashing=True)
         self._future = self._pool.apply_async(self._task, (flashing_sequence, start_time))
 
+    def _set_flashes_count(self, count: int, is_flashing: bool) -> None:
+        with self._flashes_condition:
+            self._flashes_count = count
+            self._is_flashing = is_flashing
+            self._flashes_condition.notify_all()
+
+    def _wait_flashes(self, count: int) -> int:
+        # the onset of a flash is known once it is shown, returns the flashes shown
+        with self._flashes_condition:
+            self._flashes_condition.wait_for(lambda: self._flashes_count >= count or not self._is_flashing)
+            return self._flashes_count
+
     def _task(self, flashing_sequence: FlashingSequenceType, start_time: float):
         logger.debug("SequnceHandler: running state updater")
 
         next_time = start_time + self._strategy_settings.wait_s + self._strategy_settings.epoch_baseline_s
         time.sleep(max(0, next_time - time.monotonic()))
-        for flashing_list in flashing_sequence:
-            self._state_manager.set_flashing_list(flashing_list)
-            next_time += self._strategy_settings.flash_duration_s
-            time.sleep(max(0, next_time - time.monotonic()))
-
-            self._state_manager.reset_flashing_list()
-            next_time += self._strategy_settings.break_duration_s
-            time.sleep(max(0, next_time - time.monotonic()))
+        try:
+            for flash_number, flashing_list in enumerate(flashing_sequence):
+                if self._stop_event.is_set():
+                    logger.debug("SequnceHandler: state updater stopped at flash %s", flash_number)
+                    return
+                self._state_manager.set_flashing_list(flashing_list, flash_number)
+                self._set_flashes_count(flash_number + 1, is_flashing=True)
+                next_time += self._strategy_settings.flash_duration_s
+                time.sleep(max(0, next_time - time.monotonic()))
+
+                self._state_manager.reset_flashing_list()
+                next_time += self._strategy_settings.break_duration_s
+                self._stop_event.wait(max(0, next_time - time.monotonic()))
+        finally:
+            self._set_flashes_count(self._flashes_count, is_flashing=False)
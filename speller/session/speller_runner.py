@@ -1,5 +1,8 @@
 import logging
 
+from speller.data_aquisition.acquisition import IAcquisition
+from speller.data_aquisition.health import AcquisitionHealth
+from speller.data_aquisition.recorder import IRecorder
 from speller.session.sequence_handler import ISequenceHandler
 from speller.session.state_manager import IStateManager
 
@@ -12,18 +15,30 @@ class SpellerRunner:
         self,
         sequence_handler: ISequenceHandler,
         state_manager: IStateManager,
+        acquisition: IAcquisition,
+        recorder: IRecorder,
+        health: AcquisitionHealth,
     ):
         self._sequence_handler = sequence_handler
         self._state_manager = state_manager
+        self._acquisition = acquisition
+        self._recorder = recorder
+        self._health = health
 
     def run(self) -> None:
-        while True:
-            if self._state_manager.is_session_running.wait(1):
-                logger.debug("SpellerRunner: start session")
-                self._handle_session()
-            if self._state_manager.shutdown_event.is_set():
-                logger.info("SpellerRunner: shutdown")
-                return
+        self._acquisition.start()
+        try:
+            while True:
+                if self._state_manager.is_session_running.wait(1):
+                    logger.debug("SpellerRunner: start session")
+                    self._handle_session()
+                if self._state_manager.shutdown_event.is_set():
+                    logger.info("SpellerRunner: shutdown")
+                    return
+        finally:
+            self._acquisition.stop()
+            self._recorder.stop()  # drain queued records
+            logger.info("SpellerRunner: acquisition health: %s", self._health.format())
 
     def _handle_session(self) -> None:
         cycles = 0
@@ -39,3 +54,4 @@ class SpellerRunner:
 
         if cycles >= max_cycles:
             self._state_manager.finish_session()
+        logger.info("SpellerRunner: acquisition health: %s", self._health.format())
@@ -4,12 +4,17 @@ from datetime import datetime
 from functools import singledispatchmethod
 import logging
 from threading import Event
+import time
 from typing import Sequence
+
+import numpy as np
+
 from speller.prediction.suggestions_getter import ISuggestionsGetter
 
 from speller.prediction.t9_predictor import T9_CHARS
 from speller.session.command_decoder import BaseCommand, InputCancelCommand, InputClearCommand, InputSuggestionCommand, InputT9Command
 from speller.session.entity import FlashingListType
+from speller.session.flash_onsets import FlashOnsets
 from speller.settings import ExperimentSettings, StateManagerSettings, StrategySettings
 
 
@@ -33,6 +38,7 @@ class State(HistoryState):
     preselected_clear: bool
     preselected_cancel: bool
     flashing_list: FlashingListType
+    flash_number: int
 
 
 class IStateManager(abc.ABC):
@@ -52,13 +58,25 @@ class IStateManager(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def set_flashing_list(self, flashing_list: FlashingListType) -> None:
+    def start_flashing(self, number_of_flashes: int) -> None:
+        pass
+
+    @abc.abstractmethod
+    def set_flashing_list(self, flashing_list: FlashingListType, flash_number: int) -> None:
         pass
 
     @abc.abstractmethod
     def reset_flashing_list(self) -> None:
         pass
 
+    @abc.abstractmethod
+    def confirm_flash(self, flash_number: int, onset_time: float) -> None:
+        pass
+
+    @abc.abstractmethod
+    def get_flash_onsets(self) -> np.ndarray:
+        pass
+
     @abc.abstractmethod
     def start_session(self, name: str, comment: str, target: int, reps: int, cycles: int) -> None:
         pass
@@ -94,6 +112,8 @@ class StateManager(IStateManager):
         self.info = ""
         self.info_counter = 1
         self.is_session_running: Event = Event()
+        self.flash_number = -1
+        self._flash_onsets = FlashOnsets()
 
         self.session_name = self._experiment_settings.name
         self.session_comment = self._experiment_settings.comment
@@ -110,12 +130,29 @@ class StateManager(IStateManager):
         self.preselected_cancel = False
         self.flashing_list = []
 
-    def set_flashing_list(self, flashing_list: FlashingListType) -> None:
+    def start_flashing(self, number_of_flashes: int) -> None:
+        self._flash_onsets = FlashOnsets(number_of_flashes)
+
+    def set_flashing_list(self, flashing_list: FlashingListType, flash_number: int) -> None:
+        self._flash_onsets.schedule(flash_number, time.monotonic())
+        self.flash_number = flash_number
         self.flashing_list = flashing_list
 
     def reset_flashing_list(self) -> None:
         self.flashing_list = []
 
+    def confirm_flash(self, flash_number: int, onset_time: float) -> None:
+        self._flash_onsets.confirm(flash_number, onset_time)
+
+    def get_flash_onsets(self) -> np.ndarray:
+        delays_ms = self._flash_onsets.delays_ms
+        if len(delays_ms):
+            logger.info(
+                "StateManager: %s/%s flashes confirmed by view, delay mean=%.1fms max=%.1fms",
+                len(delays_ms), len(self._flash_onsets), delays_ms.mean(), delays_ms.max(),
+            )
+        return self._flash_onsets.get_times()
+
     def start_session(self, name: str, comment: str, target: int, reps: int, cycles: int) -> None:
         self.session_name = name
         self.session_comment = comment
@@ -139,7 +176,8 @@ class StateManager(IStateManager):
             info=self.info,
             preselected_clear=self.preselected_clear,
             preselected_cancel=self.preselected_cancel,
-            flashing_list=self.flashing_list
+            flashing_list=self.flashing_list,
+            flash_number=self.flash_number,
         )
 
     @property
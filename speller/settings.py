@@ -14,7 +14,7 @@ def ms_to_samples(ms: int) -> int:
 class StrategySettings(BaseSettings):
     keyboard_size: int = 4
     repetitions_count: int = 25
-    wait_ms: int = 9000
+    wait_ms: int = 2000
 
     flash_duration_ms: int = 60
     break_duration_ms: int = 100
@@ -73,7 +73,7 @@ class StrategySettings(BaseSettings):
         return indexes
     
     def get_number_of_samples(self, number_of_epoches) -> int:
-        return self.wait_samples + self.epoch_size_samples + (number_of_epoches - 1) * self.epoch_interval_samples
+        return self.epoch_size_samples + (number_of_epoches - 1) * self.epoch_interval_samples
 
 class ExperimentSettings(BaseSettings):
     name: str = 'default'
@@ -92,7 +92,13 @@ class FilesSettings(BaseSettings):
     time_format: str = '%Y_%m_%d__%H_%M_%S'
     
     records_dir: Path = Path("./records")
-    record_pattern: str = 'record__{}__{}.csv'
+    record_pattern: str = 'record__{}__{}.spr'
+    catalog_filename: str = 'catalog.sqlite3'
+
+    cache_dir: Path = Path("./cache")
+    cache_max_size_mb: int = 4096  # 0 disables the cache
+
+    epochs_dir: Path = Path("./epochs")
 
     models_dir: Path = Path("./models")
     model_pattern: str = 'model__{}__{}.pickle'
@@ -122,10 +128,93 @@ class StubDataCollectorSettings(BaseSettings):
 class UnicornDataCollectorSettings(BaseSettings):
     batch_size: int = 250
 
+class SyntheticDataCollectorSettings(BaseSettings):
+    p300_amplitude_uv: float = 5.
+    p300_latency_ms: int = 300
+    p300_width_ms: int = 60
+    p300_jitter_ms: int = 30
+    non_target_amplitude_ratio: float = 0.2
+
+    noise_amplitude_uv: float = 10.
+    noise_color: Literal['white', 'pink', 'brown'] = 'pink'
+    line_noise_amplitude_uv: float = 5.
+    line_frequency: float = 50.
+
+    channel_weights: list[float] = [0.6, 0.8, 1., 0.8, 1., 0.7, 0.6, 0.7]  # Fz, C3, Cz, C4, Pz, PO7, Oz, PO8
+    seed: int | None = None
+
+    @field_validator('channel_weights')
+    @classmethod
+    def value_has_weight_per_channel(cls, v: list[float], info: ValidationInfo) -> list[float]:
+        assert len(v) == 8, f'{info.field_name} must contain 8 values!'
+        return v
+
+class ReplayDataCollectorSettings(BaseSettings):
+    file: Path | None = None
+    speed: float = Field(1., ge=0)  # 0 replays as fast as possible
+    loop: bool = True
+    max_lag_s: float = 1.
+
+class AcquisitionSettings(BaseSettings):
+    buffer_length_s: int = 300
+    block_size_samples: int = 10
+    stall_timeout_s: float = 5.
+    filter_padding_ms: int = 2000
+    drift_window_s: int = 60
+    latency_ms: float = 0.  # from a sample acquisition to its getData return, compensated in onset mapping
+
+    @field_validator('filter_padding_ms')
+    @classmethod
+    def value_is_multiple_of_four(cls, v: int, info: ValidationInfo) -> int:
+        assert v % 4 == 0, f'{info.field_name} must be a multiple of 4!'
+        return v
+
+    @cached_property
+    def buffer_length_samples(self) -> int:
+        return self.buffer_length_s * 250
+
+    @cached_property
+    def filter_padding_samples(self) -> int:
+        return ms_to_samples(self.filter_padding_ms)
+
+    @cached_property
+    def drift_window_samples(self) -> int:
+        return self.drift_window_s * 250
+
+class RecorderSettings(BaseSettings):
+    queue_size: int = 64
+    batch_size: int = 16
+    flush_interval_s: float = 1.
+    fsync_interval_s: float = 10.
+    stop_timeout_s: float = 30.  # waits this long for the queued records on exit
+
+class EpochGateSettings(BaseSettings):
+    # the limits apply to the filtered samples of each epoch, before feature extraction
+    enabled: bool = True
+    max_peak_to_peak_uv: float = 150.
+    max_variance_uv2: float = 2500.
+    max_gradient_uv: float = 50.  # between consecutive samples of the epoch
+    rejected_weight: float = 0.  # 0 drops rejected epochs, up to 1 down-weights them
+
+class DynamicStoppingSettings(BaseSettings):
+    # the sequence is classified every interval_flashes (every repetition if None) and ends once the item is certain
+    enabled: bool = True
+    interval_flashes: int | None = Field(None, gt=0)
+    min_repetitions: int = Field(2, ge=1)
+    max_repetitions: int | None = Field(None, ge=1)  # session reps if None
+    probability_threshold: float = Field(0.95, gt=0, le=1)  # posterior of the top item
+    margin_threshold: float | None = Field(None, gt=0, le=1)  # posterior of the top item over the second one
+
+class WorkerSettings(BaseSettings):
+    initial_samples_capacity: int = 30000
+    initial_epochs_capacity: int = 400
+    timeout_s: float = 120.
+
 class MonitoringSettings(BaseSettings):
     plot_length_s: int = 10
     update_interval_ms: int = 100
     quality_interval_samples: int = 250
+    health_report_interval_ms: int = 10000
 
     @field_validator('update_interval_ms')
     @classmethod
@@ -5,6 +5,7 @@ from itertools import product
 import logging
 import os
 import textwrap
+import time
 from tkinter import END, Button, Entry, Frame, Label, StringVar, Tk, Toplevel, font
 
 from typing import Any, Sequence
@@ -168,6 +169,7 @@ class SpellerView:
             self._files_settings.keyboard_flash_item_filename, self._view_settings.keyboard_items_scale
         )
         self._keyboard_flashing_list = set()
+        self._confirmed_flash_number = -1
 
     def _handle_start_btn(self):
         if self._start_btn_text.get() == 'Start':
@@ -218,6 +220,12 @@ class SpellerView:
             self._keyboard_labels[i][j].configure(image=self._keyboard_images[i][j])
         self._keyboard_flashing_list = flashing_list
 
+    def _confirm_flash(self, flashing_list: FlashingListType, flash_number: int) -> None:
+        if flashing_list and flash_number != self._confirmed_flash_number:
+            self._window.update_idletasks()  # draw the flash now to timestamp its actual onset
+            self._state_manager.confirm_flash(flash_number, time.monotonic())
+            self._confirmed_flash_number = flash_number
+
     def run(self) -> None:
         self._update_loop()
         self._window.mainloop()
@@ -231,6 +239,7 @@ class SpellerView:
         
         state = self._state_manager.get_state()
         self._update_keyboard(state.flashing_list)
+        self._confirm_flash(state.flashing_list, state.flash_number)
 
         self._update_input(state.full_text)
         self._update_suggestions(state.suggestions)
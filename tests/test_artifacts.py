@@ -0,0 +1,43 @@
+import mne
+import numpy as np
+
+from preprocessing.artifacts import ArtifactAnnotator
+from preprocessing.settings import PreprocessorSettings
+
+
+SFREQ = 250.
+
+
+def _get_raw(data: np.ndarray) -> mne.io.RawArray:
+    info = mne.create_info([f'EEG {i}' for i in range(1, len(data) + 1)], SFREQ, 'eeg')
+    return mne.io.RawArray(data, info, verbose=False)
+
+
+def _get_data(number_of_samples: int) -> np.ndarray:
+    return np.random.default_rng(0).normal(scale=5e-6, size=(2, number_of_samples))
+
+
+def test_annotations_follow_crop():
+    data = _get_data(int(20 * SFREQ))
+    data[0, int(12 * SFREQ): int(12.5 * SFREQ)] += 1e-3  # amplitude artifact 12 s into the record
+    raw = _get_raw(data)
+    raw.crop(tmin=5.)
+
+    ArtifactAnnotator(PreprocessorSettings()).annotate(raw, raw.get_data(picks='eeg'))
+
+    onsets = raw.annotations.onset[raw.annotations.description == 'bad_amplitude']
+    assert len(onsets) == 1
+    assert 11. < onsets[0] <= 12.
+
+    events = np.array([[int(12.2 * SFREQ), 0, 1], [int(16 * SFREQ), 0, 1]])  # samples of the uncropped record
+    epochs = mne.Epochs(raw, events, tmin=0., tmax=0.2, baseline=None, reject_by_annotation=True, preload=True, verbose=False)
+    assert list(epochs.events[:, 0]) == [int(16 * SFREQ)]
+
+
+def test_record_shorter_than_window():
+    raw = _get_raw(_get_data(10))
+
+    report = ArtifactAnnotator(PreprocessorSettings()).annotate(raw, raw.get_data(picks='eeg'))
+
+    assert len(raw.annotations) == 0
+    assert report['rejected_s'] == 0.
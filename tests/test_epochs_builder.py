@@ -0,0 +1,29 @@
+import numpy as np
+
+from preprocessing.features import FeatureExtractor
+from preprocessing.preprocessor import Preprocessor
+from preprocessing.settings import EpochCollectorSettings, ModelSettings, PreprocessorSettings
+from speller.classification.epoch_gate import EpochGate
+from speller.data_aquisition.epochs_builder import EpochsBuilder
+from speller.settings import EpochGateSettings, FilesSettings, StrategySettings
+
+
+def test_gate_limits_apply_to_epoch_samples(tmp_path):
+    files_settings = FilesSettings(records_dir=tmp_path / 'records', cache_dir=tmp_path / 'cache')
+    model_settings = ModelSettings(feature_start_ms=100, feature_end_ms=500, feature_window_samples=10)
+    strategy_settings = StrategySettings()
+    builder = EpochsBuilder(
+        Preprocessor(PreprocessorSettings(), files_settings),
+        FeatureExtractor(model_settings, EpochCollectorSettings()),
+        EpochGate(EpochGateSettings()),
+        strategy_settings,
+    )
+    samples = np.random.default_rng(0).normal(scale=2., size=(2000, 8)).astype(np.float32)  # filtered, in uV
+    samples[1020, 3] += 80.  # a single-sample spike, averaged out of the window means
+    starts = np.array([0, 500, 900, 1500])
+
+    features, weights = builder.build(samples, starts, padding=0, filtered=True)
+
+    assert len(features) == len(starts)
+    assert np.abs(features).max() * 1e6 < EpochGateSettings().max_gradient_uv
+    assert list(weights) == [1., 1., 0., 1.]
@@ -0,0 +1,12 @@
+from preprocessing.files import get_raw_files
+from speller.data_aquisition.synthetic_data_collector import SyntheticRecordsWriter
+from speller.settings import FilesSettings, StrategySettings, SyntheticDataCollectorSettings
+
+
+def test_empty_catalog_falls_back_to_scan(tmp_path):
+    files_settings = FilesSettings(records_dir=tmp_path / 'records', cache_dir=tmp_path / 'cache')
+    record = SyntheticRecordsWriter(SyntheticDataCollectorSettings(seed=1), StrategySettings(), files_settings).write('s', 1, 1, 10)[0]
+    (files_settings.records_dir / files_settings.catalog_filename).unlink()
+
+    assert get_raw_files(files_settings, 's', 1, 1) == [str(record)]
+    assert get_raw_files(files_settings, 'other', None) == []
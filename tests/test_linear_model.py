@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.preprocessing import StandardScaler
+from sklearn.svm import SVC
+
+from preprocessing.model import ClassifierModel
+
+
+def _get_data() -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 200)
+    X = rng.normal(size=(200, 10)) * rng.uniform(0.5, 5., 10) + rng.normal(size=10) + 0.8 * y[:, np.newaxis]
+    return X, y
+
+
+def _fit(clf: SVC | CalibratedClassifierCV, target_prior: float = 0.5) -> tuple[ClassifierModel, np.ndarray]:
+    X, y = _get_data()
+    scaler = StandardScaler().fit(X)
+    clf.fit(scaler.transform(X), y)
+    return ClassifierModel(clf, scaler, target_prior, 1e-3, {}), X
+
+
+def test_compiled_uncalibrated_matches():
+    clf_model, X = _fit(SVC(kernel='linear'))
+
+    np.testing.assert_allclose(clf_model.compile().predict(X), clf_model.predict(X), rtol=1e-9, atol=1e-12)
+
+
+def test_compiled_calibrated_matches_with_clipping():
+    clf_model, X = _fit(CalibratedClassifierCV(SVC(kernel='linear'), method='sigmoid', cv=3, ensemble=False), target_prior=0.3)
+    linear_model = clf_model.compile()
+    epochs = np.concatenate([X, 50 * X[:20]])  # far from the boundary, the probabilities are clipped
+
+    expected = np.asarray(clf_model.predict(epochs))
+    actual = np.asarray(linear_model.predict(epochs))
+
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-9)
+    assert np.isclose(actual, linear_model.score_min).any() and np.isclose(actual, linear_model.score_max).any()
+    np.testing.assert_allclose([expected.min(), expected.max()], [linear_model.score_min, linear_model.score_max])
+
+
+def test_compile_rejects_non_linear_kernel():
+    clf_model, _ = _fit(SVC(kernel='rbf'))
+
+    with pytest.raises(ValueError):
+        clf_model.compile()
+
+
+def test_compile_rejects_isotonic_calibration():
+    clf_model, _ = _fit(CalibratedClassifierCV(SVC(kernel='linear'), method='isotonic', cv=3, ensemble=False))
+
+    with pytest.raises(ValueError):
+        clf_model.compile()
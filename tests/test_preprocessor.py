@@ -0,0 +1,25 @@
+import mne
+import numpy as np
+
+from preprocessing.epoch_collector import EpochCollector
+from preprocessing.preprocessor import Preprocessor
+from preprocessing.settings import EpochCollectorSettings, PreprocessorSettings
+from speller.data_aquisition.synthetic_data_collector import SyntheticRecordsWriter
+from speller.settings import FilesSettings, StrategySettings, SyntheticDataCollectorSettings
+
+
+def test_cache_hit_keeps_cropped_annotations(tmp_path):
+    files_settings = FilesSettings(records_dir=tmp_path / 'records', cache_dir=tmp_path / 'cache')
+    record = SyntheticRecordsWriter(SyntheticDataCollectorSettings(seed=1), StrategySettings(), files_settings).write('s', 1, 1, 10)[0]
+    preprocessor = Preprocessor(PreprocessorSettings(crop_time_s=5., artifact_max_peak_to_peak_uv=40.), files_settings)
+    epoch_collector = EpochCollector(EpochCollectorSettings(equalize_events=False), files_settings)
+
+    missed = preprocessor.preprocess(str(record), silent=True, save=False)
+    hit = preprocessor.preprocess(str(record), silent=True, save=False)
+
+    assert preprocessor._cache.hits == 1
+    assert hit.first_samp == missed.first_samp > 0
+    assert len(hit.annotations) > 0
+    np.testing.assert_allclose(hit.annotations.onset, missed.annotations.onset)
+    mne.set_log_level('ERROR')
+    np.testing.assert_array_equal(epoch_collector.collect(hit).events, epoch_collector.collect(missed).events)
@@ -0,0 +1,35 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pytest
+
+from preprocessing.features import FeatureExtractor
+from preprocessing.linear_model import LinearModel
+from preprocessing.model_registry import ModelRegistry
+from preprocessing.settings import FEATURE_SETTINGS_FIELDS, EpochCollectorSettings, ModelSettings, PreprocessorSettings
+from speller.classification.processing_worker import ProcessingWorker
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT
+from speller.settings import EpochGateSettings, FilesSettings, StrategySettings, WorkerSettings
+
+
+def test_stop_ends_process_and_unlinks_shared_memory(tmp_path):
+    files_settings = FilesSettings(models_dir=tmp_path / 'models', records_dir=tmp_path / 'records', cache_max_size_mb=0)
+    model_settings, strategy_settings = ModelSettings(), StrategySettings()
+    features_count = FeatureExtractor(model_settings, EpochCollectorSettings()).get_features_count(EEG_CHANNELS_COUNT, strategy_settings.epoch_size_samples)
+    ModelRegistry(files_settings).register(LinearModel(np.zeros(features_count), 0.), None, None, {
+        'features': model_settings.model_dump(include=FEATURE_SETTINGS_FIELDS),
+        'settings': {'preprocessor': PreprocessorSettings().model_dump()},
+    })
+
+    worker = ProcessingWorker(
+        WorkerSettings(timeout_s=30.), PreprocessorSettings(), EpochCollectorSettings(), model_settings, strategy_settings, files_settings, EpochGateSettings(),
+    )
+    assert worker.classify(np.ones((3, features_count))) == [0., 0., 0.]
+    names = [shared.name for shared in (worker._samples, worker._epochs, worker._inputs, worker._scores)]
+
+    worker.stop()
+
+    assert not worker._process.is_alive()
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=name)
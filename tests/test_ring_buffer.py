@@ -0,0 +1,45 @@
+from threading import Event, Thread
+
+import numpy as np
+import pytest
+
+from speller.data_aquisition.data_collector import EEG_CHANNELS_COUNT
+from speller.data_aquisition.ring_buffer import SamplesOverwrittenError, SamplesRingBuffer
+
+
+class _PausedSamples:
+    # buffer storage that holds the writer inside its copy until resumed
+    def __init__(self, samples: np.ndarray):
+        self.samples = samples
+        self.paused = Event()
+        self.resume = Event()
+
+    def __getitem__(self, key):
+        return self.samples[key]
+
+    def __setitem__(self, key, value):
+        self.samples[key] = value
+        self.paused.set()
+        assert self.resume.wait(5)
+
+
+def get_block(start: int, stop: int) -> np.ndarray:
+    return np.repeat(np.arange(start, stop, dtype=np.float64)[:, None], EEG_CHANNELS_COUNT, axis=1)
+
+
+def test_read_detects_block_being_written():
+    buffer = SamplesRingBuffer(10)
+    buffer.write(get_block(0, 10), 0.)
+    buffer._samples = _PausedSamples(buffer._samples)
+
+    writer = Thread(target=buffer.write, args=(get_block(10, 15), 1.))
+    writer.start()
+    assert buffer._samples.paused.wait(5)
+
+    with pytest.raises(SamplesOverwrittenError):
+        buffer.read(0, 5)  # slots of the samples 0..4 are being overwritten, written still says 10
+    np.testing.assert_array_equal(buffer.read(5, 10)[:, 0], np.arange(5, 10))
+
+    buffer._samples.resume.set()
+    writer.join()
+    np.testing.assert_array_equal(buffer.read(5, 15)[:, 0], np.arange(5, 15))